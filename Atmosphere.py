@@ -0,0 +1,121 @@
+"""Atmospheric extinction and telluric absorption
+
+The curves are read from data files and kept as the natural log of
+the transmission at one airmass, so the transmission at any airmass
+is one vectorized exponent. Curves on a wavelength grid are cached
+per airmass for repeated and batch calculations.
+"""
+import os
+
+import numpy as np
+
+import DataCache
+import Resample
+
+ATMOSPHERE_DIR = os.path.join('data', 'atmosphere')
+EXTINCTION_FILE = os.path.join(ATMOSPHERE_DIR, 'maunakea_extinction.dat')
+CURVE_ENTRIES = 128
+MIN_TRANSMISSION = 1e-30 # floor before taking the log of a telluric curve
+
+_CURVES = DataCache.LRUCache(maxsize=CURVE_ENTRIES)
+
+def files_key(extinction_file, telluric_file=None):
+    '''
+    files_key(extinction_file, telluric_file=None)
+
+    Identifies the curves, including the file modification times.
+    '''
+    key = DataCache.file_key('atmosphere', extinction_file)[1:]
+    if telluric_file is not None:
+        key += DataCache.file_key('atmosphere', telluric_file)[1:]
+    return key
+
+def curves():
+    '''
+    curves()
+
+    Returns the cache of transmission curves.
+    '''
+    return _CURVES
+
+def clear_cache():
+    '''
+    clear_cache()
+
+    Empties the cache of transmission curves.
+    '''
+    _CURVES.clear()
+
+class Atmosphere:
+    '''
+    Atmosphere(extinction_file=EXTINCTION_FILE, telluric_file=None)
+
+    The extinction file has wavelengths in Angstroms and extinction
+    in magnitudes per airmass, the telluric file wavelengths and the
+    transmission at one airmass, which is raised to the power of the
+    airmass.
+    '''
+    def __init__(self, extinction_file=EXTINCTION_FILE, telluric_file=None):
+        self.extinction_file = extinction_file
+        self.telluric_file = telluric_file
+        # (wavelengths, log transmission at one airmass) of each curve
+        self.components = []
+        wave, mag = DataCache.read_atmosphere(extinction_file)
+        self.components.append((wave, DataCache.readonly(-0.4*np.log(10)*np.asarray(mag))))
+        if telluric_file is not None:
+            wave, trans = DataCache.read_atmosphere(telluric_file)
+            log_trans = np.log(np.maximum(np.asarray(trans), MIN_TRANSMISSION))
+            self.components.append((wave, DataCache.readonly(log_trans)))
+
+    def __repr__(self):
+        return f'<Atmosphere {self.extinction_file} {self.telluric_file}>'
+
+    def key(self):
+        '''
+        key(self)
+        '''
+        return files_key(self.extinction_file, self.telluric_file)
+
+    def transmission(self, waves, airmasses, rows=None):
+        '''
+        transmission(self, waves, airmasses, rows=None)
+
+        Transmission at each airmass, (len(airmasses), nwave). waves is
+        one grid for all of them, or a (M, nwave) stack of grids with
+        rows giving the grid of each airmass. The transmission is
+        interpolated linearly, but only evaluated at the two points of
+        the curve around each wavelength, so the arrays are the size of
+        the result however finely the curves are sampled.
+        '''
+        waves = np.asarray(waves, dtype=float)
+        airmasses = np.atleast_1d(np.asarray(airmasses, dtype=float))[:, np.newaxis]
+        result = np.ones((len(airmasses), waves.shape[-1]))
+        for wave, log_trans in self.components:
+            idx, frac = Resample.interp_weights(waves, wave)
+            if waves.ndim > 1 and rows is not None:
+                idx = idx[rows]
+                frac = frac[rows]
+            result *= (np.exp(airmasses*log_trans[idx])*(1 - frac) +
+                       np.exp(airmasses*log_trans[idx + 1])*frac)
+        return result
+
+    def curve(self, waves, airmass):
+        '''
+        curve(self, waves, airmass)
+
+        Cached, read-only transmission on waves at one airmass.
+        '''
+        waves = np.asarray(waves, dtype=float)
+        def build():
+            trans = self.transmission(waves.ravel(), [airmass])[0]
+            return DataCache.readonly(trans.reshape(waves.shape))
+        return _CURVES.get(self.key() + (Resample.grid_key(waves), float(airmass)), build)
+
+def atmosphere(extinction_file=EXTINCTION_FILE, telluric_file=None):
+    '''
+    atmosphere(extinction_file=EXTINCTION_FILE, telluric_file=None)
+
+    Atmosphere for the files, read once.
+    '''
+    key = ('atmosphere_model',) + files_key(extinction_file, telluric_file)
+    return DataCache.cache().get(key, lambda: Atmosphere(extinction_file, telluric_file))
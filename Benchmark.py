@@ -0,0 +1,338 @@
+"""Benchmarks of the calculator hot paths"""
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+import Atmosphere
+import DataCache
+import ExpCalc
+import Instrument
+import Mag
+import Moffat
+import Photometry
+import Pipeline
+import Resample
+import Sky
+import SlitLoss
+import Telescope
+import Templates
+
+CONFIGS = {'lris2_blue': 'B600', 'lris2_red': 'R400', 'lris_blue': '600_4000_D560',
+           'lris_red': '400_8500_D560', 'deimos': '600'}
+BATCH_SIZE = 1000
+THRESHOLD = 1.2
+
+class Skip(Exception):
+    '''
+    Raised by a benchmark setup that cannot run here.
+    '''
+
+def make_instrument(mode):
+    '''
+    make_instrument(mode)
+
+    Builds the instrument, skipping it if its throughput is missing.
+    '''
+    keck = Telescope.Telescope('keck1')
+    inst = Instrument.Instrument()
+    getattr(inst, mode)(keck, grating=CONFIGS[mode])
+    try:
+        inst.read_throughput()
+    except (OSError, ValueError) as err:
+        raise Skip(str(err)) from err
+    return inst, keck
+
+def clear_caches():
+    '''
+    clear_caches()
+
+    Empties the data cache, the memoized Pipeline stages and the
+    caches derived from them, so the next calculation starts cold.
+    '''
+    DataCache.clear()
+    Pipeline.memo().clear()
+    for module in (Atmosphere, Moffat, Photometry, Resample, SlitLoss, Templates):
+        module.clear_cache()
+
+def bench_compute_spectrum_cold(mode):
+    '''
+    bench_compute_spectrum_cold(mode)
+
+    The whole calculation, every stage recomputed.
+    '''
+    inst, keck = make_instrument(mode)
+    def run():
+        clear_caches()
+        exp_calc = ExpCalc.ExpCalc(22, 'sdss_rprime.dat', 1.0, 1.2, 0.1, 'starb1', inst, keck)
+        exp_calc.compute_spectrum(1200, 8, 0.7)
+    return run, 1
+
+def bench_compute_spectrum_warm(mode):
+    '''
+    bench_compute_spectrum_warm(mode)
+
+    A repeated calculation, every stage is a memo hit.
+    '''
+    inst, keck = make_instrument(mode)
+    def run():
+        exp_calc = ExpCalc.ExpCalc(22, 'sdss_rprime.dat', 1.0, 1.2, 0.1, 'starb1', inst, keck)
+        exp_calc.compute_spectrum(1200, 8, 0.7)
+    return run, 1
+
+def bench_snr_batch(mode):
+    '''
+    bench_snr_batch(mode)
+    '''
+    inst, keck = make_instrument(mode)
+    rng = np.random.default_rng(0)
+    mags = rng.uniform(18, 24, BATCH_SIZE)
+    seeings = rng.choice([0.6, 0.8, 1.0, 1.2], BATCH_SIZE)
+    airmasses = rng.uniform(1, 2, BATCH_SIZE)
+    def run():
+        ExpCalc.compute_snr_batch(mags, seeings, airmasses, 0.1, 1200, 'sdss_rprime.dat',
+                                  'starb1', 8, 0.7, inst, keck)
+    return run, BATCH_SIZE
+
+def bench_moffat_frac():
+    '''
+    bench_moffat_frac()
+    '''
+    return lambda: Moffat.moffat_frac(1.0, 0.7, 8, pix_size=0.151), 1
+
+def bench_moffat_frac_batch():
+    '''
+    bench_moffat_frac_batch()
+    '''
+    seeings = np.linspace(0.4, 2.5, BATCH_SIZE)
+    return lambda: Moffat.moffat_frac(seeings, 0.7, 8, pix_size=0.151), BATCH_SIZE
+
+def bench_slit_frac_batch():
+    '''
+    bench_slit_frac_batch()
+    '''
+    seeings = np.linspace(0.4, 2.5, BATCH_SIZE)
+    SlitLoss.slit_frac(1.0, 0.7, 8, pix_size=0.151)
+    return lambda: SlitLoss.slit_frac(seeings, 0.7, 8, pix_size=0.151), BATCH_SIZE
+
+def bench_compute_abmag():
+    '''
+    bench_compute_abmag()
+    '''
+    mag = Mag.Mag('sdss_rprime.dat')
+    waves, flux = DataCache.read_template(ExpCalc.find_template('starb1'))
+    return lambda: mag.compute_ABmag(waves, flux), 1
+
+def bench_sky_cold():
+    '''
+    bench_sky_cold()
+    '''
+    def run():
+        DataCache.clear()
+        Sky.Sky()
+    return run, 1
+
+def bench_sky_warm():
+    '''
+    bench_sky_warm()
+    '''
+    Sky.Sky()
+    return Sky.Sky, 1
+
+def bench_throughput_cold(mode):
+    '''
+    bench_throughput_cold(mode)
+    '''
+    inst, _ = make_instrument(mode)
+    def run():
+        DataCache.clear()
+        inst.read_throughput()
+    return run, 1
+
+def bench_throughput_warm(mode):
+    '''
+    bench_throughput_warm(mode)
+    '''
+    inst, _ = make_instrument(mode)
+    return inst.read_throughput, 1
+
+def benchmarks():
+    '''
+    benchmarks()
+
+    Returns a dict of name to setup function. Each setup returns
+    the callable to time and the number of items it processes.
+    '''
+    benches = {'moffat_frac': bench_moffat_frac,
+               'moffat_frac_batch': bench_moffat_frac_batch,
+               'slit_frac_batch': bench_slit_frac_batch,
+               'compute_abmag': bench_compute_abmag,
+               'sky_load_cold': bench_sky_cold,
+               'sky_load_warm': bench_sky_warm}
+    for mode in CONFIGS:
+        benches[f'compute_spectrum_cold[{mode}]'] = \
+            lambda mode=mode: bench_compute_spectrum_cold(mode)
+        benches[f'compute_spectrum_warm[{mode}]'] = \
+            lambda mode=mode: bench_compute_spectrum_warm(mode)
+        benches[f'snr_batch[{mode}]'] = lambda mode=mode: bench_snr_batch(mode)
+        benches[f'read_throughput_cold[{mode}]'] = \
+            lambda mode=mode: bench_throughput_cold(mode)
+        benches[f'read_throughput_warm[{mode}]'] = \
+            lambda mode=mode: bench_throughput_warm(mode)
+    return benches
+
+def time_call(func, repeat=5, min_time=0.2):
+    '''
+    time_call(func, repeat=5, min_time=0.2)
+
+    Times func like timeit, the number of calls per repeat is
+    increased until one repeat takes at least min_time.
+    Returns the per call times of each repeat.
+    '''
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1000000:
+            break
+        number *= 10
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+def peak_memory(func):
+    '''
+    peak_memory(func)
+
+    Peak traced allocation, in bytes, of one call of func.
+    '''
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def machine():
+    '''
+    machine()
+
+    Name of this machine, the key of its results in a baseline file.
+    '''
+    return platform.node()
+
+def run_benchmarks(select=None, repeat=5, min_time=0.2, memory=True):
+    '''
+    run_benchmarks(select=None, repeat=5, min_time=0.2, memory=True)
+
+    Runs the benchmarks whose names contain one of the strings in
+    select (all of them by default).
+    '''
+    results = {}
+    for name, setup in benchmarks().items():
+        if select and not any(sel in name for sel in select):
+            continue
+        try:
+            func, items = setup()
+        except Skip as err:
+            results[name] = {'skipped': str(err)}
+            continue
+        times = time_call(func, repeat=repeat, min_time=min_time)
+        result = {'min': min(times), 'median': float(np.median(times)), 'items': items,
+                  'items_per_s': items / float(np.median(times))}
+        if memory:
+            result['peak_bytes'] = peak_memory(func)
+        results[name] = result
+    return {'machine': machine(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results}
+
+def save_results(results, fn):
+    '''
+    save_results(results, fn)
+    '''
+    with open(fn, 'w', encoding='utf-8') as stream:
+        json.dump(results, stream, indent=2)
+
+def load_results(fn):
+    '''
+    load_results(fn)
+    '''
+    with open(fn, encoding='utf-8') as stream:
+        return json.load(stream)
+
+def load_baseline(fn, host=None):
+    '''
+    load_baseline(fn, host=None)
+
+    The results stored in the baseline file fn for host, this machine
+    by default, or None if there are none. Timings are only compared
+    with those measured on the same machine.
+    '''
+    if not os.path.exists(fn):
+        return None
+    return load_results(fn)['machines'].get(host or machine())
+
+def save_baseline(results, fn):
+    '''
+    save_baseline(results, fn)
+
+    Stores results as the baseline of the machine they were measured
+    on, keeping those of the other machines in fn.
+    '''
+    baselines = {'machines': {}}
+    if os.path.exists(fn):
+        baselines = load_results(fn)
+    baselines['machines'][results['machine']] = results
+    save_results(baselines, fn)
+
+def compare(results, baseline, threshold=THRESHOLD):
+    '''
+    compare(results, baseline, threshold=THRESHOLD)
+
+    Returns report lines and the names of the benchmarks that are
+    more than threshold times slower than the baseline. Benchmarks
+    skipped here or in the baseline are listed, with the instrument
+    configurations that could not be run at all.
+    '''
+    lines = [f"{'benchmark':40s} {'median':>12s} {'baseline':>12s} {'ratio':>7s} {'peak KiB':>9s}"]
+    regressions = []
+    skipped = []
+    for name, result in results['results'].items():
+        if 'skipped' in result:
+            lines.append(f"{name:40s} skipped: {result['skipped']}")
+            skipped.append(name)
+            continue
+        base = baseline['results'].get(name, {}) if baseline else {}
+        peak = f"{result['peak_bytes']/1024:9.0f}" if 'peak_bytes' in result else ''
+        if 'median' not in base:
+            note = ' skipped in the baseline' if 'skipped' in base else ''
+            lines.append(f"{name:40s} {result['median']*1e3:10.3f}ms {'':>12s} {'':>7s} "
+                         f"{peak}{note}")
+            continue
+        ratio = result['median'] / base['median']
+        flag = ''
+        if ratio > threshold:
+            flag = ' SLOWER'
+            regressions.append(name)
+        elif ratio < 1/threshold:
+            flag = ' faster'
+        lines.append(f"{name:40s} {result['median']*1e3:10.3f}ms {base['median']*1e3:10.3f}ms "
+                     f"{ratio:7.2f} {peak}{flag}")
+    configs = [mode for mode in CONFIGS
+               if any(name.endswith(f'[{mode}]') for name in skipped)]
+    if skipped:
+        lines.append(f"{len(skipped)} skipped, configurations not run: "
+                     f"{', '.join(configs) or 'none'}")
+    return lines, regressions
@@ -0,0 +1,162 @@
+"""Preprocessed binary bundle of the reference data
+
+The bundle is a directory of .npy files with an index.json describing
+which source file each came from. The arrays are memory mapped, so
+processes reading the same bundle share the pages and nothing is
+parsed. A bundle entry is only used while its source file has the
+size and modification time recorded in the index.
+"""
+import json
+import os
+import types
+
+import numpy as np
+
+BUNDLE_DIR = os.path.join('data', 'bundle')
+INDEX_FILE = 'index.json'
+VERSION = 3 # 2: templates stored as 1-D arrays, 3: derived tables
+# kind, directory, file name pattern of the reference data
+SOURCES = (('sky', os.path.join('data', 'sky'), '.fits'),
+           ('template', os.path.join('data', 'templates'), '.fits'),
+           ('filter', os.path.join('data', 'filters'), '.dat'),
+           ('atmosphere', os.path.join('data', 'atmosphere'), '.dat'),
+           ('lris2_throughput', os.path.join('data', 'throughput'), '_tot_eff.csv'),
+           ('xidl_throughput', os.path.join('data', 'throughput'), '.fits.gz'))
+
+_INDEXES = {}
+
+def entry_name(kind, fn, bundle_dir=BUNDLE_DIR):
+    '''
+    entry_name(kind, fn, bundle_dir=BUNDLE_DIR)
+
+    Files are named relative to the bundle so the tree can be moved.
+    '''
+    rel = os.path.relpath(os.path.abspath(fn), os.path.abspath(bundle_dir))
+    return f'{kind}:{rel}'
+
+def _save(bundle_dir, name, value):
+    if isinstance(value, tuple):
+        return {'layout': 'tuple',
+                'fields': [_save(bundle_dir, f'{name}.{i}', item) for i, item in enumerate(value)]}
+    if isinstance(value, (dict, types.MappingProxyType)):
+        return {'layout': 'mapping',
+                'fields': {key: _save(bundle_dir, f'{name}.{key}', item)
+                           for key, item in value.items()}}
+    fn = name + '.npy'
+    np.save(os.path.join(bundle_dir, fn), np.asarray(value))
+    return {'layout': 'array', 'file': fn}
+
+def stamp(fn, bundle_dir=BUNDLE_DIR):
+    '''
+    stamp(fn, bundle_dir=BUNDLE_DIR)
+
+    Name, size and modification time of a source file.
+    '''
+    stat = os.stat(fn)
+    return [entry_name('source', fn, bundle_dir), stat.st_size, stat.st_mtime_ns]
+
+def build(readers, bundle_dir=BUNDLE_DIR, sources=SOURCES, tables=()):
+    '''
+    build(readers, bundle_dir=BUNDLE_DIR, sources=SOURCES, tables=())
+
+    Reads every file of the sources with readers[kind] and writes the
+    results to bundle_dir. Files a reader cannot read are left out.
+    tables are (name, source files, builder) of values derived from
+    several files, builder() is stored under name together with the
+    stamps of the files. Returns the index.
+    '''
+    os.makedirs(bundle_dir, exist_ok=True)
+    index = {'version': VERSION, 'entries': {}, 'tables': {}}
+    for kind, dirn, pattern in sources:
+        if not os.path.isdir(dirn):
+            continue
+        for filename in sorted(os.listdir(dirn)):
+            if not filename.endswith(pattern):
+                continue
+            fn = os.path.join(dirn, filename)
+            try:
+                value = readers[kind](fn)
+            except Exception as err: # pylint: disable=broad-except
+                print(f'Skipping {fn}: {err}')
+                continue
+            stat = os.stat(fn)
+            index['entries'][entry_name(kind, fn, bundle_dir)] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'value': _save(bundle_dir, f'{kind}__{filename}', value)}
+    for i, (name, fns, builder) in enumerate(tables):
+        index['tables'][name] = {'sources': [stamp(fn, bundle_dir) for fn in fns],
+                                 'value': _save(bundle_dir, f'table__{i:05d}', builder())}
+    # written last so a partial build is never used
+    tmp = os.path.join(bundle_dir, INDEX_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as stream:
+        json.dump(index, stream, indent=1)
+    os.replace(tmp, os.path.join(bundle_dir, INDEX_FILE))
+    _INDEXES.clear()
+    return index
+
+def load_index(bundle_dir=BUNDLE_DIR):
+    '''
+    load_index(bundle_dir=BUNDLE_DIR)
+
+    Returns the index of the bundle, or None if there is no bundle
+    of this version.
+    '''
+    fn = os.path.join(bundle_dir, INDEX_FILE)
+    try:
+        mtime = os.stat(fn).st_mtime_ns
+    except OSError:
+        return None
+    key = (os.path.abspath(fn), mtime)
+    if key not in _INDEXES:
+        with open(fn, encoding='utf-8') as stream:
+            index = json.load(stream)
+        _INDEXES[key] = index if index.get('version') == VERSION else None
+    return _INDEXES[key]
+
+def _load(bundle_dir, desc):
+    if desc['layout'] == 'tuple':
+        return tuple(_load(bundle_dir, item) for item in desc['fields'])
+    if desc['layout'] == 'mapping':
+        return types.MappingProxyType({key: _load(bundle_dir, item)
+                                       for key, item in desc['fields'].items()})
+    return np.load(os.path.join(bundle_dir, desc['file']), mmap_mode='r')
+
+def lookup(kind, fn, bundle_dir=BUNDLE_DIR):
+    '''
+    lookup(kind, fn, bundle_dir=BUNDLE_DIR)
+
+    Returns the bundled value for fn, memory mapped, or None if it
+    is not in the bundle or the file changed since it was built.
+    '''
+    index = load_index(bundle_dir)
+    if index is None:
+        return None
+    entry = index['entries'].get(entry_name(kind, fn, bundle_dir))
+    if entry is None:
+        return None
+    stat = os.stat(fn)
+    if stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+        return None
+    return _load(bundle_dir, entry['value'])
+
+def lookup_table(name, fns, bundle_dir=BUNDLE_DIR):
+    '''
+    lookup_table(name, fns, bundle_dir=BUNDLE_DIR)
+
+    Returns the bundled table name, memory mapped, or None if it is
+    not in the bundle or one of the files fns it was derived from
+    changed since it was built.
+    '''
+    index = load_index(bundle_dir)
+    if index is None:
+        return None
+    entry = index['tables'].get(name)
+    if entry is None:
+        return None
+    try:
+        stamps = [stamp(fn, bundle_dir) for fn in fns]
+    except OSError:
+        return None
+    if stamps != entry['sources']:
+        return None
+    return _load(bundle_dir, entry['value'])
@@ -0,0 +1,251 @@
+"""Shared, thread-safe cache for the reference data used by the calculator"""
+import collections
+import os
+import threading
+import types
+
+import numpy as np
+
+import Bundle
+
+MAX_ENTRIES = 64
+USE_BUNDLE = True # read from the Bundle when it is up to date
+
+class LRUCache:
+    '''
+    LRUCache(maxsize=MAX_ENTRIES)
+
+    A small least-recently-used cache guarded by a lock so that it
+    can be shared between threads.
+    '''
+    def __init__(self, maxsize=MAX_ENTRIES):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f'<LRUCache {len(self.entries)}/{self.maxsize} hits={self.hits} misses={self.misses}>'
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key, loader):
+        '''
+        get(self, key, loader)
+
+        Returns the cached value for key, calling loader() to
+        build it if it is not present. The loader runs without the
+        lock held, so two threads missing at once may both build it.
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        '''
+        put(self, key, value)
+        '''
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        clear(self)
+        '''
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_CACHE = LRUCache()
+
+def cache():
+    '''
+    cache()
+
+    Returns the process wide cache.
+    '''
+    return _CACHE
+
+def clear():
+    '''
+    clear()
+    '''
+    _CACHE.clear()
+
+def readonly(arr, dtype=None):
+    '''
+    readonly(arr, dtype=None)
+
+    Returns a contiguous copy of arr that cannot be written to.
+    '''
+    arr = np.array(arr, dtype=dtype)
+    arr.flags.writeable = False
+    return arr
+
+def file_key(kind, fn):
+    '''
+    file_key(kind, fn)
+
+    Builds the cache key for a file, the modification time is
+    part of the key so an edited file is read again.
+    '''
+    path = os.path.abspath(fn)
+    return (kind, path, os.stat(path).st_mtime_ns)
+
+def list_dir(dirn):
+    '''
+    list_dir(dirn)
+
+    Sorted, cached listing of dirn.
+    '''
+    key = ('listdir',) + file_key('dir', dirn)[1:]
+    return _CACHE.get(key, lambda: tuple(sorted(os.listdir(dirn))))
+
+def find_file(dirn, name):
+    '''
+    find_file(dirn, name)
+
+    Finds the first file in dirn whose name contains name,
+    the directory listing is cached as well.
+    '''
+    for filename in list_dir(dirn):
+        if name in filename:
+            return os.path.join(dirn, filename)
+    return None
+
+def load(kind, fn, reader):
+    '''
+    load(kind, fn, reader)
+
+    Reads fn with reader unless it is already cached. When the
+    file is in an up to date Bundle it is memory mapped from there
+    instead of being parsed.
+    '''
+    def loader():
+        value = None
+        if USE_BUNDLE:
+            value = Bundle.lookup(kind, fn)
+        if value is None:
+            value = reader(fn)
+        return value
+    return _CACHE.get(file_key(kind, fn), loader)
+
+def _read_sky(fn):
+    import astropy.io.fits
+
+    with astropy.io.fits.open(fn) as spec_hdu:
+        hdr = spec_hdu[0].header
+        spec = readonly(spec_hdu[0].data)
+    pix = readonly(np.arange(0, len(spec)))
+    wave = readonly(hdr['CRVAL1'] + pix*hdr['CDELT1'])
+    return pix, wave, spec
+
+def read_sky(fn):
+    '''
+    read_sky(fn)
+
+    Returns pix, wave and spec for a linearly sampled sky spectrum.
+    '''
+    return load('sky', fn, _read_sky)
+
+def _read_template(fn):
+    import astropy.io.fits
+
+    with astropy.io.fits.open(fn) as hdus:
+        dat = hdus[1].data
+        # some templates, e.g. qso, store the columns as (1, nwave)
+        waves = readonly(np.ravel(dat['WAVELENGTH']))
+        flux = readonly(np.ravel(dat['FLUX']))
+    return waves, flux
+
+def read_template(fn):
+    '''
+    read_template(fn)
+
+    Returns the rest frame wavelengths and flux of a template.
+    '''
+    return load('template', fn, _read_template)
+
+def _read_filter(fn):
+    import astropy.io.ascii
+
+    data = astropy.io.ascii.read(fn)
+    return readonly(data['col1'], dtype=float), readonly(data['col2'], dtype=float)
+
+def read_filter(fn):
+    '''
+    read_filter(fn)
+
+    Returns the wavelengths and weights of a filter curve.
+    '''
+    return load('filter', fn, _read_filter)
+
+def read_atmosphere(fn):
+    '''
+    read_atmosphere(fn)
+
+    Returns the wavelengths and values of an extinction or telluric
+    curve.
+    '''
+    return load('atmosphere', fn, _read_filter)
+
+def _read_lris2_throughput(fn):
+    import astropy.io.ascii
+
+    data = astropy.io.ascii.read(fn)
+    # we work in Angstroms but these tables are in nm
+    throughput = {'wavelength': readonly(10*np.asarray(data['wavelength'], dtype=float)),
+                  'throughput': readonly(data['throughput'], dtype=float)}
+    return types.MappingProxyType(throughput)
+
+def read_lris2_throughput(fn):
+    '''
+    read_lris2_throughput(fn)
+    '''
+    return load('lris2_throughput', fn, _read_lris2_throughput)
+
+def _read_xidl_throughput(fn):
+    import astropy.io.fits
+
+    with astropy.io.fits.open(fn) as hdus:
+        throughput = {'wavelength': readonly(hdus[2].data['WAV'][0], dtype=float),
+                      'throughput': readonly(hdus[2].data['EFF'][0], dtype=float)}
+    return types.MappingProxyType(throughput)
+
+def read_xidl_throughput(fn):
+    '''
+    read_xidl_throughput(fn)
+    '''
+    return load('xidl_throughput', fn, _read_xidl_throughput)
+
+READERS = {'sky': _read_sky, 'template': _read_template, 'filter': _read_filter,
+           'atmosphere': _read_filter,
+           'lris2_throughput': _read_lris2_throughput,
+           'xidl_throughput': _read_xidl_throughput}
+
+def build_bundle(bundle_dir=Bundle.BUNDLE_DIR):
+    '''
+    build_bundle(bundle_dir=Bundle.BUNDLE_DIR)
+
+    Compiles the reference data, and the tables derived from it, into
+    a Bundle.
+    '''
+    import Templates # pylint: disable=import-outside-toplevel
+    return Bundle.build(READERS, bundle_dir, tables=Templates.bundle_tables())
@@ -1,13 +1,37 @@
+import collections
+import concurrent.futures
 import os
 import numpy as np
-import astropy.constants
-import astropy.io.fits as fits
-import matplotlib.pyplot as plt
 
+import Atmosphere
+import DataCache
+import LineSpread
 import Sky
 import Mag
-import Transmission
-import Moffat
+import Pipeline
+import Resample
+import SlitLoss
+import Templates
+import Timing
+
+TEMPLATE_DIR = Pipeline.TEMPLATE_DIR
+GROUP_SIZE = 16 # targets per redshift above which they are resampled as a group
+WORKERS = 4 # threads of calculate_many
+
+# everything one calculation depends on, see calculate(). inst and
+# telescope are only read, so one of each can be shared by any number
+# of requests, the flags are those of the ExpCalc attributes
+Request = collections.namedtuple('Request', ['app_mag', 'mfilter', 'seeing', 'airmass',
+                                             'redshift', 'template_filename', 'inst',
+                                             'telescope', 'time', 'slit_length', 'slit_width',
+                                             'lsf', 'abmag_table', 'telluric', 'optimal',
+                                             'chromatic_seeing', 'detector', 'sky_file'],
+                                 defaults=[False, False, None, False, False, False,
+                                           Sky.SKY_FILE])
+# the results of calculate(), the ExpCalc attributes of the same names,
+# throughput is its throughput_interp
+Spectrum = collections.namedtuple('Spectrum', ['waves', 'flux', 'sky_flux', 'noise', 'snr',
+                                               'in_band', 'throughput', 'abs_mag'])
 
 class ExpCalc():
     """
@@ -16,7 +40,7 @@ class ExpCalc():
     def __init__(self, app_mag, mfilter, seeing, airmass, redshift, template_filename, inst=None, telescope=None):
         self.telescope = telescope
         self.instrument = inst
-        self.sky = Sky.Sky()
+        self.sky_file = Sky.SKY_FILE # the sky is read once by DataCache, not per ExpCalc
         self.airmass = airmass
         self.seeing = seeing
         self.filter = mfilter
@@ -24,9 +48,7 @@ class ExpCalc():
         self.template_filename = template_filename
         self.app_mag = app_mag
 
-        self.mag = None
         self.abs_mag = None
-        self.transmission = Transmission.Transmission()
         self.flux = None
         self.waves = None
         self.good_waves = None
@@ -36,13 +58,20 @@ class ExpCalc():
         self.sky_flux = None
         self.in_band = None
         self.flux_plots = False
+        self.detector = False # results on the detector pixels instead of the template grid
+        self.lsf = False # convolve the source and sky to the instrument resolution
+        self.abmag_table = False # normalize by interpolating in Templates.abmag_table
+        self.telluric = None # file of telluric absorption, see Atmosphere
+        self.optimal = False # SNR of an optimal extraction instead of a sum over the slit
+        self.chromatic_seeing = False # seeing, and slit loss, changing with wavelength and airmass
+        self.stats = None # a Timing.StageStats to time each stage
 
 
     def photons(self):
         """
         photons(self)
         """
-        c = astropy.constants.c.value * 1e10 # convert to Angstroms
+        c = Mag.SPEED_OF_LIGHT * 1e10 # convert to Angstroms
         self.flux *= self.waves /(6.626e-27 * c)  # h is in ergs s, c is in Angstroms s^-1
 
         return
@@ -52,9 +81,8 @@ class ExpCalc():
         compute_extinction(self)
         """
 
-        trans = Transmission.Transmission(airmass=self.airmass)
-        extinct_interp = np.interp(self.waves, trans.wave, trans.extinct)
-        self.flux *= extinct_interp
+        self.flux *= Atmosphere.atmosphere(telluric_file=self.telluric).curve(self.waves,
+                                                                            self.airmass)
         return
 
     def compute_throughput(self):
@@ -84,68 +112,148 @@ class ExpCalc():
         """
         read_template(self)
         """
-        dirn = 'data/templates'
-        template_list = os.listdir(dirn)
-        for template_name in template_list:
-            if self.template_filename in template_name:
-                self.template_filename = template_name
-                break
+        filen = find_template(self.template_filename)
+        if filen is not None:
+            self.template_filename = os.path.basename(filen)
         if self.template_filename == '':
             print('No template found')
             return
-        filen = os.path.join(dirn, self.template_filename)
-        hdus = fits.open(filen)
-        dat = hdus[1].data
+        filen = os.path.join(TEMPLATE_DIR, self.template_filename)
+        waves, flux = DataCache.read_template(filen)
 
-        self.waves = dat['WAVELENGTH']
-        self.flux = dat['FLUX']
-        self.waves *= (1 + self.redshift)
+        # the cached arrays are read-only, keep private copies
+        self.waves = waves * (1 + self.redshift)
+        self.flux = flux.copy()
         return
 
-    def compute_spectrum(self, time, slit_length, slit_width, inst=None, telescope=None):
-        '''
-        compute_spectrum(self, time, slit_length, slit_width, inst=None, telescope=None)
+    def compute_rates(self, slit_length, slit_width, inst=None, telescope=None):
         '''
+        compute_rates(self, slit_length, slit_width, inst=None, telescope=None)
 
+        Returns a Pipeline.RateSpectrum for the wavelengths in the band,
+        its snr(times, nexp) method gives the same SNR as
+        compute_spectrum for any exposure time.
+        '''
         if telescope:
             self.telescope = telescope
         if inst:
             self.instrument = inst
-        self.instrument.sheight = slit_length
-        self.instrument.swidth = slit_width
-        frac = Moffat.moffat_frac(self.seeing, slit_width, slit_length, \
-                                  pix_size=self.instrument.scale_perp)
+        return rate_spectrum(self.request(None, slit_length, slit_width))
+
+    def dispersion_binning(self):
+        '''
+        dispersion_binning(self)
+
+        Detector pixels binned along the dispersion in each output
+        pixel, one unless the results are on the detector grid.
+        '''
+        if self.detector:
+            return self.instrument.bind
+        return 1
+
+    def line_spread_fwhm(self, slit_width):
+        '''
+        line_spread_fwhm(self, slit_width)
+
+        FWHM in Angstroms of the line spread function the source and
+        sky are convolved with, None unless lsf is set.
+        '''
+        return line_spread_fwhm(self.request(None, None, slit_width))
+
+    def spatial_profile(self, slit_length, slit_width):
+        '''
+        spatial_profile(self, slit_length, slit_width)
+
+        Profile of the source along the slit for the optimal
+        extraction, None unless optimal is set.
+        '''
+        return spatial_profile(self.request(None, slit_length, slit_width))
+
+    def options(self, slit_width):
+        '''
+        options(self, slit_width)
 
-        self.mag = Mag.Mag(self.filter)
-        self.read_template()
-        self.abs_mag = self.mag.compute_ABmag(self.waves, self.flux)
-        self.flux *= 10**(0.4*(self.abs_mag - self.app_mag))
+        The Pipeline.Options the attributes select.
+        '''
+        return request_options(self.request(None, None, slit_width))
+
+    def request(self, time, slit_length, slit_width):
+        '''
+        request(self, time, slit_length, slit_width)
+
+        The Request for calculate() with the settings of this ExpCalc.
+        '''
+        return Request(self.app_mag, self.filter, self.seeing, self.airmass, self.redshift,
+                       self.template_filename, self.instrument, self.telescope, time,
+                       slit_length, slit_width, lsf=self.lsf, abmag_table=self.abmag_table,
+                       telluric=self.telluric, optimal=self.optimal,
+                       chromatic_seeing=self.chromatic_seeing, detector=self.detector,
+                       sky_file=self.sky_file)
+
+    def detector_rates(self, slit_length, slit_width, options=Pipeline.DEFAULT_OPTIONS):
+        '''
+        detector_rates(self, slit_length, slit_width, options=Pipeline.DEFAULT_OPTIONS)
+
+        Pixel centers and the per second source and sky counts in each
+        binned detector pixel.
+        '''
+        return Pipeline.detector_rates(self.template_filename, self.filter, self.app_mag,
+                                       self.redshift, self.seeing, self.airmass, slit_width,
+                                       slit_length, self.instrument, self.telescope,
+                                       self.sky_file, options)
+
+    def compute_spectrum(self, time, slit_length, slit_width, inst=None, telescope=None):
+        '''
+        compute_spectrum(self, time, slit_length, slit_width, inst=None, telescope=None)
 
-        self.flux *= time
-        self.flux *= frac
-        self.sky.spec *= time
+        Built from the memoized stages in Pipeline, so calling it again
+        with only the time or airmass changed reuses the rest. The sky
+        spectrum is no longer modified. flux is zero outside of the band.
+        With detector set the results are on the binned detector pixels,
+        the flux and sky in counts per pixel. With lsf the source and sky
+        are convolved with the line spread function. The calculation is
+        done by calculate(), this stores its results on the ExpCalc.
+        '''
 
-        self.sky.rescale(self.instrument)
-        self.flux = self.flux * self.telescope.area
+        if telescope:
+            self.telescope = telescope
+        if inst:
+            self.instrument = inst
+        template = self.template_filename
 
         if self.flux_plots:
-            plt.plot(self.waves, self.flux, 'k-')
+            import matplotlib.pyplot as plt
+
+            frac = Pipeline.slit_loss(self.seeing, slit_width, slit_length,
+                                      self.instrument.scale_perp)
+            waves, _ = Pipeline.template_spectrum(template, self.redshift)
+            flux = Pipeline.normalized_flux(template, self.filter, self.app_mag, self.redshift)
+            flux = flux * time * frac * self.telescope.area
+            plt.plot(waves, flux, 'k-')
 
             plt.xlabel(r'Wavelength ($\AA$)')
             plt.ylabel(r'Intensity ($ergs\ \AA^{-1}\ cm^{-2}$)')
             plt.title(f'Flux {self.instrument.name}')
             plt.show()
 
-        #self.flux *= self.instrument.Ang_per_pix
-        self.photons()
-        if self.flux_plots:
-            plt.plot(self.waves, self.flux, 'k-')
+            c = Mag.SPEED_OF_LIGHT * 1e10 # convert to Angstroms
+            plt.plot(waves, flux * waves / (Pipeline.PLANCK * c), 'k-')
             plt.xlabel(r'Wavelength ($\AA$)')
             plt.ylabel(r'($\gamma\ \AA^{-1}$)')
             plt.title(f'Photons {self.instrument.name}')
             plt.show()
-        self.compute_extinction()
-        self.compute_throughput()
+
+        spectrum = calculate(self.request(time, slit_length, slit_width), self.stats)
+        self.waves = spectrum.waves
+        self.flux = spectrum.flux
+        self.sky_flux = spectrum.sky_flux
+        self.noise = spectrum.noise
+        self.snr = spectrum.snr
+        self.in_band = spectrum.in_band
+        self.good_waves = spectrum.in_band
+        self.throughput_interp = spectrum.throughput
+        self.abs_mag = spectrum.abs_mag
+
         if self.flux_plots:
             plt.plot(self.waves, self.flux, 'k-')
             plt.xlabel(r'Wavelength ($\AA$)')
@@ -153,27 +261,355 @@ class ExpCalc():
             plt.title(f'Photons after throughput and extinction {self.instrument.name}')
             plt.show()
 
-        npix = int(slit_length )
-        if npix < 2:
-            npix = 2
+        return
+
+
+def line_spread_fwhm(request):
+    '''
+    line_spread_fwhm(request)
+
+    FWHM in Angstroms of the line spread function of a Request, None
+    unless lsf is set.
+    '''
+    if not request.lsf:
+        return None
+    return LineSpread.fwhm(request.inst, request.slit_width, request.seeing)
+
+def spatial_profile(request):
+    '''
+    spatial_profile(request)
+
+    Profile along the slit for the optimal extraction of a Request,
+    None unless optimal is set.
+    '''
+    if not request.optimal:
+        return None
+    return Pipeline.spatial_profile(request.seeing, request.slit_width, request.slit_length,
+                                    request.inst.scale_perp*request.inst.bins)
+
+def request_options(request):
+    '''
+    request_options(request)
+
+    The Pipeline.Options of a Request.
+    '''
+    return Pipeline.Options(fwhm=line_spread_fwhm(request), abmag_table=request.abmag_table,
+                            telluric=request.telluric,
+                            chromatic_seeing=request.chromatic_seeing)
+
+def calculate(request, stats=None):
+    '''
+    calculate(request, stats=None)
+
+    ExpCalc.compute_spectrum for a Request, returning a Spectrum. The
+    request and its instrument, telescope and the cached reference
+    data are only read, everything computed is local or a read-only
+    Pipeline stage, so any number of threads can run it at once.
+    stats is an optional Timing.StageStats.
+    '''
+    inst = request.inst
+    template = request.template_filename
+    redshift = request.redshift
+    with Timing.stage(stats, 'options'):
+        options = request_options(request)
+        profile = spatial_profile(request)
+
+    with Timing.stage(stats, 'template') as stage:
+        waves, _ = Pipeline.template_spectrum(template, redshift)
+        stage.note(waves)
+    with Timing.stage(stats, 'normalize'):
+        abs_mag = Pipeline.ab_mag(template, request.mfilter, redshift, options.abmag_table)
+
+    with Timing.stage(stats, 'throughput') as stage:
+        in_band = Pipeline.in_band(template, redshift, inst)
+        throughput = Pipeline.throughput(template, redshift, inst)
+        stage.note(throughput)
+    throughput = throughput[in_band]
+    with Timing.stage(stats, 'extinction'):
+        Pipeline.extinction(template, redshift, request.airmass, options.telluric)
+    with Timing.stage(stats, 'photons') as stage:
+        source = Pipeline.source_rate(template, request.mfilter, request.app_mag, redshift,
+                                      request.seeing, request.airmass, request.slit_width,
+                                      request.slit_length, inst, request.telescope, options)
+        flux = source * request.time
+        stage.note(flux)
+
+    with Timing.stage(stats, 'sky_interp') as stage:
+        sky = Pipeline.sky_rate(template, redshift, request.slit_width, request.slit_length,
+                                inst, request.sky_file, options)
+        sky_flux = sky[in_band] * request.time
+        stage.note(sky_flux)
+
+    bind = 1
+    if request.detector:
+        with Timing.stage(stats, 'detector') as stage:
+            waves, source, sky = Pipeline.detector_rates(template, request.mfilter,
+                                                         request.app_mag, redshift,
+                                                         request.seeing, request.airmass,
+                                                         request.slit_width,
+                                                         request.slit_length, inst,
+                                                         request.telescope, request.sky_file,
+                                                         options)
+            in_band = Pipeline.detector_in_band(template, redshift, inst)
+            throughput = Pipeline.pixel_throughput(inst)[in_band]
+            flux = source * request.time
+            sky_flux = sky[in_band] * request.time
+            bind = inst.bind
+            stage.note(waves, flux, sky_flux)
+
+    with Timing.stage(stats, 'noise') as stage:
+        _, noise, snr = Pipeline.noise_model(source[in_band], sky[in_band], request.time,
+                                             request.slit_length, inst, bind=bind,
+                                             profile=profile)
+        stage.note(noise, snr)
+
+    return Spectrum(waves, flux, sky_flux, noise, snr, in_band, throughput, abs_mag)
+
+def rate_spectrum(request):
+    '''
+    rate_spectrum(request)
+
+    Pipeline.RateSpectrum of a Request for the wavelengths in the band,
+    with the same options, extraction and pixels as calculate(), so its
+    snr(times) is the SNR calculate() gives for any request.time.
+    '''
+    inst = request.inst
+    template = request.template_filename
+    redshift = request.redshift
+    options = request_options(request)
+    profile = spatial_profile(request)
+    npix = Pipeline.noise_npix(request.slit_length)
+    if request.detector:
+        waves, source, sky = Pipeline.detector_rates(template, request.mfilter, request.app_mag,
+                                                     redshift, request.seeing, request.airmass,
+                                                     request.slit_width, request.slit_length,
+                                                     inst, request.telescope, request.sky_file,
+                                                     options)
+        in_band = Pipeline.detector_in_band(template, redshift, inst)
+        return Pipeline.RateSpectrum(waves[in_band], source[in_band], sky[in_band], npix,
+                                     inst.dark * inst.bind, inst.readnoise, profile=profile)
+
+    waves, _ = Pipeline.template_spectrum(template, redshift)
+    in_band = Pipeline.in_band(template, redshift, inst)
+    source = Pipeline.source_rate(template, request.mfilter, request.app_mag, redshift,
+                                  request.seeing, request.airmass, request.slit_width,
+                                  request.slit_length, inst, request.telescope, options)
+    sky = Pipeline.sky_rate(template, redshift, request.slit_width, request.slit_length,
+                            inst, request.sky_file, options)
+    return Pipeline.RateSpectrum(waves[in_band], source[in_band], sky[in_band], npix,
+                                 inst.dark, inst.readnoise, profile=profile)
+
+def calculate_many(requests, workers=WORKERS, stats=None):
+    '''
+    calculate_many(requests, workers=WORKERS, stats=None)
+
+    Runs calculate() for each Request in a pool of workers threads
+    and returns their Spectrum in the same order. The threads share
+    the reference data and the Pipeline stages, and NumPy releases
+    the GIL in the array operations.
+    '''
+    requests = list(requests)
+    if workers is None or workers < 2 or len(requests) < 2:
+        return [calculate(request, stats) for request in requests]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda request: calculate(request, stats), requests))
+
+
+# kept here for callers that used them before the stages moved to Pipeline
+find_template = Pipeline.find_template
+interp_weights = Pipeline.interp_weights
+interp_rows = Pipeline.interp_rows
+
+def spatial_profiles(seeings, slit_width, slit_length, inst):
+    '''
+    spatial_profiles(seeings, slit_width, slit_length, inst)
+
+    (N, nspatial) profiles along the slit for the optimal
+    extraction, each distinct seeing is computed once.
+    '''
+    uniq, index = np.unique(np.asarray(seeings, dtype=float), return_inverse=True)
+    profiles = np.array([Pipeline.spatial_profile(seeing, slit_width, slit_length,
+                                                  inst.scale_perp*inst.bins)
+                         for seeing in uniq])
+    return profiles[index.ravel()]
+
+def compute_rates_batch(app_mags, seeings, airmasses, redshifts, mfilter, template_filename,
+                        slit_length, slit_width, inst, telescope, stats=None,
+                        abmag_table=False, telluric=None, sky_spectra=None,
+                        chromatic_seeing=False):
+    '''
+    compute_rates_batch(app_mags, seeings, airmasses, redshifts, mfilter, template_filename,
+                        slit_length, slit_width, inst, telescope, stats=None,
+                        abmag_table=False, telluric=None, sky_spectra=None,
+                        chromatic_seeing=False)
+
+    Computes the per second source and sky counts for N targets.
+    The parameters are broadcast against each other, the returned
+    waves, source and sky arrays are (N, nwave) and in_band flags
+    the wavelengths between the instrument cutoffs. stats is an
+    optional Timing.StageStats. With abmag_table the templates are
+    normalized by interpolating in Templates.abmag_table, telluric
+    is a file of telluric absorption, see Atmosphere. sky_spectra
+    gives each target its own sky, (N, nsky) on the wavelengths of
+    Sky.SKY_FILE as returned by SkyModel.spectra, by default every
+    target has the sky of Sky.SKY_FILE. With chromatic_seeing
+    the slit loss follows the seeing with wavelength and airmass.
+    '''
+    app_mags, seeings, airmasses, redshifts = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(app_mags, dtype=float)),
+        np.atleast_1d(np.asarray(seeings, dtype=float)),
+        np.atleast_1d(np.asarray(airmasses, dtype=float)),
+        np.atleast_1d(np.asarray(redshifts, dtype=float)))
+    ntargets = len(app_mags)
+
+    # everything that only depends on the wavelength grid is computed
+    # once per distinct redshift, all of them at once so that many
+    # redshifts cost little more than one
+    uniq_z, z_index = np.unique(redshifts, return_inverse=True)
+    with Timing.stage(stats, 'template') as stage:
+        rest_waves, rest_flux = Templates.get_template(template_filename).arrays()
+        rest_waves = np.asarray(rest_waves, dtype=float)
+        rest_flux = np.asarray(rest_flux, dtype=float)
+        zwaves = rest_waves[np.newaxis, :] * (1 + uniq_z[:, np.newaxis])
+        z_in_band = (zwaves > inst.BLUE_CUTOFF) & (zwaves < inst.RED_CUTOFF)
+        stage.note(zwaves)
+
+    with Timing.stage(stats, 'normalize'):
+        if abmag_table:
+            abs_mags = Templates.abmag(template_filename, mfilter, uniq_z)
+        else:
+            abs_mags = Templates.compute_abmags(rest_waves, rest_flux, Mag.Mag(mfilter), uniq_z)
+        scale = 10**(0.4*(abs_mags[z_index] - app_mags))
+
+    with Timing.stage(stats, 'slit_loss'):
+        if not chromatic_seeing:
+            scale *= SlitLoss.slit_frac(seeings, slit_width, slit_length, pix_size=inst.scale_perp)
+        scale *= telescope.area
+
+    with Timing.stage(stats, 'throughput') as stage:
+        inst.read_throughput()
+        throughput = Resample.interp(zwaves.ravel(), inst.throughput['wavelength'],
+                                     inst.throughput['throughput']).reshape(zwaves.shape)
+        throughput[~z_in_band] = 0.0
+        stage.note(throughput)
+
+    with Timing.stage(stats, 'photons') as stage:
+        c = Mag.SPEED_OF_LIGHT * 1e10 # convert to Angstroms
+        photons = rest_flux * zwaves / (Pipeline.PLANCK * c)
+        photons *= throughput
+        stage.note(photons)
+
+    with Timing.stage(stats, 'sky_interp') as stage:
+        _, sky_wave, sky_spec = DataCache.read_sky(Sky.SKY_FILE)
+        sky_band = (sky_wave > inst.BLUE_CUTOFF) & (sky_wave < inst.RED_CUTOFF)
+        # each distinct pair of sky and redshift is gathered once, with
+        # the default sky that is once per redshift
+        if sky_spectra is None:
+            sky_spectra = sky_spec[np.newaxis, :]
+            sky_rows = np.zeros(len(uniq_z), dtype=int)
+            sky_z = np.arange(len(uniq_z))
+            sky_index = z_index
+        else:
+            sky_spectra = np.broadcast_to(sky_spectra, (ntargets, len(sky_wave)))
+            sky_rows = np.arange(ntargets)
+            sky_z = z_index
+            sky_index = slice(None)
+        sky_spectra = sky_spectra[:, sky_band]
+        sky_idx, sky_frac = interp_weights(zwaves, sky_wave[sky_band])
+        sky_idx = sky_idx[sky_z]
+        sky_frac = sky_frac[sky_z]
+        rows = sky_rows[:, np.newaxis]
+        sky = sky_spectra[rows, sky_idx]*(1 - sky_frac) + sky_spectra[rows, sky_idx + 1]*sky_frac
+        sky *= slit_width * inst.Ang_per_pix * slit_length
+        sky *= throughput[sky_z]
+        sky = sky[sky_index]
+        stage.note(sky)
+
+    with Timing.stage(stats, 'extinction') as stage:
+        atm = Atmosphere.atmosphere(telluric_file=telluric)
+        if ntargets >= GROUP_SIZE*len(uniq_z):
+            # few redshifts, one sparse product for each
+            source = np.empty((ntargets, zwaves.shape[1]))
+            for i, waves in enumerate(zwaves):
+                rows = z_index == i
+                source[rows] = atm.transmission(waves, airmasses[rows])
+        else:
+            source = atm.transmission(zwaves, airmasses, rows=z_index)
+        stage.note(source)
+
+    with Timing.stage(stats, 'source') as stage:
+        source *= photons[z_index]
+        source *= scale[:, np.newaxis]
+        waves = zwaves[z_index]
+        if chromatic_seeing:
+            source *= SlitLoss.chromatic_slit_frac(seeings[:, np.newaxis], waves, slit_width,
+                                                   slit_length, airmass=airmasses[:, np.newaxis],
+                                                   pix_size=inst.scale_perp)
+        in_band = z_in_band[z_index]
+        stage.note(waves, sky, in_band)
 
-        self.in_band = (self.waves > self.instrument.BLUE_CUTOFF) &\
-              (self.waves < self.instrument.RED_CUTOFF)
-        sky_band = (self.sky.wave > self.instrument.BLUE_CUTOFF) &\
-              (self.sky.wave < self.instrument.RED_CUTOFF)
+    return waves, source, sky, in_band
 
-        self.sky_flux = np.interp(self.waves[self.in_band], self.sky.wave[sky_band], \
-                                  self.sky.spec[sky_band])
-        self.sky_flux *= slit_length
+def compute_rate_spectra(app_mags, seeings, airmasses, redshifts, mfilter, template_filename,
+                         slit_length, slit_width, inst, telescope, stats=None,
+                         abmag_table=False, telluric=None, sky_spectra=None,
+                         optimal=False, chromatic_seeing=False):
+    '''
+    compute_rate_spectra(app_mags, seeings, airmasses, redshifts, mfilter, template_filename,
+                         slit_length, slit_width, inst, telescope, stats=None,
+                         abmag_table=False, telluric=None, sky_spectra=None,
+                         optimal=False, chromatic_seeing=False)
 
-        self.sky_flux = self.scale_sky_by_throughput(self.waves[self.in_band], self.sky_flux)
+    compute_rates_batch wrapped in a Pipeline.RateSpectrum, whose
+    snr(times, nexp) returns (ntimes, N, nwave) SNR arrays. With
+    optimal the SNR is that of an optimal extraction.
+    '''
+    waves, source, sky, in_band = compute_rates_batch(app_mags, seeings, airmasses, redshifts,
+                                                      mfilter, template_filename,
+                                                      slit_length, slit_width, inst, telescope,
+                                                      stats=stats, abmag_table=abmag_table,
+                                                      telluric=telluric, sky_spectra=sky_spectra,
+                                                      chromatic_seeing=chromatic_seeing)
+    profiles = None
+    if optimal:
+        profiles = spatial_profiles(np.broadcast_to(seeings, (len(source),)), slit_width,
+                                    slit_length, inst)
+    return Pipeline.RateSpectrum(waves, source, sky, Pipeline.noise_npix(slit_length),
+                                 inst.dark, inst.readnoise, in_band=in_band, profile=profiles)
 
-        self.noise = self.flux[self.in_band]
-        self.noise += self.sky_flux
-        self.noise += npix*self.instrument.dark*time
-        self.noise += npix*self.instrument.readnoise**2
+def compute_snr_batch(app_mags, seeings, airmasses, redshifts, times, mfilter, template_filename,
+                      slit_length, slit_width, inst, telescope, stats=None,
+                      abmag_table=False, telluric=None, sky_spectra=None,
+                      optimal=False, chromatic_seeing=False):
+    '''
+    compute_snr_batch(app_mags, seeings, airmasses, redshifts, times, mfilter, template_filename,
+                      slit_length, slit_width, inst, telescope, stats=None,
+                      abmag_table=False, telluric=None, sky_spectra=None,
+                      optimal=False, chromatic_seeing=False)
 
-        self.snr = np.zeros_like(self.waves[self.in_band])
-        self.snr = self.flux[self.in_band]/np.sqrt(self.noise)
+    Vectorized version of ExpCalc.compute_spectrum for N targets.
+    Returns the (N, nwave) wavelength and SNR arrays, the SNR is NaN
+    outside of the instrument band. With optimal the SNR is that of
+    an optimal extraction.
+    '''
+    times = np.atleast_1d(np.asarray(times, dtype=float))
+    app_mags, seeings, airmasses, redshifts, times = np.broadcast_arrays(
+        np.atleast_1d(app_mags), np.atleast_1d(seeings), np.atleast_1d(airmasses),
+        np.atleast_1d(redshifts), times)
+    waves, source, sky, in_band = compute_rates_batch(app_mags, seeings, airmasses, redshifts,
+                                                      mfilter, template_filename,
+                                                      slit_length, slit_width, inst, telescope,
+                                                      stats=stats, abmag_table=abmag_table,
+                                                      telluric=telluric, sky_spectra=sky_spectra,
+                                                      chromatic_seeing=chromatic_seeing)
 
-        return 
+    with Timing.stage(stats, 'noise') as stage:
+        profiles = None
+        if optimal:
+            profiles = spatial_profiles(seeings, slit_width, slit_length, inst)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _, noise, snr = Pipeline.noise_model(source, sky, times[:, np.newaxis],
+                                                 slit_length, inst, profile=profiles)
+        snr[~in_band] = np.nan
+        stage.note(noise, snr)
+    return waves, snr
@@ -0,0 +1,126 @@
+"""Exposure time needed to reach a signal to noise ratio"""
+import numpy as np
+
+import ExpCalc
+import Pipeline
+
+def solve_time(snr, source, sky, npix, dark, readnoise):
+    '''
+    solve_time(snr, source, sky, npix, dark, readnoise)
+
+    Solves the noise model of ExpCalc.compute_spectrum
+
+      snr = S t / sqrt(S t + B t + npix dark t + npix readnoise^2)
+
+    for t, where source (S) and sky (B) are count rates per second.
+    The arguments broadcast against each other, rates of zero give
+    an infinite time.
+    '''
+    rates = Pipeline.RateSpectrum(None, source, sky, npix, dark, readnoise)
+    return rates.time_for_snr(snr)
+
+def resolution_npix(slit_width, inst, bind=1):
+    '''
+    resolution_npix(slit_width, inst, bind=1)
+
+    Number of pixels, binned by bind along the dispersion, covered
+    by the image of the slit, never less than one.
+    '''
+    return max(slit_width / (inst.scale_para * bind), 1.0)
+
+def rates_time(snr, rates, inst, wavelength=None, band=None):
+    '''
+    rates_time(snr, rates, inst, wavelength=None, band=None)
+
+    Exposure time for a Pipeline.RateSpectrum to reach snr, the SNR
+    is computed by rates.snr() so the time follows the same noise
+    model and extraction.
+
+    With wavelength it is the time at which the SNR spectrum,
+    interpolated linearly to that wavelength, is snr. With
+    band=(min, max) it is the time at which the rates averaged over
+    the part of the band the instrument covers reach snr. Otherwise
+    the time is computed at every wavelength. For spectra of N
+    targets snr is a scalar or one value per target and N times are
+    returned, a single spectrum gives a single time.
+    '''
+    if wavelength is not None and band is not None:
+        raise ValueError("Give either a wavelength or a band, not both")
+    if wavelength is None and band is None:
+        return rates.time_for_snr(snr)
+
+    waves = np.atleast_2d(rates.waves)
+    source = np.atleast_2d(rates.source)
+    sky = np.atleast_2d(rates.sky)
+    in_band = np.ones(source.shape, dtype=bool)
+    if rates.in_band is not None:
+        in_band = np.atleast_2d(rates.in_band)
+    target = np.broadcast_to(np.asarray(snr, dtype=float), (len(source),))
+
+    if wavelength is not None:
+        if not inst.BLUE_CUTOFF < wavelength < inst.RED_CUTOFF:
+            raise ValueError(f"{wavelength} is outside of the {inst.name} band")
+        rows = np.arange(len(waves))[:, np.newaxis]
+        idx = np.clip(np.sum(waves <= wavelength, axis=1) - 1, 0, waves.shape[1] - 2)
+        cols = np.stack([idx, idx + 1], axis=1)
+        frac = (wavelength - waves[rows, cols[:, :1]]) / np.diff(waves[rows, cols], axis=1)
+        weights = np.concatenate([1 - frac, frac], axis=1)
+        pair = rates.with_rates(None, source[rows, cols], sky[rows, cols],
+                                in_band=in_band[rows, cols])
+        # the interpolated SNR is between those of the two pixels, so
+        # it reaches snr between the times each of them does
+        times = pair.time_for_snr(target[:, np.newaxis])
+        time = Pipeline.bisect_time(
+            lambda time: np.sum(pair.snr_at(time[:, np.newaxis]) * weights, axis=1),
+            target, times.min(axis=1), times.max(axis=1))
+    else:
+        in_band = in_band & (waves >= band[0]) & (waves <= band[1])
+        nband = in_band.sum(axis=1, keepdims=True)
+        if np.any(nband == 0):
+            raise ValueError(f"Band {band} does not overlap the {inst.name} band")
+        mean = rates.with_rates(None, np.sum(np.where(in_band, source, 0.0), axis=1,
+                                             keepdims=True) / nband,
+                                np.sum(np.where(in_band, sky, 0.0), axis=1,
+                                       keepdims=True) / nband)
+        time = mean.time_for_snr(target[:, np.newaxis])[:, 0]
+
+    if rates.source.ndim == 1:
+        return float(time[0])
+    return time
+
+def time_for_snr(snr, app_mags, seeings, airmasses, redshifts, mfilter, template_filename,
+                 slit_length, slit_width, inst, telescope,
+                 wavelength=None, band=None, per_resolution=False, optimal=False):
+    '''
+    time_for_snr(snr, app_mags, seeings, airmasses, redshifts, mfilter, template_filename,
+                 slit_length, slit_width, inst, telescope,
+                 wavelength=None, band=None, per_resolution=False, optimal=False)
+
+    Returns the exposure time for each target to reach the SNR of
+    ExpCalc.compute_snr_batch, see rates_time for wavelength and
+    band, without either an (N, nwave) array is returned.
+    per_resolution sums the pixels in one resolution element
+    instead of using a single pixel. With optimal the SNR is that of
+    an optimal extraction.
+    '''
+    rates = ExpCalc.compute_rate_spectra(app_mags, seeings, airmasses, redshifts, mfilter,
+                                         template_filename, slit_length, slit_width,
+                                         inst, telescope, optimal=optimal)
+    if per_resolution:
+        rates = rates.combine(resolution_npix(slit_width, inst))
+    return rates_time(snr, rates, inst, wavelength=wavelength, band=band)
+
+def time_for_request(snr, request, wavelength=None, band=None, per_resolution=False):
+    '''
+    time_for_request(snr, request, wavelength=None, band=None, per_resolution=False)
+
+    Exposure time for an ExpCalc.Request to reach snr, with all of
+    its options including the detector grid, request.time is not
+    used. ExpCalc.calculate with the returned time gives snr, see
+    rates_time for wavelength and band.
+    '''
+    rates = ExpCalc.rate_spectrum(request)
+    if per_resolution:
+        bind = request.inst.bind if request.detector else 1
+        rates = rates.combine(resolution_npix(request.slit_width, request.inst, bind))
+    return rates_time(snr, rates, request.inst, wavelength=wavelength, band=band)
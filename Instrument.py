@@ -1,6 +1,9 @@
 """Instrument class for the snr calculator"""
 import os
-import astropy.io.ascii
+
+import numpy as np
+
+import DataCache
 
 class Instrument:
     """
@@ -37,24 +40,44 @@ class Instrument:
     def __str__(self):
         return f'>Instrument {self.name} {self.grating}>'
 
+    def config_key(self):
+        '''
+        config_key(self)
+
+        The settings the calculation depends on, used to key
+        cached intermediate results.
+        '''
+        return (self.name, self.grating, self.BLUE_CUTOFF, self.RED_CUTOFF,
+                getattr(self, 'Ang_per_pix', None), self.scale_perp, self.scale_para,
+                self.dark, self.readnoise, self.bind, self.bins, self.R, self.throughput_dir)
+
+    def pixel_edges(self):
+        '''
+        pixel_edges(self)
+
+        Wavelength edges of the binned detector pixels between the
+        cutoffs, assuming a constant Ang_per_pix.
+        '''
+        if getattr(self, 'Ang_per_pix', None) is None:
+            raise ValueError(f"No dispersion known for {self!r}")
+        dwave = self.Ang_per_pix * self.bind
+        npix = int((self.RED_CUTOFF - self.BLUE_CUTOFF) // dwave)
+        return self.BLUE_CUTOFF + dwave*np.arange(npix + 1)
+
     def read_xidl_throughput(self):
         '''
         read_lris_throughput(self)
         '''
         short_name = f"sens_{self.name}_{self.grating}.fits.gz"
         grating_filename = os.path.join(self.throughput_dir, short_name)
-        hdus = astropy.io.fits.open(grating_filename)
-        self.throughput = {}
-        self.throughput['wavelength'] = hdus[2].data['WAV'][0]
-        self.throughput['throughput'] = hdus[2].data['EFF'][0]
+        self.throughput = DataCache.read_xidl_throughput(grating_filename)
 
     def read_lris2_throughput(self):
         '''
         read_lris2_throughput(self)
         '''
         grating_filename = os.path.join(self.throughput_dir, self.grating + "_tot_eff.csv")
-        self.throughput = astropy.io.ascii.read(grating_filename)
-        self.throughput['wavelength'] *= 10 # we work in Angstroms but these tables are in nm
+        self.throughput = DataCache.read_lris2_throughput(grating_filename) # in Angstroms
 
     def read_throughput(self):
         '''
@@ -71,6 +94,22 @@ class Instrument:
             raise ValueError(f"Throughput not available for {self.name}")
 
 
+    def configure(self, tel, mode, grating=None):
+        '''
+        configure(self, tel, mode, grating=None)
+
+        Sets the settings of mode, e.g. lris2_red, and the grating from
+        the instrument registry, the default grating of the mode
+        unless one is given.
+        '''
+        # InstrumentRegistry builds on this module
+        import InstrumentRegistry
+
+        for key, value in InstrumentRegistry.settings(mode, grating).items():
+            setattr(self, key, value)
+        self.scale_perp = tel.plate_scale*self.mag_perp*(self.pixel_size/1000.) # Arcsec
+        self.scale_para = tel.plate_scale*self.mag_para*(self.pixel_size/1000.)
+
     def lris2_red(self, tel, grating="R400"):
         '''
         lris2_red(self, grating="R400")
@@ -78,26 +117,7 @@ class Instrument:
         Builds the red side of LRIS-2, assumse R400 grating 
         unless otherwise specified.
         '''
-        self.name = "LRIS-2 Red"
-        if grating not in ("R400", "R700", "R750"):
-            raise ValueError(f"Grating {grating} not supported for {self.name}")
-
-        self.grating = grating
-        self.sheight = 8
-        self.swidth = 0.7
-        self.dark = 0.001
-        self.readnoise = 3.5
-        self.bind = 1
-        self.bins = 1
-        self.mag_para = 7.3
-        self.mag_perp = 7.3
-        self.Ang_per_pix = 1.13 #
-        self.BLUE_CUTOFF = 5500.0
-        self.RED_CUTOFF = 9500.0
-
-        self.pixel_size= 15 # 15.0 microns is 0.15 "
-        self.scale_perp = tel.plate_scale*self.mag_perp*(self.pixel_size/1000.) # Arcsec
-        self.scale_para = tel.plate_scale*self.mag_para*(self.pixel_size/1000.)
+        self.configure(tel, 'lris2_red', grating)
 
     def lris2_blue(self, tel, grating="B600"):
         '''
@@ -106,110 +126,22 @@ class Instrument:
         Builds the blue side of LRIS-2, assumse B600 grating 
         unless otherwise specified.
         '''
-        self.name = "LRIS-2 Blue"
-
-        if grating not in ("B600", "B1200", "B1300"):
-            raise ValueError(f"Grating {grating} not supported for {self.name}")
-
-        self.grating = grating
-        self.sheight = 8
-        self.swidth = 0.7
-        self.dark = 0.001
-        self.readnoise = 3.5
-        self.bind = 1
-        self.bins = 1
-        self.mag_para = 7.3
-        self.mag_perp = 7.3
-        self.Ang_per_pix = 0.62 #
-        self.RED_CUTOFF = 5700.0
-        self.BLUE_CUTOFF = 3100.0
-
-        self.pixel_size= 15 # 15.0 microns is 0.15 "
-        self.scale_perp = tel.plate_scale*self.mag_perp*(self.pixel_size/1000.) # Arcsec
-        self.scale_para = tel.plate_scale*self.mag_para*(self.pixel_size/1000.)
+        self.configure(tel, 'lris2_blue', grating)
 
     def lris_red(self, tel, grating="400_8500_D560"):
         '''
         lris_red(self, grating="400_8500_D560")
         '''
-
-        self.name = "LRISr"
-        if grating not in ("400_8500_D560", "600_7500_D680", "600_10000_D560"):
-            raise ValueError(f"Grating {grating} not supported for {self.name}")
-        self.grating = grating
-        self.sheight = 8
-        self.swidth = 1.2
-        self.dark = 0.001
-        self.readnoise = 4.5
-        self.bind = 1
-        self.bins = 1
-        self.mag_para = 6.5
-        self.mag_perp = 6.5
-
-        self.Ang_per_pix = 1.16
-        self.RED_CUTOFF = 10300.0
-        self.BLUE_CUTOFF = 5600.0
-
-        self.pixel_size= 15 
-
-        self.scale_perp = tel.plate_scale*self.mag_perp*(self.pixel_size/1000.) # Arcsec
-        self.scale_para = tel.plate_scale*self.mag_para*(self.pixel_size/1000.)
-
+        self.configure(tel, 'lris_red', grating)
 
     def lris_blue(self, tel, grating="600_4000_D560"):
         '''
         lris_blue(self, grating="600_4000_D560")
         '''
-
-        self.name = "LRISb"
-        if grating not in ("600_4000_D560"):
-            raise ValueError(f"Grating {grating} not supported for {self.name}")
-
-        self.grating = grating
-        self.sheight = 8
-        self.swidth = 1.2
-        self.dark = 0.001
-        self.readnoise = 3.7
-        self.bind = 1
-        self.bins = 1
-        self.mag_para = 6.5
-        self.mag_perp = 6.5
-        self.Ang_per_pix = 0.63
-        self.RED_CUTOFF = 5600.0
-        self.BLUE_CUTOFF = 3100.0
-
-        self.pixel_size= 13.5
-
-        self.scale_perp = tel.plate_scale*self.mag_perp*(self.pixel_size/1000.) # Arcsec
-        self.scale_para = tel.plate_scale*self.mag_para*(self.pixel_size/1000.)
-
+        self.configure(tel, 'lris_blue', grating)
 
     def deimos(self, tel, grating="600"):
         '''
         deimos(self, grating="600")
         '''
-        self.mag_perp = 8.03  # Modified to give observed resolution 0.75" maps to 4.5 pixels
-        self.mag_para = 8.03  # Same
-        self.pixel_size = 15.0 # in microns
-
-        self.scale_perp = tel.plate_scale*self.mag_perp*(self.pixel_size/1000.) # Arcsec
-        self.scale_para = tel.plate_scale*self.mag_para*(self.pixel_size/1000.)
-
-        self.grating = grating
-        if grating == "600":
-            self.R     = 11538.5    # 1 pixel (native) dispersion
-        elif grating == "1200":
-            self.R    = 22727.3    # 1 pixel (native) dispersion
-        elif grating == "900":
-            self.R    = 17307.8    # 1 pixel (native) dispersion
-
-        ## Detector
-        self.readnoise = 2.6
-        self.dark = 0.001  # electrons/pix/hr
-        self.bind = 1
-        self.bins = 1
-
-        ## Wavelength range
-        self.RED_CUTOFF = 10000
-        self.BLUE_CUTOFF = 4000
-        # dei.throughput
\ No newline at end of file
+        self.configure(tel, 'deimos', grating)
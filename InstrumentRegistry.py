@@ -0,0 +1,186 @@
+"""Registry of immutable instrument configurations
+
+The settings of each instrument mode and grating are read from a data
+file, which the Instrument methods also read. A configuration is
+built once, with its throughput read and its derived quantities
+computed, and cannot be changed afterwards, so one object can be used
+by any number of threads and is rebuilt as is when pickled to another
+process.
+"""
+import json
+import os
+import types
+
+import numpy as np
+
+import DataCache
+import Instrument
+import Telescope
+
+REGISTRY_FILE = os.path.join('data', 'instruments', 'instruments.json')
+# Telescope names to the names Telescope.Telescope() takes
+TELESCOPES = {'KeckI': 'keck1', 'KeckII': 'keck2', 'Lick-3m': 'lick'}
+
+def _read_registry(fn):
+    with open(fn, encoding='utf-8') as stream:
+        return json.load(stream)
+
+def registry(fn=REGISTRY_FILE):
+    '''
+    registry(fn=REGISTRY_FILE)
+
+    The instrument modes in fn, read again when it changes.
+    '''
+    return DataCache.cache().get(DataCache.file_key('instrument_registry', fn),
+                                 lambda: _read_registry(fn))
+
+def modes(fn=REGISTRY_FILE):
+    '''
+    modes(fn=REGISTRY_FILE)
+    '''
+    return tuple(registry(fn))
+
+def gratings(mode, fn=REGISTRY_FILE):
+    '''
+    gratings(mode, fn=REGISTRY_FILE)
+    '''
+    return tuple(registry(fn)[mode]['gratings'])
+
+def settings(mode, grating=None, fn=REGISTRY_FILE):
+    '''
+    settings(mode, grating=None, fn=REGISTRY_FILE)
+
+    The settings of a mode with a grating, its default one unless
+    given, as a dict of Instrument attributes.
+    '''
+    mode_settings = registry(fn).get(mode)
+    if mode_settings is None:
+        raise ValueError(f"Instrument {mode} not supported")
+    if grating is None:
+        grating = mode_settings['default_grating']
+    if grating not in mode_settings['gratings']:
+        raise ValueError(f"Grating {grating} not supported for {mode_settings['name']}")
+    values = {key: value for key, value in mode_settings.items()
+              if key not in ('gratings', 'default_grating')}
+    values.update(mode_settings['gratings'][grating])
+    values['grating'] = grating
+    return values
+
+class InstrumentConfig:
+    '''
+    InstrumentConfig(**values)
+
+    Frozen instrument configuration with the attributes the
+    calculation reads from an Instrument. Use config() to get the
+    shared one for a mode and replace() for a modified copy.
+    '''
+    __slots__ = ('name', 'mode', 'grating', 'telescope', 'sheight', 'swidth', 'dark',
+                 'readnoise', 'bind', 'bins', 'scale_para', 'scale_perp', 'mag_para',
+                 'mag_perp', 'R', 'pixel_size', 'Ang_per_pix', 'BLUE_CUTOFF', 'RED_CUTOFF',
+                 'throughput_dir', 'throughput', 'pixel_throughput')
+
+    def __init__(self, **values):
+        for slot in self.__slots__:
+            object.__setattr__(self, slot, values.pop(slot, None))
+        if values:
+            raise ValueError(f"Unknown instrument settings {sorted(values)}")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self!r} is frozen, use replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self!r} is frozen")
+
+    def __repr__(self):
+        return f'<InstrumentConfig {self.name} {self.grating}>'
+
+    def __reduce__(self):
+        values = {slot: getattr(self, slot) for slot in self.__slots__}
+        if values['throughput'] is not None:
+            values['throughput'] = dict(values['throughput'])
+        return (_restore, (values,))
+
+    # the same keys and pixels as an Instrument with these settings
+    config_key = Instrument.Instrument.config_key
+    pixel_edges = Instrument.Instrument.pixel_edges
+
+    def read_throughput(self):
+        '''
+        read_throughput(self)
+
+        The throughput is read when the configuration is built, this
+        only checks that there is one.
+        '''
+        if self.throughput is None:
+            raise ValueError(f"Throughput not available for {self.name} {self.grating}")
+
+    def replace(self, **changes):
+        '''
+        replace(self, **changes)
+
+        A new configuration with some settings changed, e.g. bind=2.
+        The derived quantities are computed again.
+        '''
+        values = {slot: getattr(self, slot) for slot in self.__slots__}
+        values.update(changes)
+        return _derive(values)
+
+def _restore(values):
+    if values['throughput'] is not None:
+        values['throughput'] = types.MappingProxyType(values['throughput'])
+    return InstrumentConfig(**values)
+
+def _read_throughput(name, grating, throughput_dir):
+    # the same files Instrument.read_throughput reads, None when there
+    # are none, read_throughput() raises if the config is used for them
+    inst = Instrument.Instrument()
+    inst.name = name
+    inst.grating = grating
+    inst.throughput_dir = throughput_dir
+    try:
+        inst.read_throughput()
+    except (OSError, ValueError):
+        return None
+    return inst.throughput
+
+def _derive(values):
+    '''
+    _derive(values)
+
+    Fills in the plate scale products, throughput and detector pixels.
+    '''
+    tel = Telescope.Telescope(values['telescope'])
+    if tel.name == '':
+        raise ValueError(f"Telescope {values['telescope']} not supported")
+    values['scale_perp'] = tel.plate_scale*values['mag_perp']*(values['pixel_size']/1000.) # Arcsec
+    values['scale_para'] = tel.plate_scale*values['mag_para']*(values['pixel_size']/1000.)
+    values['throughput'] = _read_throughput(values['name'], values['grating'],
+                                            values['throughput_dir'])
+    values['pixel_throughput'] = None
+    if values.get('Ang_per_pix') is not None and values['throughput'] is not None:
+        edges = Instrument.Instrument.pixel_edges(types.SimpleNamespace(**values))
+        values['pixel_throughput'] = DataCache.readonly(
+            np.interp(0.5*(edges[1:] + edges[:-1]), values['throughput']['wavelength'],
+                      values['throughput']['throughput']))
+    return InstrumentConfig(**values)
+
+def _build(mode, grating, telescope, fn):
+    # start from the defaults of an Instrument
+    values = {key: value for key, value in vars(Instrument.Instrument()).items()
+              if key in InstrumentConfig.__slots__}
+    values.update({'mode': mode, 'telescope': telescope})
+    values.update(settings(mode, grating, fn))
+    return _derive(values)
+
+def config(mode, grating=None, telescope='keck1', fn=REGISTRY_FILE):
+    '''
+    config(mode, grating=None, telescope='keck1', fn=REGISTRY_FILE)
+
+    The shared InstrumentConfig of a mode, e.g. lris2_red, with its
+    default grating unless one is given. telescope is a name or a
+    Telescope.
+    '''
+    if isinstance(telescope, Telescope.Telescope):
+        telescope = TELESCOPES.get(telescope.name, telescope.name)
+    key = ('instrument_config', mode, grating, telescope) + DataCache.file_key('registry', fn)[1:]
+    return DataCache.cache().get(key, lambda: _build(mode, grating, telescope, fn))
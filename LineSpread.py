@@ -0,0 +1,70 @@
+"""Convolution of spectra with the instrument line spread function"""
+import numpy as np
+
+import Resample
+
+FWHM_TO_SIGMA = 1.0 / (2.0*np.sqrt(2.0*np.log(2.0)))
+KERNEL_SIGMAS = 5
+SAMPLES_PER_FWHM = 4
+
+def fwhm(inst, slit_width, seeing):
+    '''
+    fwhm(inst, slit_width, seeing)
+
+    Width in Angstroms of the line spread function. The image of the
+    slit, or of the seeing disk when that is narrower, covers
+    width/scale_para pixels of Ang_per_pix, never less than one pixel.
+    Instruments with only a resolving power use the center of the band.
+    '''
+    width = min(slit_width, seeing)
+    if getattr(inst, 'Ang_per_pix', None) is not None:
+        return max(width / inst.scale_para, 1.0) * inst.Ang_per_pix
+    if inst.R > 1:
+        return 0.5*(inst.BLUE_CUTOFF + inst.RED_CUTOFF) / inst.R
+    raise ValueError(f"No resolution known for {inst!r}")
+
+def gaussian_kernel(fwhm_ang, step):
+    '''
+    gaussian_kernel(fwhm_ang, step)
+
+    Normalized Gaussian sampled every step Angstroms.
+    '''
+    sigma = fwhm_ang * FWHM_TO_SIGMA / step
+    half = max(int(np.ceil(KERNEL_SIGMAS*sigma)), 1)
+    x = np.arange(-half, half + 1)
+    kernel = np.exp(-0.5*(x/sigma)**2)
+    return kernel / kernel.sum()
+
+def convolve(waves, values, fwhm_ang, wave_range=None):
+    '''
+    convolve(waves, values, fwhm_ang, wave_range=None)
+
+    Convolves values sampled at waves with a Gaussian of FWHM
+    fwhm_ang using an FFT. The spectrum is resampled onto a uniform
+    grid finer than the kernel and back, only the part within
+    wave_range=(min, max) is convolved if it is given.
+    '''
+    from scipy import signal
+
+    waves = np.asarray(waves, dtype=float)
+    values = np.asarray(values, dtype=float)
+    result = values.copy()
+    step = min(np.min(np.diff(waves)), fwhm_ang / SAMPLES_PER_FWHM)
+    kernel = gaussian_kernel(fwhm_ang, step)
+    half = len(kernel) // 2
+
+    low, high = waves[0], waves[-1]
+    if wave_range is not None:
+        low = max(low, wave_range[0] - half*step)
+        high = min(high, wave_range[1] + half*step)
+    inside = (waves >= low) & (waves <= high)
+    if inside.sum() < 2:
+        return result
+
+    grid = np.arange(low, high + step, step)
+    uniform = Resample.interp(grid, waves, values)
+    # pad with the end values so the edges are not pulled to zero
+    uniform = np.pad(uniform, half, mode='edge')
+    smooth = signal.fftconvolve(uniform, kernel, mode='valid')
+    result[inside] = Resample.interp(waves[inside], grid, smooth)
+    return result
@@ -1,7 +1,9 @@
 import os
 import numpy
-import astropy.constants
-import astropy.io.ascii
+
+import DataCache
+
+SPEED_OF_LIGHT = 299792458.0 # m s^-1, astropy.constants.c without the import cost
 
 class Mag:
     def __init__(self, fn=None):
@@ -29,15 +31,10 @@ class Mag:
         wavelength (should be in the Angstroms)
         weight (the weight of the filter at that wavelength)
         '''
-        files = os.listdir(self.filter_dir)
-        for filename in files:
-            if fn in filename:
-                fn = filename
-                break
-        fn = os.path.join(self.filter_dir, fn)
-        data = astropy.io.ascii.read(fn)
-        self.wave = data['col1']
-        self.weight = data['col2']
+        filen = DataCache.find_file(self.filter_dir, fn)
+        if filen is None:
+            filen = os.path.join(self.filter_dir, fn)
+        self.wave, self.weight = DataCache.read_filter(filen)
         self.lambda_eff = self.compute_lambda_eff()
 
     def compute_lambda_eff(self):
@@ -63,7 +60,7 @@ class Mag:
         tot_filt = numpy.trapz(spec_wave, weights_interp)
         tot_flux = numpy.trapz(spec_wave, weights_interp * spec)
         tot_flux = tot_flux / tot_filt
-        tot_flux = tot_flux / astropy.constants.c.value
+        tot_flux = tot_flux / SPEED_OF_LIGHT
         tot_flux = tot_flux * 1e-10 # convert c to Angstroms
         tot_flux = tot_flux * self.lambda_eff**2
         self.mag = -2.5 * numpy.log10(tot_flux) - 48.6
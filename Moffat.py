@@ -1,12 +1,29 @@
 # Moffat
-import astropy.modeling
 import numpy
-from scipy import integrate
 
+import DataCache
 
-def prep_values(scale_size, dim_size, pix_size):
+NQUAD = 48 # Gauss-Legendre points for the integral across the slit
+PROFILE_CHUNK = 2**21 # profile samples moffat_frac evaluates at once
+RADIUS_DECIMALS = 9 # radii on the pixel grid closer than this are the same
+GRID_ENTRIES = 16
+
+_GRIDS = DataCache.LRUCache(maxsize=GRID_ENTRIES)
+
+def clear_cache():
     '''
-    prep_values
+    clear_cache()
+
+    Empties the cache of radius grids.
+    '''
+    _GRIDS.clear()
+
+def prep_samples(scale_size, dim_size, pix_size):
+    '''
+    prep_samples(scale_size, dim_size, pix_size)
+
+    The pixel samples along each axis of the square grid, and the
+    scale size in pixels.
     '''
 
     sc_size = scale_size / pix_size
@@ -16,10 +33,54 @@ def prep_values(scale_size, dim_size, pix_size):
         nsamps += 1
     samps = numpy.linspace(-dim_size/(2*pix_size),  dim_size/(2*pix_size), nsamps)
 
+    return samps, sc_size
+
+def prep_values(scale_size, dim_size, pix_size):
+    '''
+    prep_values
+    '''
+
+    samps, sc_size = prep_samples(scale_size, dim_size, pix_size)
     xs, ys = numpy.meshgrid(samps, samps)
 
     return xs, ys, sc_size
 
+def moffat_gamma(size, beta):
+    '''
+    moffat_gamma(size, beta)
+
+    Turns a FWHM into a Moffat scale size.
+    '''
+    moffat_size = size / numpy.sqrt(2**(1/beta) - 1)
+    moffat_size /= 2
+    return moffat_size
+
+def moffat_amp(gamma, beta):
+    '''
+    moffat_amp(gamma, beta)
+
+    Amplitude that normalizes a 2D Moffat to unit flux.
+    '''
+    return (beta - 1) / (numpy.pi * gamma**2)
+
+def moffat_2d(xs, ys, gamma, beta, amp=1):
+    '''
+    moffat_2d(xs, ys, gamma, beta, amp=1)
+
+    Evaluates a 2D Moffat, same form as astropy's Moffat2D.
+    '''
+    rr_gg = (xs**2 + ys**2) / gamma**2
+    return amp * (1 + rr_gg)**(-beta)
+
+def box_2d(xs, ys, width, height):
+    '''
+    box_2d(xs, ys, width, height)
+
+    1 inside the box and 0 outside, same edges as astropy's Box2D.
+    '''
+    inside = (xs >= -width/2.) & (xs <= width/2.) & (ys >= -height/2.) & (ys <= height/2.)
+    return inside.astype(float)
+
 def make_1d_mod(size, beta, amp=1):
     '''
     make_mod(size, beta, amp=1)
@@ -28,12 +89,10 @@ def make_1d_mod(size, beta, amp=1):
     The size is assuemd to be a FWHM, turns that into a Moffat
     scale size
     '''
-    moffat_size = size / numpy.sqrt(2**(1/beta) - 1)
-    moffat_size /= 2
-    print(f"size scale = {moffat_size:0.3f}")
-    amp_norm = (beta - 1)/  (numpy.pi*moffat_size **2)
-    amp *= amp_norm
-    print(f"scale of amp = {amp_norm:0.4f}")
+    import astropy.modeling
+
+    moffat_size = moffat_gamma(size, beta)
+    amp *= moffat_amp(moffat_size, beta)
     moffat_mod = astropy.modeling.functional_models.Moffat1D(amplitude=amp,
                                                          gamma=moffat_size, alpha=beta)
 
@@ -44,34 +103,75 @@ def make_2d_mod(size, beta, amp=1):
     make_mod(size, beta, amp=1)
     Makes a 2D Moffat
     '''
-    moffat_size = size / numpy.sqrt(2**(1/beta) - 1)
-    moffat_size /= 2
-    amp_norm = (beta - 1)/  (numpy.pi * moffat_size **2)
-    amp *= amp_norm
+    import astropy.modeling
 
+    moffat_size = moffat_gamma(size, beta)
+    amp *= moffat_amp(moffat_size, beta)
     moffat_mod = astropy.modeling.functional_models.Moffat2D(amplitude=amp,
                                                          gamma=moffat_size, alpha=beta)
 
     return moffat_mod
 
+def moffat_slit_frac(size, width, height, beta=3):
+    '''
+    moffat_slit_frac(size, width, height, beta=3)
+
+    Exact fraction of a unit flux Moffat with FWHM size that falls
+    in a width x height box, all in the same units. The integral
+    along the slit is an incomplete beta function and the one
+    across it is done by Gauss-Legendre quadrature, so any of the
+    arguments can be arrays.
+    '''
+    from scipy import special
+
+    size, width, height, beta = numpy.broadcast_arrays(
+        *[numpy.asarray(value, dtype=float) for value in (size, width, height, beta)])
+    gamma = moffat_gamma(size, beta)
+    amp = moffat_amp(gamma, beta)
+
+    nodes, weights = numpy.polynomial.legendre.leggauss(NQUAD)
+    # map [-1, 1] to [0, width/2], the profile is symmetric
+    half = (width / 2.)[..., numpy.newaxis]
+    xs = half * (nodes + 1) / 2.
+    aa = 1 + xs**2 / gamma[..., numpy.newaxis]**2
+    yy = (height / 2.)[..., numpy.newaxis]**2
+    ex = beta[..., numpy.newaxis] - 0.5
+    along = special.betainc(0.5, ex, yy / (aa*gamma[..., numpy.newaxis]**2 + yy))
+    along *= special.beta(0.5, ex) * gamma[..., numpy.newaxis] * aa**(-ex)
+    along *= amp[..., numpy.newaxis]
+
+    # the factor 2 for both halves cancels the 1/2 from the interval
+    frac = numpy.sum(weights * along, axis=-1) * half[..., 0]
+    if frac.ndim == 0:
+        return float(frac)
+    return frac
+
+def moffat_profile(size, width, height, beta=3, pix_size=0.15):
+    '''
+    moffat_profile(size, width, height, beta=3, pix_size=0.15)
+
+    Fraction of a unit flux Moffat with FWHM size that falls in
+    each pixel along a slit of width x height centered on it.
+    '''
+    npix = max(int(round(height / pix_size)), 1)
+    edges = (numpy.arange(npix + 1) - npix/2.) * pix_size
+    # flux between the center of the slit and each edge
+    inner = numpy.sign(edges) * moffat_slit_frac(size, width, 2*numpy.abs(edges), beta=beta) / 2.
+    return numpy.diff(inner)
+
 def moffat_snr(flux, size, beta=3, width=0.75, height=8., pix_size=0.15):
     '''
     moffat_snr
     '''
-    xs, ys, sc_size = prep_values(size, height, pix_size)
-    width /= pix_size
-    height /= pix_size
-
-    moffat_mod = make_2d_mod(sc_size, beta, flux)
+    # the source and background integrals do not depend on the
+    # pixel size, they are done analytically over the slit
+    source_flux = flux * moffat_slit_frac(size, width, height, beta=beta)
 
     background_flux = flux / (1.0/pix_size)**2
     background_flux *= 10
+    sum_background_flux = background_flux * (width/pix_size) * (height/pix_size)
 
-    background = astropy.modeling.models.Const2D(amplitude=background_flux)
-
-    source_flux = integrate.dblquad(moffat_mod, -width/2, width/2, -height/2, height/2)
-    sum_background_flux = integrate.dblquad(background, -width/2, width/2, -height/2, height/2)
-    snr = source_flux[0] / numpy.sqrt(sum_background_flux[0])
+    snr = source_flux / numpy.sqrt(sum_background_flux)
     return snr
 
 def moffat_snr_optimal(flux, size, beta=3, width=0.75, height=8., pix_size=0.15):
@@ -79,20 +179,21 @@ def moffat_snr_optimal(flux, size, beta=3, width=0.75, height=8., pix_size=0.15)
     moffat_snr_optimal
     '''
 
-    xs, ys, sc_size = prep_values(size, height, pix_size)
+    samps, sc_size = prep_samples(size, height, pix_size)
     width /= pix_size
     height /= pix_size
 
-    slit = astropy.modeling.functional_models.Box2D(1, x_width=width, y_width=height)
-    moffat_profile = make_2d_mod(sc_size, beta, 1)*slit
+    # the slit is the product of a mask across it, the columns, and
+    # one along it, the rows
+    in_width = ((samps >= -width/2.) & (samps <= width/2.)).astype(float)
+    in_height = ((samps >= -height/2.) & (samps <= height/2.)).astype(float)
+    gamma = moffat_gamma(sc_size, beta)
+    moffat_mod_eval = moffat_2d(samps[numpy.newaxis, :], samps[:, numpy.newaxis], gamma, beta,
+                                moffat_amp(gamma, beta)) * in_width
     background_flux = 100*flux / (1.0/pix_size)**2
-    background_mod = astropy.modeling.models.Const2D(amplitude=background_flux)*slit
 
-    moffat_mod_eval = moffat_profile(xs, ys)
-    background_mod_eval = background_mod(xs, ys)
-
-    profile = numpy.trapz(moffat_mod_eval, axis=1)
-    background_profile = numpy.trapz(background_mod_eval, axis=1)
+    profile = numpy.trapezoid(moffat_mod_eval, axis=1) * in_height
+    background_profile = numpy.trapezoid(background_flux * in_width) * in_height
 
     weighted_spectrum = flux*profile*profile  / background_profile
     weighted_noise = profile*profile / background_profile
@@ -105,17 +206,79 @@ def moffat_snr_optimal(flux, size, beta=3, width=0.75, height=8., pix_size=0.15)
     snr = source / numpy.sqrt(var)
     return snr
 
+def _radius_counts(height, pix_size):
+    '''
+    _radius_counts(height, pix_size)
+
+    The samples across the grid of a slit length and pixel size, the
+    distinct values of x**2 + y**2 over the samples within the slit
+    length, and for each of those how often it occurs in each column.
+    The profile only depends on x**2 + y**2, which takes few distinct
+    values on the symmetric grid.
+    '''
+    def build():
+        samps, _ = prep_samples(1., height, pix_size)
+        half = height / pix_size / 2.
+        in_height = samps[(samps >= -half) & (samps <= half)]
+        rr = samps[:, numpy.newaxis]**2 + in_height[numpy.newaxis, :]**2
+        _, first, inverse = numpy.unique(numpy.round(rr, RADIUS_DECIMALS), return_index=True,
+                                         return_inverse=True)
+        counts = numpy.zeros((len(first), len(samps)))
+        numpy.add.at(counts, (inverse.reshape(rr.shape),
+                              numpy.arange(len(samps))[:, numpy.newaxis]), 1)
+        return (DataCache.readonly(samps), DataCache.readonly(rr.ravel()[first]),
+                DataCache.readonly(counts))
+    return _GRIDS.get((float(height), float(pix_size)), build)
+
+def _moffat_frac_grid(size, width, beta, height, pix_size):
+    '''
+    _moffat_frac_grid(size, width, beta, height, pix_size)
+
+    moffat_frac for arrays of size, width and beta that share the
+    slit length and pixel size, and so the sample grid.
+    '''
+    samps, radii, counts = _radius_counts(height, pix_size)
+    sc_size = size / pix_size
+
+    # the slit only cuts in x, so sum each column along y once for
+    # every distinct profile, evaluated once per radius, all of them
+    # at once in chunks of PROFILE_CHUNK samples
+    pairs = numpy.stack([sc_size, beta], axis=-1)
+    uniq, index = numpy.unique(pairs, axis=0, return_inverse=True)
+    gamma = moffat_gamma(uniq[:, 0], uniq[:, 1])[:, numpy.newaxis]
+    betas = uniq[:, 1, numpy.newaxis]
+    amps = moffat_amp(gamma, betas)
+    columns = numpy.empty((len(uniq), len(samps)))
+    step = max(PROFILE_CHUNK // len(radii), 1)
+    for start in range(0, len(uniq), step):
+        chunk = slice(start, start + step)
+        prof = amps[chunk] * (1 + radii / gamma[chunk]**2)**(-betas[chunk])
+        columns[chunk] = prof @ counts
+
+    width = width / pix_size
+    in_width = (samps >= -width[:, numpy.newaxis]/2.) & (samps <= width[:, numpy.newaxis]/2.)
+    return numpy.sum(columns[index.ravel()] * in_width, axis=-1)
+
 def moffat_frac(size, width, height, beta=3, pix_size=0.15):
     '''
     moffat_frac
+
+    Fraction of a Moffat with FWHM size that falls in the slit,
+    summed over whole pixel samples. Any of the arguments can be
+    arrays.
     '''
-    xs, ys, sc_size = prep_values(size, height, pix_size)
-    width /= pix_size
-    height /= pix_size
+    size, width, height, beta, pix_size = numpy.broadcast_arrays(
+        *[numpy.asarray(value, dtype=float) for value in (size, width, height, beta, pix_size)])
+    frac = numpy.zeros(size.shape)
 
-    slit = astropy.modeling.functional_models.Box2D(1, x_width=width, y_width=height)
-    moffat_profile = make_2d_mod(sc_size, beta, 1)*slit
-    moffat_mod_eval = moffat_profile(xs, ys)
-    frac = numpy.sum(moffat_mod_eval)
+    # the sample grid is set by the slit length and pixel size
+    grids = numpy.stack([height.ravel(), pix_size.ravel()], axis=-1)
+    uniq, index = numpy.unique(grids, axis=0, return_inverse=True)
+    index = index.reshape(size.shape)
+    for i, (grid_height, grid_pix) in enumerate(uniq):
+        same = index == i
+        frac[same] = _moffat_frac_grid(size[same], width[same], beta[same],
+                                       grid_height, grid_pix)
+    if frac.ndim == 0:
+        return float(frac)
     return frac
-  
\ No newline at end of file
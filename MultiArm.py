@@ -0,0 +1,139 @@
+"""Exposure time calculation for a spectrograph with several arms
+
+The arms see the same source, sky and atmosphere, which the Pipeline
+stages compute once, and only the throughput and detector terms are
+done for each arm. The arm spectra are stitched into one across the
+dichroic crossover.
+"""
+import numpy as np
+
+import ExpCalc
+import InstrumentRegistry
+
+CROSSOVER_STEP = 1.0 # Angstroms, sampling of the throughputs for the crossover
+
+def lris2(telescope, blue_grating="B600", red_grating="R400"):
+    '''
+    lris2(telescope, blue_grating="B600", red_grating="R400")
+
+    The arms of LRIS-2, blue to red.
+    '''
+    return {'blue': InstrumentRegistry.config('lris2_blue', blue_grating, telescope),
+            'red': InstrumentRegistry.config('lris2_red', red_grating, telescope)}
+
+def dichroic_crossover(blue, red, step=CROSSOVER_STEP):
+    '''
+    dichroic_crossover(blue, red, step=CROSSOVER_STEP)
+
+    Wavelength in the overlap of the two arms where the red
+    throughput first reaches the blue one, the middle of the gap if
+    they do not overlap.
+    '''
+    low, high = red.BLUE_CUTOFF, blue.RED_CUTOFF
+    if high <= low:
+        return 0.5*(low + high)
+    blue.read_throughput()
+    red.read_throughput()
+    waves = np.arange(low, high + step, step)
+    blue_eff = np.interp(waves, blue.throughput['wavelength'], blue.throughput['throughput'])
+    red_eff = np.interp(waves, red.throughput['wavelength'], red.throughput['throughput'])
+    redder = np.nonzero(red_eff >= blue_eff)[0]
+    if len(redder) == 0:
+        return high
+    return float(waves[redder[0]])
+
+class MultiArm:
+    '''
+    MultiArm(app_mag, mfilter, seeing, airmass, redshift, template_filename, arms, telescope)
+
+    arms is a dict of name to instrument configuration ordered from blue to red, e.g.
+    from lris2(telescope). Each arm has its own ExpCalc in calcs, whose
+    options are set with configure().
+    '''
+    def __init__(self, app_mag, mfilter, seeing, airmass, redshift, template_filename, arms,
+                 telescope):
+        self.arms = arms
+        self.telescope = telescope
+        self.calcs = {name: ExpCalc.ExpCalc(app_mag, mfilter, seeing, airmass, redshift,
+                                            template_filename, inst, telescope)
+                      for name, inst in arms.items()}
+        names = list(arms)
+        self.crossovers = [dichroic_crossover(arms[blue], arms[red])
+                           for blue, red in zip(names[:-1], names[1:])]
+        self.waves = None
+        self.arm = None
+        self.snr = None
+        self.flux = None
+        self.sky_flux = None
+
+    def __repr__(self):
+        return f'<MultiArm {list(self.arms)}>'
+
+    def configure(self, **flags):
+        '''
+        configure(self, **flags)
+
+        Sets ExpCalc attributes, e.g. lsf=True, on every arm.
+        '''
+        for calc in self.calcs.values():
+            for name, value in flags.items():
+                if not hasattr(calc, name):
+                    raise ValueError(f"ExpCalc has no option {name}")
+                setattr(calc, name, value)
+
+    def compute_spectrum(self, time, slit_length, slit_width):
+        '''
+        compute_spectrum(self, time, slit_length, slit_width)
+
+        Runs every arm and stitches the results into waves, snr, flux
+        and sky_flux, arm names the arm each point comes from.
+        '''
+        for calc in self.calcs.values():
+            calc.compute_spectrum(time, slit_length, slit_width)
+        self.stitch()
+
+    def arm_spectra(self):
+        '''
+        arm_spectra(self)
+
+        The in band wavelengths, SNR, source and sky counts of each arm.
+        '''
+        return {name: (calc.waves[calc.in_band], calc.snr, calc.flux[calc.in_band],
+                       calc.sky_flux)
+                for name, calc in self.calcs.items()}
+
+    def stitch(self):
+        '''
+        stitch(self)
+
+        On the shared template wavelengths the arms are independent
+        measurements, so where they overlap the counts add and the SNR
+        adds in quadrature, each point is labeled with the arm giving
+        the higher SNR. On detector pixels, which differ between the
+        arms, each arm is cut at the dichroic crossover.
+        '''
+        spectra = self.arm_spectra()
+        names = list(spectra)
+        if any(calc.detector for calc in self.calcs.values()):
+            edges = [-np.inf] + self.crossovers + [np.inf]
+            keep = {name: (spectra[name][0] >= edges[i]) & (spectra[name][0] < edges[i + 1])
+                    for i, name in enumerate(names)}
+            self.waves = np.concatenate([spectra[name][0][keep[name]] for name in names])
+            self.arm = np.concatenate([np.full(keep[name].sum(), name) for name in names])
+            self.snr, self.flux, self.sky_flux = [
+                np.concatenate([spectra[name][col][keep[name]] for name in names])
+                for col in (1, 2, 3)]
+            return
+
+        self.waves = np.unique(np.concatenate([spectra[name][0] for name in names]))
+        snr2 = np.zeros((len(names), len(self.waves)))
+        self.flux = np.zeros(len(self.waves))
+        self.sky_flux = np.zeros(len(self.waves))
+        for i, name in enumerate(names):
+            waves, snr, flux, sky = spectra[name]
+            index = np.searchsorted(self.waves, waves)
+            snr2[i, index] = snr**2
+            self.flux[index] += flux
+            self.sky_flux[index] += sky
+        self.snr = np.sqrt(snr2.sum(axis=0))
+        self.arm = np.array(names)[np.argmax(snr2, axis=0)]
@@ -0,0 +1,96 @@
+"""Machine readable output of calculated spectra"""
+import json
+import sys
+
+import numpy as np
+
+FORMATS = ('csv', 'json', 'fits', 'parquet')
+
+def format_from_filename(fn, default='csv'):
+    '''
+    format_from_filename(fn, default='csv')
+    '''
+    if fn is None or fn == '-':
+        return default
+    for fmt in FORMATS:
+        if fn.endswith('.' + fmt) or (fmt == 'fits' and fn.endswith('.fits.gz')):
+            return fmt
+    return default
+
+def write_csv(columns, stream):
+    '''
+    write_csv(columns, stream)
+    '''
+    names = list(columns)
+    stream.write(','.join(names) + '\n')
+    for row in zip(*[columns[name] for name in names]):
+        stream.write(','.join(str(value) for value in row) + '\n')
+
+def write_json(columns, stream):
+    '''
+    write_json(columns, stream)
+
+    One list per column, NaN is written as null.
+    '''
+    data = {}
+    for name, col in columns.items():
+        col = np.asarray(col)
+        if col.dtype.kind == 'f':
+            data[name] = np.where(np.isfinite(col), col, None).tolist()
+        else:
+            data[name] = col.tolist()
+    json.dump(data, stream)
+    stream.write('\n')
+
+def write_fits(columns, fn):
+    '''
+    write_fits(columns, fn)
+    '''
+    import astropy.table
+
+    astropy.table.Table(columns).write(fn, format='fits', overwrite=True)
+
+def write_parquet(columns, fn):
+    '''
+    write_parquet(columns, fn)
+
+    Needs pyarrow.
+    '''
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError("Writing parquet files needs pyarrow") from err
+
+    table = pyarrow.table({name: np.asarray(col) for name, col in columns.items()})
+    pyarrow.parquet.write_table(table, fn)
+
+def write_columns(columns, fn=None, fmt=None):
+    '''
+    write_columns(columns, fn=None, fmt=None)
+
+    Writes a dict of equal length columns. Without a file name, or
+    with '-', csv and json are written to stdout. The format is
+    taken from the file extension unless fmt is given.
+    '''
+    if fmt is None:
+        fmt = format_from_filename(fn)
+    if fmt not in FORMATS:
+        raise ValueError(f"Format {fmt} not supported, use one of {FORMATS}")
+    columns = {name: np.asarray(col) for name, col in columns.items()}
+
+    if fmt in ('fits', 'parquet'):
+        if fn is None or fn == '-':
+            raise ValueError(f"A file name is needed to write {fmt}")
+        if fmt == 'fits':
+            write_fits(columns, fn)
+        else:
+            write_parquet(columns, fn)
+        return
+
+    writer = write_csv if fmt == 'csv' else write_json
+    if fn is None or fn == '-':
+        writer(columns, sys.stdout)
+    else:
+        with open(fn, 'w', encoding='utf-8') as stream:
+            writer(columns, stream)
@@ -0,0 +1,162 @@
+"""Synthetic photometry of many spectra through many filters at once
+
+Mag.compute_ABmag is linear in the spectrum, so for a wavelength grid
+each filter reduces to a weight vector and the magnitudes of a batch
+of spectra through every filter are one matrix product.
+"""
+import os
+
+import numpy as np
+
+import DataCache
+import Mag
+import Resample
+
+FILTER_DIR = os.path.join('data', 'filters')
+WEIGHT_ENTRIES = 64
+
+_WEIGHTS = DataCache.LRUCache(maxsize=WEIGHT_ENTRIES)
+
+def clear_cache():
+    '''
+    clear_cache()
+
+    Empties the cache of filter weights.
+    '''
+    _WEIGHTS.clear()
+
+def trapz_weights(waves):
+    '''
+    trapz_weights(waves)
+
+    Coefficients c with numpy.trapz(waves, x) equal to sum(c*x)
+    along the last axis, the argument order Mag.compute_ABmag uses.
+    '''
+    waves = np.asarray(waves, dtype=float)
+    mid = 0.5*(waves[..., 1:] + waves[..., :-1])
+    coeffs = np.zeros_like(waves)
+    coeffs[..., 1:] += mid
+    coeffs[..., :-1] -= mid
+    return coeffs
+
+def filter_weights(waves, mag):
+    '''
+    filter_weights(waves, mag)
+
+    Weight vector of the filter in mag on waves, which may have any
+    leading shape, e.g. one row per redshift.
+    '''
+    waves = np.asarray(waves, dtype=float)
+    idx, frac = Resample.interp_weights(waves, mag.wave)
+    weight = np.asarray(mag.weight, dtype=float)
+    return (weight[idx]*(1 - frac) + weight[idx + 1]*frac) * trapz_weights(waves)
+
+def to_abmag(mean_flux, lambda_eff):
+    '''
+    to_abmag(mean_flux, lambda_eff)
+
+    AB magnitude from the filter weighted mean flux density in
+    ergs/s/cm^2/Angstrom, as in Mag.compute_ABmag.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fnu = mean_flux / Mag.SPEED_OF_LIGHT * 1e-10 * lambda_eff**2 # convert c to Angstroms
+        return -2.5 * np.log10(fnu) - 48.6
+
+class Photometry:
+    '''
+    Photometry(filters=None, filter_dir=FILTER_DIR)
+
+    A set of filters, all of those in filter_dir by default.
+    '''
+    def __init__(self, filters=None, filter_dir=FILTER_DIR):
+        self.filter_dir = filter_dir
+        if filters is None:
+            filters = DataCache.list_dir(filter_dir)
+        self.mags = []
+        for fn in filters:
+            mag = Mag.Mag()
+            mag.filter_dir = filter_dir
+            mag.read_filter(fn)
+            mag.fn = fn
+            self.mags.append(mag)
+        self.names = [mag.fn for mag in self.mags]
+        self.lambda_eff = np.array([mag.lambda_eff for mag in self.mags])
+
+    def __repr__(self):
+        return f'<Photometry {len(self.mags)} filters>'
+
+    def find(self, mfilter):
+        '''
+        find(self, mfilter)
+
+        Position of the first filter whose name contains mfilter, None
+        if there is none.
+        '''
+        for i, name in enumerate(self.names):
+            if mfilter in name:
+                return i
+        return None
+
+    def index(self, mfilter):
+        '''
+        index(self, mfilter)
+
+        Position of the first filter whose name contains mfilter.
+        '''
+        i = self.find(mfilter)
+        if i is None:
+            raise ValueError(f"No filter {mfilter} in {self!r}")
+        return i
+
+    def weights(self, waves):
+        '''
+        weights(self, waves)
+
+        (nfilter, nwave) weight matrix on the grid waves, cached per
+        grid, and the sum of each row.
+        '''
+        def build():
+            matrix = np.array([filter_weights(waves, mag) for mag in self.mags])
+            return DataCache.readonly(matrix), DataCache.readonly(matrix.sum(axis=1))
+        key = (self.filter_dir, tuple(self.names), Resample.grid_key(waves))
+        return _WEIGHTS.get(key, build)
+
+    def abmags(self, waves, spectra):
+        '''
+        abmags(self, waves, spectra)
+
+        AB magnitudes of spectra, one spectrum or (N, nwave), on the
+        grid waves through every filter. Returns (nfilter,) or
+        (N, nfilter).
+        '''
+        matrix, norm = self.weights(waves)
+        mean_flux = np.asarray(spectra, dtype=float) @ matrix.T / norm
+        return to_abmag(mean_flux, self.lambda_eff)
+
+    def abmag(self, waves, spectra, mfilter):
+        '''
+        abmag(self, waves, spectra, mfilter)
+
+        AB magnitudes through one filter.
+        '''
+        i = self.index(mfilter)
+        matrix, norm = self.weights(waves)
+        mean_flux = np.asarray(spectra, dtype=float) @ matrix[i] / norm[i]
+        return to_abmag(mean_flux, self.lambda_eff[i])
+
+    def scale_to(self, waves, spectra, mfilter, app_mags):
+        '''
+        scale_to(self, waves, spectra, mfilter, app_mags)
+
+        Factors that scale each spectrum to app_mags in mfilter.
+        '''
+        return 10**(0.4*(self.abmag(waves, spectra, mfilter) - np.asarray(app_mags)))
+
+def engine(filter_dir=FILTER_DIR):
+    '''
+    engine(filter_dir=FILTER_DIR)
+
+    Photometry with every filter in filter_dir, built once.
+    '''
+    key = ('photometry',) + DataCache.file_key('dir', filter_dir)[1:]
+    return DataCache.cache().get(key, lambda: Photometry(filter_dir=filter_dir))
@@ -0,0 +1,585 @@
+"""Pure calculation stages with memoized intermediate results
+
+Each stage takes its inputs explicitly and returns read-only arrays,
+results are kept in an LRU keyed by those inputs so a change of, say,
+airmass only recomputes the stages that depend on it.
+"""
+import collections
+
+import numpy as np
+
+import Atmosphere
+import DataCache
+import LineSpread
+import Mag
+import Moffat
+import Photometry
+import Resample
+import Sky
+import SlitLoss
+import Templates
+
+TEMPLATE_DIR = Templates.TEMPLATE_DIR
+MEMO_ENTRIES = 256
+PLANCK = 6.626e-27 # ergs s
+# bisect_time stops when the bracket is this narrow, relative to the time
+SOLVE_RTOL = 1e-13
+SOLVE_ITERATIONS = 200
+
+# optional refinements of the calculation, part of the memo keys
+#   fwhm         convolve the source and sky with a line spread function
+#                of this FWHM in Angstroms
+#   abmag_table  normalize with Templates.abmag instead of integrating
+#   telluric     file of telluric absorption applied with the extinction
+#   chromatic_seeing  the seeing is the zenith value at SlitLoss.SEEING_WAVE
+#                and the slit loss follows it with wavelength and airmass
+Options = collections.namedtuple('Options', ['fwhm', 'abmag_table', 'telluric',
+                                             'chromatic_seeing'],
+                                 defaults=[None, False, None, False])
+DEFAULT_OPTIONS = Options()
+
+_MEMO = DataCache.LRUCache(maxsize=MEMO_ENTRIES)
+
+def memo():
+    '''
+    memo()
+
+    Returns the cache of stage results.
+    '''
+    return _MEMO
+
+def memoize(stage, key, func):
+    '''
+    memoize(stage, key, func)
+
+    Returns the result of func() cached under (stage,) + key.
+    '''
+    return _MEMO.get((stage,) + tuple(key), func)
+
+def find_template(template_filename):
+    '''
+    find_template(template_filename)
+
+    Returns the path of the first template whose name contains
+    template_filename, or None.
+    '''
+    return Templates.find_template(template_filename)
+
+interp_weights = Resample.interp_weights
+
+def interp_rows(x, xp, fp):
+    '''
+    interp_rows(x, xp, fp)
+
+    Linear interpolation like numpy.interp, but x may be 2-D
+    (one row per target).
+    '''
+    idx, frac = interp_weights(x, xp)
+    fp = np.asarray(fp, dtype=float)
+    return fp[idx]*(1 - frac) + fp[idx + 1]*frac
+
+def template_spectrum(template, redshift):
+    '''
+    template_spectrum(template, redshift)
+
+    Observed wavelengths and flux of a template.
+    '''
+    def build():
+        filen = find_template(template)
+        if filen is None:
+            raise ValueError(f"No template found for {template}")
+        rest_waves, rest_flux = DataCache.read_template(filen)
+        waves = DataCache.readonly(np.asarray(rest_waves, dtype=float) * (1 + redshift))
+        return waves, DataCache.readonly(rest_flux, dtype=float)
+    return memoize('template', (template, redshift), build)
+
+def ab_mag(template, mfilter, redshift, table=False):
+    '''
+    ab_mag(template, mfilter, redshift, table=False)
+
+    AB magnitude of the unscaled template through the filter, with
+    table interpolated in the Templates.abmag_table.
+    '''
+    def build():
+        if table:
+            return float(Templates.abmag(template, mfilter, redshift))
+        waves, flux = template_spectrum(template, redshift)
+        phot = Photometry.engine()
+        if phot.find(mfilter) is None:
+            # a filter file given by path, outside of the filter directory
+            return float(Mag.Mag(mfilter).compute_ABmag(waves, flux))
+        return float(phot.abmag(waves, flux, mfilter))
+    return memoize('ab_mag', (template, mfilter, redshift, table), build)
+
+def normalized_flux(template, mfilter, app_mag, redshift):
+    '''
+    normalized_flux(template, mfilter, app_mag, redshift)
+
+    Template flux in ergs/s/cm^2/Angstrom scaled to app_mag.
+    '''
+    def build():
+        _, flux = template_spectrum(template, redshift)
+        scale = 10**(0.4*(ab_mag(template, mfilter, redshift) - app_mag))
+        return DataCache.readonly(flux * scale)
+    return memoize('normalized_flux', (template, mfilter, app_mag, redshift), build)
+
+def slit_loss(seeing, slit_width, slit_length, pix_size):
+    '''
+    slit_loss(seeing, slit_width, slit_length, pix_size)
+    '''
+    return memoize('slit_loss', (seeing, slit_width, slit_length, pix_size),
+                   lambda: SlitLoss.slit_frac(seeing, slit_width, slit_length,
+                                              pix_size=pix_size))
+
+def slit_loss_curve(template, redshift, seeing, airmass, slit_width, slit_length, pix_size):
+    '''
+    slit_loss_curve(template, redshift, seeing, airmass, slit_width, slit_length, pix_size)
+
+    Slit loss on the template wavelengths for a seeing that changes
+    with wavelength and airmass, see SlitLoss.chromatic_slit_frac.
+    '''
+    def build():
+        waves, _ = template_spectrum(template, redshift)
+        return DataCache.readonly(SlitLoss.chromatic_slit_frac(seeing, waves, slit_width,
+                                                               slit_length, airmass=airmass,
+                                                               pix_size=pix_size))
+    return memoize('slit_loss_curve', (template, redshift, seeing, airmass, slit_width,
+                                       slit_length, pix_size), build)
+
+def spatial_profile(seeing, slit_width, slit_length, pix_size):
+    '''
+    spatial_profile(seeing, slit_width, slit_length, pix_size)
+
+    Fraction of the source counts in each spatial pixel along the
+    slit, normalized to sum to one.
+    '''
+    def build():
+        profile = Moffat.moffat_profile(seeing, slit_width, slit_length, pix_size=pix_size)
+        return DataCache.readonly(profile / profile.sum())
+    return memoize('spatial_profile', (seeing, slit_width, slit_length, pix_size), build)
+
+def in_band(template, redshift, inst):
+    '''
+    in_band(template, redshift, inst)
+
+    Flags the template wavelengths between the instrument cutoffs.
+    '''
+    def build():
+        waves, _ = template_spectrum(template, redshift)
+        return DataCache.readonly((waves > inst.BLUE_CUTOFF) & (waves < inst.RED_CUTOFF))
+    return memoize('in_band', (template, redshift, inst.config_key()), build)
+
+def pixel_throughput(inst):
+    '''
+    pixel_throughput(inst)
+
+    Instrument throughput at the centers of the binned detector
+    pixels, the one an InstrumentConfig has precomputed if there is one.
+    '''
+    if getattr(inst, 'pixel_throughput', None) is not None:
+        return inst.pixel_throughput
+    def build():
+        inst.read_throughput()
+        edges = inst.pixel_edges()
+        return DataCache.readonly(np.interp(0.5*(edges[1:] + edges[:-1]),
+                                            inst.throughput['wavelength'],
+                                            inst.throughput['throughput']))
+    return memoize('pixel_throughput', (inst.config_key(),), build)
+
+def throughput(template, redshift, inst):
+    '''
+    throughput(template, redshift, inst)
+
+    Instrument throughput on the template wavelengths, zero
+    outside of the band.
+    '''
+    def build():
+        waves, _ = template_spectrum(template, redshift)
+        inst.read_throughput()
+        curve = Resample.interp(waves, inst.throughput['wavelength'],
+                                inst.throughput['throughput'])
+        curve[~in_band(template, redshift, inst)] = 0.0
+        return DataCache.readonly(curve)
+    return memoize('throughput', (template, redshift, inst.config_key()), build)
+
+def convolved_sky(fwhm, inst, sky_file=Sky.SKY_FILE):
+    '''
+    convolved_sky(fwhm, inst, sky_file=Sky.SKY_FILE)
+
+    Sky spectrum convolved with a line spread function of FWHM fwhm
+    Angstroms within the band. As fwhm follows from the grating, slit
+    width and seeing it is computed once for each of those.
+    '''
+    def build():
+        _, sky_wave, sky_spec = DataCache.read_sky(sky_file)
+        return DataCache.readonly(LineSpread.convolve(sky_wave, sky_spec, fwhm,
+                                                      (inst.BLUE_CUTOFF, inst.RED_CUTOFF)))
+    return memoize('convolved_sky', (fwhm, inst.config_key(), sky_file), build)
+
+def extinction(template, redshift, airmass, telluric_file=None):
+    '''
+    extinction(template, redshift, airmass, telluric_file=None)
+
+    Atmospheric transmission on the template wavelengths.
+    '''
+    def build():
+        waves, _ = template_spectrum(template, redshift)
+        return Atmosphere.atmosphere(telluric_file=telluric_file).curve(waves, airmass)
+    return memoize('extinction', (template, redshift, airmass, telluric_file), build)
+
+def observed_photons(template, redshift, airmass, telluric_file=None, fwhm=None):
+    '''
+    observed_photons(template, redshift, airmass, telluric_file=None, fwhm=None)
+
+    Photons of the unscaled template on its wavelengths after the
+    extinction and telluric absorption. With fwhm the result is
+    convolved with a line spread function of FWHM fwhm Angstroms, so
+    the absorption lines are seen at the instrument resolution too.
+    '''
+    def build():
+        waves, flux = template_spectrum(template, redshift)
+        c = Mag.SPEED_OF_LIGHT * 1e10 # convert to Angstroms
+        photons = flux * waves / (PLANCK * c)  # h is in ergs s, c is in Angstroms s^-1
+        photons *= extinction(template, redshift, airmass, telluric_file)
+        if fwhm is not None:
+            photons = LineSpread.convolve(waves, photons, fwhm)
+        return DataCache.readonly(photons)
+    return memoize('observed_photons', (template, redshift, airmass, telluric_file, fwhm), build)
+
+def normalization(template, mfilter, app_mag, redshift, seeing, slit_width, slit_length,
+                  inst, telescope, options=DEFAULT_OPTIONS, airmass=1.0):
+    '''
+    normalization(template, mfilter, app_mag, redshift, seeing, slit_width, slit_length,
+                  inst, telescope, options=DEFAULT_OPTIONS, airmass=1.0)
+
+    Scale from the template to the flux through the slit collected
+    by the telescope. With options.chromatic_seeing it is an array
+    on the template wavelengths.
+    '''
+    abs_mag = ab_mag(template, mfilter, redshift, options.abmag_table)
+    scale = 10**(0.4*(abs_mag - app_mag))
+    if options.chromatic_seeing:
+        scale = scale * slit_loss_curve(template, redshift, seeing, airmass, slit_width,
+                                        slit_length, inst.scale_perp)
+    else:
+        scale *= slit_loss(seeing, slit_width, slit_length, inst.scale_perp)
+    return scale * telescope.area
+
+def source_photons(template, mfilter, app_mag, redshift, seeing, airmass, slit_width,
+                   slit_length, inst, telescope, options=DEFAULT_OPTIONS):
+    '''
+    source_photons(template, mfilter, app_mag, redshift, seeing, airmass, slit_width,
+                   slit_length, inst, telescope, options=DEFAULT_OPTIONS)
+
+    Source photons per second through the atmosphere and the slit on
+    the template wavelengths, before the instrument throughput. With
+    options.fwhm they are convolved after the atmosphere. Only
+    the pixel scale of inst enters, so the arms of a spectrograph
+    with the same scale share it.
+    '''
+    key = (template, mfilter, app_mag, redshift, seeing, airmass, slit_width, slit_length,
+           inst.scale_perp, telescope.area, options)
+    def build():
+        photons = observed_photons(template, redshift, airmass, options.telluric, options.fwhm)
+        photons = photons * normalization(template, mfilter, app_mag, redshift, seeing,
+                                          slit_width, slit_length, inst, telescope, options,
+                                          airmass)
+        return DataCache.readonly(photons)
+    return memoize('source_photons', key, build)
+
+def source_rate(template, mfilter, app_mag, redshift, seeing, airmass, slit_width, slit_length,
+                inst, telescope, options=DEFAULT_OPTIONS):
+    '''
+    source_rate(template, mfilter, app_mag, redshift, seeing, airmass, slit_width, slit_length,
+                inst, telescope, options=DEFAULT_OPTIONS)
+
+    Detected source counts per second on the template wavelengths.
+    '''
+    key = (template, mfilter, app_mag, redshift, seeing, airmass, slit_width, slit_length,
+           inst.config_key(), telescope.area, options)
+    def build():
+        rate = source_photons(template, mfilter, app_mag, redshift, seeing, airmass,
+                              slit_width, slit_length, inst, telescope, options)
+        return DataCache.readonly(rate * throughput(template, redshift, inst))
+    return memoize('source_rate', key, build)
+
+def sky_rate(template, redshift, slit_width, slit_length, inst, sky_file=Sky.SKY_FILE,
+             options=DEFAULT_OPTIONS):
+    '''
+    sky_rate(template, redshift, slit_width, slit_length, inst, sky_file=Sky.SKY_FILE,
+             options=DEFAULT_OPTIONS)
+
+    Detected sky counts per second in the slit on the template
+    wavelengths, zero outside of the band. With options.fwhm the sky
+    is convolved to the instrument resolution first.
+    '''
+    fwhm = options.fwhm
+    key = (template, redshift, slit_width, slit_length, inst.config_key(), sky_file, fwhm)
+    def build():
+        waves, _ = template_spectrum(template, redshift)
+        _, sky_wave, sky_spec = DataCache.read_sky(sky_file)
+        if fwhm is not None:
+            sky_spec = convolved_sky(fwhm, inst, sky_file)
+        sky_band = (sky_wave > inst.BLUE_CUTOFF) & (sky_wave < inst.RED_CUTOFF)
+        rate = Resample.interp(waves, sky_wave[sky_band], sky_spec[sky_band])
+        # e-/s/Ang/arcsec^2 to e-/s/pix for the slit
+        rate *= slit_width * inst.Ang_per_pix * slit_length
+        rate *= throughput(template, redshift, inst)
+        return DataCache.readonly(rate)
+    return memoize('sky_rate', key, build)
+
+def detector_rates(template, mfilter, app_mag, redshift, seeing, airmass, slit_width,
+                   slit_length, inst, telescope, sky_file=Sky.SKY_FILE, options=DEFAULT_OPTIONS):
+    '''
+    detector_rates(template, mfilter, app_mag, redshift, seeing, airmass, slit_width,
+                   slit_length, inst, telescope, sky_file=Sky.SKY_FILE, options=DEFAULT_OPTIONS)
+
+    Source and sky counts per second in each binned detector pixel,
+    rebinned from the template wavelengths conserving flux. Returns
+    the pixel centers, source and sky.
+    '''
+    key = (template, mfilter, app_mag, redshift, seeing, airmass, slit_width, slit_length,
+           inst.config_key(), telescope.area, sky_file, options)
+    def build():
+        waves, _ = template_spectrum(template, redshift)
+        edges = inst.pixel_edges()
+        dwave = np.diff(edges)
+        rebin = Resample.rebin_operator(Resample.bin_edges(waves), edges)
+        source = source_rate(template, mfilter, app_mag, redshift, seeing, airmass,
+                             slit_width, slit_length, inst, telescope, options)
+        # the sky rate is per unbinned pixel, the source per Angstrom
+        sky = sky_rate(template, redshift, slit_width, slit_length, inst, sky_file, options)
+        sky_pix = Resample.apply(rebin, sky) * dwave / inst.Ang_per_pix
+        centers = 0.5*(edges[1:] + edges[:-1])
+        return (DataCache.readonly(centers),
+                DataCache.readonly(Resample.apply(rebin, source) * dwave),
+                DataCache.readonly(sky_pix))
+    return memoize('detector_rates', key, build)
+
+def detector_in_band(template, redshift, inst):
+    '''
+    detector_in_band(template, redshift, inst)
+
+    Flags the binned detector pixels that lie entirely within the
+    template bins between the cutoffs. Pixels at the ends of the band,
+    or beyond the end of the template, get only part of their counts.
+    '''
+    def build():
+        waves, _ = template_spectrum(template, redshift)
+        inside = in_band(template, redshift, inst)
+        edges = inst.pixel_edges()
+        if not inside.any():
+            return DataCache.readonly(np.zeros(len(edges) - 1, dtype=bool))
+        covered = Resample.bin_edges(waves)[np.flatnonzero(inside)[[0, -1]] + [0, 1]]
+        return DataCache.readonly((edges[:-1] >= covered[0]) & (edges[1:] <= covered[1]))
+    return memoize('detector_in_band', (template, redshift, inst.config_key()), build)
+
+def noise_npix(slit_length):
+    '''
+    noise_npix(slit_length)
+
+    Number of pixels the dark current and read noise come from.
+    '''
+    npix = int(slit_length)
+    if npix < 2:
+        npix = 2
+    return npix
+
+def boxcar_variance(source, sky, time, npix, dark, read):
+    '''
+    boxcar_variance(source, sky, time, npix, dark, read)
+
+    Variance of the source counts summed over npix spatial pixels,
+    dark and read are the dark rate and read variance of one pixel.
+    '''
+    noise = source * time + sky * time
+    noise += npix*dark*time
+    noise += npix*read
+    return noise
+
+def optimal_variance(source, sky, time, profile, dark, read):
+    '''
+    optimal_variance(source, sky, time, profile, dark, read)
+
+    Variance of the source counts from an optimal (Horne 1986)
+    extraction, 1/sum(profile**2/variance) over the spatial pixels.
+    The sky is spread evenly along the slit, dark and read are the
+    dark rate and read variance of one pixel. profile is (nspatial,)
+    or one row per spectrum, the loop is over the spatial pixels so
+    every wavelength is done at once. It is never more than the
+    boxcar_variance with npix=nspatial, the sum over the same pixels.
+    '''
+    profile = np.asarray(profile, dtype=float)
+    nspatial = profile.shape[-1]
+    background = sky / nspatial + dark
+    inverse = 0.0
+    for i in range(nspatial):
+        frac = profile[..., i, np.newaxis]
+        inverse = inverse + frac**2 / ((source*frac + background)*time + read)
+    return 1.0 / inverse
+
+def noise_model(source, sky, time, slit_length, inst, bind=1, profile=None):
+    '''
+    noise_model(source, sky, time, slit_length, inst, bind=1, profile=None)
+
+    Returns the signal, variance and SNR for count rates observed
+    for time seconds. bind pixels along the dispersion are binned
+    together in each output pixel. With a spatial profile the SNR is
+    that of an optimal extraction instead of a sum over the slit.
+
+    The two do not charge the same pixels. The sum takes the dark
+    current and read noise of noise_npix(slit_length) pixels, the
+    calculator's original model, the optimal extraction those of every
+    pixel of the profile, len(profile) = slit_length/scale_perp, so at
+    low counts it can come out below the sum. Compared with
+    boxcar_variance over the same pixels it is never worse.
+    '''
+    signal = source * time
+    if profile is not None:
+        noise = optimal_variance(source, sky, time, profile, inst.dark*bind, inst.readnoise**2)
+        return signal, noise, signal / np.sqrt(noise)
+    noise = boxcar_variance(source, sky, time, noise_npix(slit_length), inst.dark*bind,
+                            inst.readnoise**2)
+    return signal, noise, signal / np.sqrt(noise)
+
+class RateSpectrum:
+    '''
+    RateSpectrum(waves, source, sky, npix, dark, readnoise, in_band=None, profile=None,
+                 nres=1)
+
+    Per second source and sky counts, from which the SNR for any
+    exposure time follows without redoing the calculation. source
+    and sky may be 1-D or (N, nwave), with in_band the SNR is NaN
+    where it is False. With a spatial profile, (nspatial,) or
+    (N, nspatial), the SNR is that of an optimal extraction of nres
+    combined pixels.
+    '''
+    def __init__(self, waves, source, sky, npix, dark, readnoise, in_band=None, profile=None,
+                 nres=1):
+        self.waves = waves
+        self.source = np.asarray(source, dtype=float)
+        self.sky = np.asarray(sky, dtype=float)
+        self.npix = npix
+        self.dark = dark
+        self.readnoise = readnoise
+        self.in_band = in_band
+        self.profile = profile
+        self.nres = nres
+        # the variance is rate*time + read
+        self.rate = self.source + self.sky + npix*dark
+        self.read = npix*readnoise**2
+
+    def __repr__(self):
+        return f'<RateSpectrum {self.source.shape}>'
+
+    def combine(self, nres):
+        '''
+        combine(self, nres)
+
+        The rates summed over nres pixels, e.g. those of one
+        resolution element.
+        '''
+        return RateSpectrum(self.waves, self.source*nres, self.sky*nres, self.npix*nres,
+                            self.dark, self.readnoise, in_band=self.in_band,
+                            profile=self.profile, nres=self.nres*nres)
+
+    def with_rates(self, waves, source, sky, in_band=None):
+        '''
+        with_rates(self, waves, source, sky, in_band=None)
+
+        A RateSpectrum with the noise terms of this one for other
+        source and sky rates, e.g. a few wavelengths or a band average.
+        '''
+        return RateSpectrum(waves, source, sky, self.npix, self.dark, self.readnoise,
+                            in_band=in_band, profile=self.profile, nres=self.nres)
+
+    def snr(self, times, nexp=1):
+        '''
+        snr(self, times, nexp=1)
+
+        SNR of nexp coadded exposures of times seconds each. times and
+        nexp broadcast against each other and their shape is prepended
+        to the shape of the spectrum.
+        '''
+        times, nexp = np.broadcast_arrays(np.asarray(times, dtype=float),
+                                          np.asarray(nexp, dtype=float))
+        extra = (1,) * self.source.ndim
+        return self.snr_at(times.reshape(times.shape + extra), nexp.reshape(nexp.shape + extra))
+
+    def snr_at(self, times, nexp=1):
+        '''
+        snr_at(self, times, nexp=1)
+
+        SNR for times and nexp that broadcast against the spectrum,
+        e.g. a different time at each wavelength.
+        '''
+        if self.profile is None:
+            variance = self.rate*times + self.read
+        else:
+            variance = optimal_variance(self.source, self.sky, times, self.profile,
+                                        self.nres*self.dark, self.nres*self.readnoise**2)
+        snr = self.source * times * np.sqrt(nexp) / np.sqrt(variance)
+        if self.in_band is not None:
+            snr = np.where(self.in_band, snr, np.nan)
+        return snr
+
+    def time_for_snr(self, snr, nexp=1):
+        '''
+        time_for_snr(self, snr, nexp=1)
+
+        Exposure time at each wavelength for nexp coadded exposures to
+        reach snr, the inverse of snr_at. Summed over the slit the
+        variance is rate*time + read and the time is the root of a
+        quadratic. The optimal extraction is solved with bisect_time
+        between the boxcar over its pixels, which is slower, and the
+        same extraction without read noise, which is faster. Zero
+        source rates give an infinite time, NaN where not in_band.
+        '''
+        snr2 = np.asarray(snr, dtype=float)**2 / np.asarray(nexp, dtype=float)
+        positive = self.source > 0
+        source = np.where(positive, self.source, 1.0)
+        if self.profile is None:
+            time = _quadratic_time(snr2, source, self.rate, self.read)
+        else:
+            nspatial = np.shape(self.profile)[-1]
+            dark = self.nres*self.dark
+            read = self.nres*self.readnoise**2
+            slowest = _quadratic_time(snr2, source, source + self.sky + nspatial*dark,
+                                      nspatial*read)
+            fastest = snr2 * optimal_variance(source, self.sky, 1.0, self.profile,
+                                              dark, 0.0) / source**2
+            target = np.sqrt(snr2)
+            rates = self.with_rates(self.waves, source, self.sky)
+            time = bisect_time(lambda time: rates.snr_at(time), target, fastest, slowest)
+        time = np.where(positive, time, np.inf)
+        if self.in_band is not None:
+            time = np.where(self.in_band, time, np.nan)
+        return time
+
+def _quadratic_time(snr2, source, rate, read):
+    # snr2 = (source t)**2 / (rate t + read)
+    quad_b = snr2 * rate
+    return (quad_b + np.sqrt(quad_b**2 + 4*source**2*snr2*read)) / (2*source**2)
+
+def bisect_time(func, target, low, high):
+    '''
+    bisect_time(func, target, low, high)
+
+    Time where func(time), increasing with time and evaluated
+    elementwise, equals target, with low and high times on either
+    side of it. The bisection is on the logarithm of the time so the
+    relative accuracy is SOLVE_RTOL whatever the range.
+    '''
+    low, high, target = np.broadcast_arrays(np.asarray(low, dtype=float),
+                                            np.asarray(high, dtype=float),
+                                            np.asarray(target, dtype=float))
+    low = low.copy()
+    high = high.copy()
+    for _ in range(SOLVE_ITERATIONS):
+        if np.all(high <= low * (1 + SOLVE_RTOL)):
+            break
+        mid = np.sqrt(low * high)
+        below = func(mid) < target
+        low = np.where(below, mid, low)
+        high = np.where(below, high, mid)
+    return np.sqrt(low * high)
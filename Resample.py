@@ -0,0 +1,165 @@
+"""Resampling of spectra with cached sparse operators
+
+An operator maps values on one wavelength grid to another. It is built
+once per pair of grids and applied to a batch of spectra as one sparse
+matrix product.
+"""
+import hashlib
+
+import numpy as np
+
+import DataCache
+
+OPERATOR_ENTRIES = 128
+
+_OPERATORS = DataCache.LRUCache(maxsize=OPERATOR_ENTRIES)
+
+def operators():
+    '''
+    operators()
+
+    Returns the cache of operators.
+    '''
+    return _OPERATORS
+
+def clear_cache():
+    '''
+    clear_cache()
+
+    Empties the cache of resampling operators.
+    '''
+    _OPERATORS.clear()
+
+def grid_key(grid):
+    '''
+    grid_key(grid)
+
+    Hashable key for a wavelength grid.
+    '''
+    grid = np.ascontiguousarray(grid, dtype=float)
+    return (len(grid), hashlib.sha1(grid.tobytes()).hexdigest())
+
+def interp_weights(x, xp):
+    '''
+    interp_weights(x, xp)
+
+    Returns the lower index and fractional distance of each x
+    between the points xp, values outside xp are clamped to the
+    end points like numpy.interp.
+    '''
+    x = np.asarray(x, dtype=float)
+    xp = np.asarray(xp, dtype=float)
+    idx = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+    frac = (x - xp[idx]) / (xp[idx + 1] - xp[idx])
+    np.clip(frac, 0, 1, out=frac)
+    return idx, frac
+
+def build_interp(x_from, x_to):
+    '''
+    build_interp(x_from, x_to)
+
+    Sparse (len(x_to), len(x_from)) matrix doing the linear
+    interpolation of numpy.interp.
+    '''
+    from scipy import sparse
+
+    x_to = np.asarray(x_to, dtype=float)
+    idx, frac = interp_weights(x_to, x_from)
+    rows = np.arange(len(x_to))
+    matrix = sparse.csr_matrix((np.concatenate((1 - frac, frac)),
+                                (np.concatenate((rows, rows)), np.concatenate((idx, idx + 1)))),
+                               shape=(len(x_to), len(x_from)))
+    return matrix
+
+def bin_edges(centers):
+    '''
+    bin_edges(centers)
+
+    Edges half way between the bin centers, the outer edges are
+    extrapolated.
+    '''
+    centers = np.asarray(centers, dtype=float)
+    edges = np.empty(len(centers) + 1)
+    edges[1:-1] = 0.5*(centers[1:] + centers[:-1])
+    edges[0] = centers[0] - (edges[1] - centers[0])
+    edges[-1] = centers[-1] + (centers[-1] - edges[-2])
+    return edges
+
+def build_rebin(edges_from, edges_to, density=True):
+    '''
+    build_rebin(edges_from, edges_to, density=True)
+
+    Sparse flux conserving rebinning matrix between bins with the
+    given edges. With density the values are per unit wavelength
+    and each output is the overlap weighted mean, otherwise they
+    are counts per bin and are split by overlap.
+    '''
+    from scipy import sparse
+
+    edges_from = np.asarray(edges_from, dtype=float)
+    edges_to = np.asarray(edges_to, dtype=float)
+    # every output bin overlaps the input bins from first to last
+    first = np.clip(np.searchsorted(edges_from, edges_to[:-1], side='right') - 1,
+                    0, len(edges_from) - 2)
+    last = np.clip(np.searchsorted(edges_from, edges_to[1:], side='left') - 1,
+                   0, len(edges_from) - 2)
+    last = np.maximum(last, first)
+    counts = last - first + 1
+    rows = np.repeat(np.arange(len(edges_to) - 1), counts)
+    cols = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    low = np.maximum(edges_from[cols], edges_to[rows])
+    high = np.minimum(edges_from[cols + 1], edges_to[rows + 1])
+    overlap = np.clip(high - low, 0, None)
+    if density:
+        weights = overlap / (edges_to[rows + 1] - edges_to[rows])
+    else:
+        weights = overlap / (edges_from[cols + 1] - edges_from[cols])
+    return sparse.csr_matrix((weights, (rows, cols)),
+                             shape=(len(edges_to) - 1, len(edges_from) - 1))
+
+def interp_operator(x_from, x_to):
+    '''
+    interp_operator(x_from, x_to)
+
+    Cached build_interp.
+    '''
+    key = ('interp', grid_key(x_from), grid_key(x_to))
+    return _OPERATORS.get(key, lambda: build_interp(x_from, x_to))
+
+def rebin_operator(edges_from, edges_to, density=True):
+    '''
+    rebin_operator(edges_from, edges_to, density=True)
+
+    Cached build_rebin.
+    '''
+    key = ('rebin', grid_key(edges_from), grid_key(edges_to), density)
+    return _OPERATORS.get(key, lambda: build_rebin(edges_from, edges_to, density))
+
+def apply(operator, spectra):
+    '''
+    apply(operator, spectra)
+
+    Applies an operator to one spectrum, or to each row of an
+    (N, nwave) array of spectra.
+    '''
+    spectra = np.asarray(spectra, dtype=float)
+    if spectra.ndim == 1:
+        return operator @ spectra
+    return np.asarray((operator @ spectra.T).T)
+
+def interp(x_to, x_from, values):
+    '''
+    interp(x_to, x_from, values)
+
+    numpy.interp(x_to, x_from, values) through a cached operator,
+    values may be (N, len(x_from)).
+    '''
+    return apply(interp_operator(x_from, x_to), values)
+
+def rebin(edges_to, edges_from, values, density=True):
+    '''
+    rebin(edges_to, edges_from, values, density=True)
+
+    Flux conserving rebinning through a cached operator.
+    '''
+    return apply(rebin_operator(edges_from, edges_to, density), values)
@@ -1,15 +1,18 @@
 import os
-import numpy as np
-import astropy.io.fits
+
+import DataCache
+
+SKY_DIR = 'data/sky'
+SKY_FILE = os.path.join(SKY_DIR, 'sky.eps_pang_parcsec_onemicron.fits')
 
 class Sky:
 
     def __init__(self):
 
-        self.sky_dir = 'data/sky'
+        self.sky_dir = SKY_DIR
         #self.bfn = os.path.join(self.sky_dir,'bsky.eps_pang_parcsec.fits')
         #self.rfn = os.path.join(self.sky_dir,'rsky.eps_pang_parcsec_onemicron.fits')
-        self.fn = os.path.join(self.sky_dir,'sky.eps_pang_parcsec_onemicron.fits')
+        self.fn = SKY_FILE
         # note this in e-/s/Ang/arcsec^2  
     
         #self.bpix, self.bwave, self.bspec = self.read_spec(self.bfn)
@@ -20,11 +23,9 @@ class Sky:
 
     def read_spec(self, fn):
 
-        spec_hdu = astropy.io.fits.open(fn)
-        hdr = spec_hdu[0].header
-        spec = spec_hdu[0].data
-        pix = np.arange(0,len(spec))
-        wave =  hdr['CRVAL1'] + pix*hdr['CDELT1']
+        pix, wave, spec = DataCache.read_sky(fn)
+        # the cached spectrum is read-only, rescale works on a copy
+        spec = spec.copy()
 
         return pix, wave, spec
 
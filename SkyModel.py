@@ -0,0 +1,145 @@
+"""Sky brightness for the observing conditions from a few basis spectra
+
+The sky is a linear combination of the dark sky spectrum and two
+spectra of scattered sunlight, one Rayleigh and one Mie scattered.
+The moon adds both scattered components and twilight adds Rayleigh
+scattered light. The coefficients follow the V band moonlight model of
+Krisciunas & Schaefer (1991, PASP 103, 1033), so the wavelength
+dependence of the extinction is not carried into the coefficients.
+Each basis spectrum is normalized to the V band brightness of the dark
+sky at the zenith, so a coefficient is the ratio of V band brightness.
+"""
+import numpy as np
+
+import Atmosphere
+import DataCache
+import Mag
+import Photometry
+import Sky
+
+V_FILTER = 'Bessell_V'
+V_WAVE = 5500.0 # Angstroms, where the extinction is taken for the V band
+DARK_V_MAG = 21.9 # V mag/arcsec^2 of the dark sky at the zenith on Mauna Kea
+SUN_TEMPERATURE = 5777.0 # K, the scattered light is a black body
+HC_OVER_K = 1.4388e8 # Angstrom K
+MIE_EXPONENT = 1.3 # aerosol scattering goes as wavelength**-MIE_EXPONENT
+# twilight at the zenith, TWILIGHT_V_MAG at a sun altitude of TWILIGHT_ALT
+# getting fainter by TWILIGHT_SLOPE mag per degree, none below TWILIGHT_END
+TWILIGHT_V_MAG = 17.5
+TWILIGHT_ALT = -12.0
+TWILIGHT_SLOPE = 1.25
+TWILIGHT_END = -18.0
+BASIS_NAMES = ('dark', 'rayleigh', 'mie')
+
+def nanolamberts(v_mag):
+    '''
+    nanolamberts(v_mag)
+
+    Surface brightness in nanoLamberts of V mag/arcsec^2.
+    '''
+    return 34.08 * np.exp(20.7233 - 0.92104 * np.asarray(v_mag))
+
+def ks_airmass(zenith_distance):
+    '''
+    ks_airmass(zenith_distance)
+
+    Airmass at zenith_distance in degrees that Krisciunas & Schaefer
+    use, finite down to the horizon.
+    '''
+    return (1 - 0.96 * np.sin(np.radians(zenith_distance))**2)**-0.5
+
+def moon_phase_angle(illumination):
+    '''
+    moon_phase_angle(illumination)
+
+    Phase angle in degrees of the moon, 0 when full, from the
+    illuminated fraction.
+    '''
+    return np.degrees(np.arccos(np.clip(2*np.asarray(illumination, dtype=float) - 1, -1, 1)))
+
+def scattered_light(waves, exponent):
+    '''
+    scattered_light(waves, exponent)
+
+    Photon spectrum of the sun scattered with an efficiency going
+    as waves**-exponent.
+    '''
+    waves = np.asarray(waves, dtype=float)
+    return waves**(-4 - exponent) / np.expm1(HC_OVER_K / (waves * SUN_TEMPERATURE))
+
+class SkyModel:
+    '''
+    SkyModel(sky_file=Sky.SKY_FILE, extinction_file=Atmosphere.EXTINCTION_FILE)
+
+    Basis spectra on the wavelengths of the dark sky in sky_file.
+    '''
+    def __init__(self, sky_file=Sky.SKY_FILE, extinction_file=Atmosphere.EXTINCTION_FILE):
+        self.sky_file = sky_file
+        _, wave, dark = DataCache.read_sky(sky_file)
+        self.wave = wave
+        weights = Photometry.filter_weights(wave, Mag.Mag(V_FILTER))
+        basis = np.array([dark, scattered_light(wave, 4.0), scattered_light(wave, MIE_EXPONENT)],
+                         dtype=float)
+        basis *= (weights @ basis[0] / (weights @ basis.T))[:, np.newaxis]
+        self.basis = DataCache.readonly(basis)
+        self.names = BASIS_NAMES
+        ext_wave, ext_mag = DataCache.read_atmosphere(extinction_file)
+        self.k_v = float(np.interp(V_WAVE, ext_wave, ext_mag))
+
+    def __repr__(self):
+        return f'<SkyModel {self.sky_file}>'
+
+    def coefficients(self, airmass, moon_illumination=0.0, moon_separation=90.0,
+                     moon_altitude=-90.0, sun_altitude=-90.0):
+        '''
+        coefficients(self, airmass, moon_illumination=0.0, moon_separation=90.0,
+                     moon_altitude=-90.0, sun_altitude=-90.0)
+
+        (N, 3) weights of the basis spectra for N pointings, the
+        parameters are broadcast against each other. Angles are in
+        degrees, moon_illumination is the illuminated fraction.
+        '''
+        airmass, illumination, separation, moon_alt, sun_alt = np.broadcast_arrays(
+            *[np.atleast_1d(np.asarray(value, dtype=float)) for value in
+              (airmass, moon_illumination, moon_separation, moon_altitude, sun_altitude)])
+        coeffs = np.zeros(airmass.shape + (len(BASIS_NAMES),))
+
+        # the dark sky brightens with airmass, less the extinction
+        coeffs[..., 0] = airmass * 10**(-0.4*self.k_v*(airmass - 1))
+
+        # moonlight, in units of the dark sky at the zenith
+        alpha = moon_phase_angle(illumination)
+        moon = 10**(-0.4*(3.84 + 0.026*alpha + 4e-9*alpha**4))
+        moon *= 10**(-0.4*self.k_v*ks_airmass(90 - moon_alt)) * (1 - 10**(-0.4*self.k_v*airmass))
+        moon = np.where(moon_alt > 0, moon, 0.0) / nanolamberts(DARK_V_MAG)
+        rho = np.radians(separation)
+        coeffs[..., 1] = moon * 10**5.36 * (1.06 + np.cos(rho)**2)
+        coeffs[..., 2] = moon * 10**(6.15 - separation/40)
+
+        # twilight
+        twilight = TWILIGHT_V_MAG + TWILIGHT_SLOPE*(TWILIGHT_ALT - sun_alt)
+        coeffs[..., 1] += np.where(sun_alt > TWILIGHT_END,
+                                   10**(-0.4*(twilight - DARK_V_MAG)), 0.0)
+        return coeffs
+
+    def spectra(self, airmass, moon_illumination=0.0, moon_separation=90.0,
+                moon_altitude=-90.0, sun_altitude=-90.0):
+        '''
+        spectra(self, airmass, moon_illumination=0.0, moon_separation=90.0,
+                moon_altitude=-90.0, sun_altitude=-90.0)
+
+        (N, nwave) sky spectra on self.wave in the units of the dark
+        sky spectrum, one for each pointing.
+        '''
+        return self.coefficients(airmass, moon_illumination, moon_separation,
+                                 moon_altitude, sun_altitude) @ self.basis
+
+def model(sky_file=Sky.SKY_FILE, extinction_file=Atmosphere.EXTINCTION_FILE):
+    '''
+    model(sky_file=Sky.SKY_FILE, extinction_file=Atmosphere.EXTINCTION_FILE)
+
+    SkyModel for the files, built once.
+    '''
+    key = (('sky_model',) + DataCache.file_key('sky', sky_file)[1:] +
+           Atmosphere.files_key(extinction_file))
+    return DataCache.cache().get(key, lambda: SkyModel(sky_file, extinction_file))
@@ -0,0 +1,223 @@
+"""Precomputed slit losses for a Moffat seeing profile"""
+import argparse
+import itertools
+import os
+
+import numpy as np
+
+import DataCache
+import InstrumentRegistry
+import Moffat
+
+TABLE_DIR = 'data/slitloss'
+TABLE_FILE = os.path.join(TABLE_DIR, 'moffat_slit_table.npz')
+
+SEEING = np.round(np.arange(0.3, 3.01, 0.1), 2)
+WIDTH = np.round(np.arange(0.3, 2.01, 0.1), 2)
+LENGTH = np.array([2., 4., 6., 8., 10., 12., 16., 20.])
+BETA = np.array([2.5, 3., 3.5, 4., 4.5])
+AXES = ('seeing', 'width', 'length', 'beta', 'pix_size')
+# the pixel scales are those of the instruments, not samples of a
+# smooth function, other scales are not interpolated between them
+DISCRETE_AXES = ('pix_size',)
+# offsets of the corners of a table cell, for the interpolation
+CORNERS = np.array(list(itertools.product((0, 1), repeat=len(AXES))))
+
+# seeing is quoted at the zenith at SEEING_WAVE and goes as
+# wavelength**SEEING_EXPONENT * airmass**AIRMASS_EXPONENT
+SEEING_WAVE = 5000.0
+SEEING_EXPONENT = -0.2
+AIRMASS_EXPONENT = 0.6
+CURVE_SEEING = np.geomspace(0.05, 10.0, 512)
+CURVE_ENTRIES = 64
+
+_CURVES = DataCache.LRUCache(maxsize=CURVE_ENTRIES)
+
+def clear_cache():
+    '''
+    clear_cache()
+
+    Empties the cache of slit loss curves.
+    '''
+    _CURVES.clear()
+
+def instrument_pix_sizes():
+    '''
+    instrument_pix_sizes()
+
+    The spatial pixel scales of the supported instruments, these
+    are the pixel axis of the table so lookups for them are exact.
+    '''
+    sizes = set()
+    for mode in InstrumentRegistry.modes():
+        sizes.add(round(InstrumentRegistry.config(mode).scale_perp, 6))
+    return np.array(sorted(sizes))
+
+def build_table(fn=TABLE_FILE, seeing=SEEING, width=WIDTH, length=LENGTH, beta=BETA,
+                pix_size=None):
+    '''
+    build_table(fn=TABLE_FILE, seeing=SEEING, width=WIDTH, length=LENGTH, beta=BETA,
+                pix_size=None)
+
+    Evaluates Moffat.moffat_frac on the grid and saves it to fn.
+    '''
+    if pix_size is None:
+        pix_size = instrument_pix_sizes()
+    grid = [np.asarray(axis, dtype=float) for axis in (seeing, width, length, beta, pix_size)]
+    mesh = np.meshgrid(*grid, indexing='ij')
+    frac = Moffat.moffat_frac(mesh[0], mesh[1], mesh[2], beta=mesh[3], pix_size=mesh[4])
+
+    dirn = os.path.dirname(fn)
+    if dirn:
+        os.makedirs(dirn, exist_ok=True)
+    np.savez_compressed(fn, frac=frac, **dict(zip(AXES, grid)))
+    return fn
+
+class SlitLossTable:
+    '''
+    SlitLossTable(fn=TABLE_FILE)
+
+    Linear interpolation in the precomputed table. The table is
+    sampled on whole pixels like Moffat.moffat_frac, between grid
+    points it smooths over the jumps the exact calculation makes
+    when the slit edges cross a pixel. Use load_table() for the
+    shared instance of a file.
+    '''
+    def __init__(self, fn=TABLE_FILE):
+        self.fn = fn
+        data = DataCache.load('slitloss', fn, _read_table)
+        self.axes = [data[axis] for axis in AXES]
+        self.frac = data['frac']
+
+    def __repr__(self):
+        return f'<SlitLossTable {self.fn} {self.frac.shape}>'
+
+    def __call__(self, seeing, width, height, beta=3, pix_size=0.15):
+        '''
+        __call__(self, seeing, width, height, beta=3, pix_size=0.15)
+
+        Returns the slit fraction, NaN outside of the table and for
+        pixel scales that are not on its axis. The multilinear
+        interpolation of scipy's RegularGridInterpolator, without its
+        set up cost on every call.
+        '''
+        values = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in
+                                       (seeing, width, height, beta, pix_size)])
+        inside = np.ones(values[0].size, dtype=bool)
+        lower = []
+        weights = []
+        for name, axis, value in zip(AXES, self.axes, values):
+            value = value.ravel()
+            if name in DISCRETE_AXES:
+                inside &= np.isclose(value[:, np.newaxis], axis).any(axis=1)
+            else:
+                inside &= (value >= axis[0]) & (value <= axis[-1])
+            i = np.clip(np.searchsorted(axis, value, side='right') - 1, 0, len(axis) - 2)
+            lower.append(i)
+            weights.append((value - axis[i]) / (axis[i + 1] - axis[i]))
+        # weighted sum over the corners of the grid cell around each point
+        lower = np.stack(lower, axis=-1)[:, np.newaxis, :]
+        weights = np.stack(weights, axis=-1)[:, np.newaxis, :]
+        weight = np.prod(np.where(CORNERS, weights, 1 - weights), axis=-1)
+        index = lower + CORNERS
+        frac = np.sum(weight * self.frac[tuple(np.moveaxis(index, -1, 0))], axis=-1)
+        frac[~inside] = np.nan
+        return frac.reshape(values[0].shape)
+
+def _read_table(fn):
+    with np.load(fn) as data:
+        return {key: DataCache.readonly(data[key]) for key in data.files}
+
+def load_table(fn=TABLE_FILE):
+    '''
+    load_table(fn=TABLE_FILE)
+
+    Returns the table in fn, or None if it has not been built. The
+    table and its interpolator are built once and shared.
+    '''
+    if not os.path.exists(fn):
+        return None
+    key = ('slitloss_table',) + DataCache.file_key('slitloss', fn)[1:]
+    return DataCache.cache().get(key, lambda: SlitLossTable(fn))
+
+def exact_frac(seeing, width, height, beta=3, pix_size=0.15):
+    '''
+    exact_frac(seeing, width, height, beta=3, pix_size=0.15)
+
+    Moffat.moffat_frac for broadcast arrays of parameters.
+    '''
+    return np.asarray(Moffat.moffat_frac(seeing, width, height, beta=beta, pix_size=pix_size))
+
+def slit_frac(seeing, width, height, beta=3, pix_size=0.15, exact=False, fn=TABLE_FILE):
+    '''
+    slit_frac(seeing, width, height, beta=3, pix_size=0.15, exact=False, fn=TABLE_FILE)
+
+    Fraction of a Moffat profile with FWHM seeing that passes the
+    slit. Uses the table when it exists, falling back to
+    Moffat.moffat_frac for values outside of it, pixel scales other
+    than those it was built for, or when exact is set.
+    Returns a float for scalar arguments.
+    '''
+    table = None if exact else load_table(fn)
+    if table is None:
+        frac = exact_frac(seeing, width, height, beta=beta, pix_size=pix_size)
+    else:
+        frac = table(seeing, width, height, beta=beta, pix_size=pix_size)
+        outside = np.isnan(frac)
+        if np.any(outside):
+            values = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in
+                                           (seeing, width, height, beta, pix_size)])
+            frac[outside] = exact_frac(*[value[outside] for value in values[:3]],
+                                       beta=values[3][outside], pix_size=values[4][outside])
+    if np.ndim(frac) == 0:
+        return float(frac)
+    return frac
+
+def effective_seeing(seeing, waves, airmass=1.0):
+    '''
+    effective_seeing(seeing, waves, airmass=1.0)
+
+    FWHM at waves and airmass of a zenith seeing quoted at SEEING_WAVE,
+    the arguments broadcast against each other.
+    '''
+    return (np.asarray(seeing, dtype=float) *
+            (np.asarray(waves, dtype=float) / SEEING_WAVE)**SEEING_EXPONENT *
+            np.asarray(airmass, dtype=float)**AIRMASS_EXPONENT)
+
+def seeing_curve(width, height, beta=3, pix_size=0.15):
+    '''
+    seeing_curve(width, height, beta=3, pix_size=0.15)
+
+    slit_frac at the CURVE_SEEING values for one slit, computed once
+    in a single call.
+    '''
+    def build():
+        frac = slit_frac(CURVE_SEEING, width, height, beta=beta, pix_size=pix_size)
+        return DataCache.readonly(CURVE_SEEING), DataCache.readonly(frac)
+    return _CURVES.get((width, height, beta, pix_size), build)
+
+def chromatic_slit_frac(seeing, waves, width, height, airmass=1.0, beta=3, pix_size=0.15):
+    '''
+    chromatic_slit_frac(seeing, waves, width, height, airmass=1.0, beta=3, pix_size=0.15)
+
+    slit_frac with the seeing of effective_seeing at every wavelength.
+    For a given slit the fraction only depends on the FWHM, so any
+    number of wavelengths and targets are interpolated in the
+    seeing_curve at once.
+    '''
+    grid, frac = seeing_curve(width, height, beta=beta, pix_size=pix_size)
+    fwhm = effective_seeing(seeing, waves, airmass)
+    return np.interp(np.log(fwhm), np.log(grid), frac)
+
+def parse_args():
+    '''
+    parse_args()
+    '''
+    parser = argparse.ArgumentParser(description='Build the slit loss table')
+    parser.add_argument('--output', '-o', type=str, default=TABLE_FILE,
+                        help=f'output file ({TABLE_FILE})')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(build_table(args.output))
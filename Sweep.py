@@ -0,0 +1,332 @@
+"""Parameter grid sweeps of the exposure time calculator"""
+import concurrent.futures
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import os
+import pickle
+import types
+import warnings
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import DataCache
+import ExpCalc
+import InstrumentRegistry
+import Output
+import Pipeline
+import Resample
+import Telescope
+
+DEFAULT_SPEC = {'arms': ['lris2_blue', 'lris2_red'], 'gratings': {},
+                'templates': ['starb1'], 'filter': 'sdss_rprime.dat',
+                'mag': [22.], 'seeing': [1.0], 'airmass': [1.2], 'redshift': [0.],
+                'time': 1200., 'slit_width': 0.7, 'slit_length': 8., 'telescope': 'keck1',
+                'snr_waves': [], 'shard_size': 2000}
+PARAMS = ('mag', 'seeing', 'airmass', 'redshift')
+SPEC_FILE = 'spec.json' # the spec the shards in a checkpoint directory were computed for
+
+_INSTRUMENTS = {}
+_SHARED = []
+
+def read_spec(fn):
+    '''
+    read_spec(fn)
+
+    Reads a JSON grid specification, missing entries take the
+    values in DEFAULT_SPEC.
+    '''
+    with open(fn, encoding='utf-8') as stream:
+        spec = json.load(stream)
+    return make_spec(**spec)
+
+def make_spec(**kwargs):
+    '''
+    make_spec(**kwargs)
+    '''
+    unknown = set(kwargs) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}")
+    spec = dict(DEFAULT_SPEC)
+    spec.update(kwargs)
+    for name in PARAMS + ('arms', 'templates', 'snr_waves'):
+        spec[name] = list(np.atleast_1d(spec[name]).tolist())
+    return spec
+
+def make_shards(spec):
+    '''
+    make_shards(spec)
+
+    Splits the grid into shards. Each shard has one arm, grating and
+    template, and up to shard_size combinations of the parameters so
+    it can be computed in one vectorized call.
+    '''
+    shards = []
+    grid = np.array(list(itertools.product(*[spec[name] for name in PARAMS])), dtype=float)
+    groups = []
+    for arm in spec['arms']:
+        for grating in spec['gratings'].get(arm, [None]):
+            for template in spec['templates']:
+                groups.append((arm, grating, template))
+    for group_index, (arm, grating, template) in enumerate(groups):
+        for start in range(0, len(grid), spec['shard_size']):
+            shards.append({'name': f'shard_{group_index:03d}_{start // spec["shard_size"]:05d}',
+                           'arm': arm, 'grating': grating, 'template': template,
+                           'params': grid[start:start + spec['shard_size']]})
+    return shards
+
+def get_instrument(arm, grating, telescope):
+    '''
+    get_instrument(arm, grating, telescope)
+
+    Instruments are built once per process.
+    '''
+    key = (arm, grating, telescope)
+    if key not in _INSTRUMENTS:
+        tel = Telescope.Telescope(telescope)
+        _INSTRUMENTS[key] = (InstrumentRegistry.config(arm, grating, telescope), tel)
+    return _INSTRUMENTS[key]
+
+def compute_shard(spec, shard):
+    '''
+    compute_shard(spec, shard)
+
+    Returns the columns for one shard.
+    '''
+    inst, tel = get_instrument(shard['arm'], shard['grating'], spec['telescope'])
+    params = shard['params']
+    waves, snr = ExpCalc.compute_snr_batch(params[:, 0], params[:, 1], params[:, 2],
+                                           params[:, 3], spec['time'], spec['filter'],
+                                           shard['template'], spec['slit_length'],
+                                           spec['slit_width'], inst, tel)
+    npoints = len(params)
+    columns = {'arm': np.full(npoints, shard['arm']),
+               'grating': np.full(npoints, inst.grating),
+               'template': np.full(npoints, shard['template'])}
+    for i, name in enumerate(PARAMS):
+        columns[name] = params[:, i]
+    columns['time'] = np.full(npoints, float(spec['time']))
+    with warnings.catch_warnings():
+        # targets entirely out of band give all NaN rows
+        warnings.simplefilter('ignore', RuntimeWarning)
+        columns['snr_median'] = np.nanmedian(snr, axis=1)
+        columns['snr_max'] = np.nanmax(snr, axis=1)
+    for wave in spec['snr_waves']:
+        rows = np.arange(npoints)
+        idx = np.clip(np.sum(waves <= wave, axis=1) - 1, 0, waves.shape[1] - 2)
+        frac = (wave - waves[rows, idx]) / (waves[rows, idx + 1] - waves[rows, idx])
+        columns[f'snr_{wave:g}'] = snr[rows, idx]*(1 - frac) + snr[rows, idx + 1]*frac
+    return columns
+
+def warm(spec):
+    '''
+    warm(spec)
+
+    Loads the reference data every group needs into the cache.
+    '''
+    for shard in make_shards(make_spec(**dict(spec, mag=spec['mag'][:1],
+                                              seeing=spec['seeing'][:1],
+                                              airmass=spec['airmass'][:1],
+                                              redshift=spec['redshift'][:1]))):
+        compute_shard(spec, shard)
+
+def shared_caches():
+    '''
+    shared_caches()
+
+    The caches whose contents are handed to the workers, by name.
+    '''
+    return {'data': DataCache.cache(), 'memo': Pipeline.memo(),
+            'operators': Resample.operators()}
+
+def _mapping_proxy(values):
+    return types.MappingProxyType(values)
+
+class _SharingPickler(pickle.Pickler):
+    '''
+    _SharingPickler(stream, blocks)
+
+    Pickles with the data of every array out of band, each buffer
+    is copied into a block of shared memory. Arrays memory mapped
+    from the data bundle are only named, the workers map them too.
+    '''
+    def __init__(self, stream, blocks):
+        super().__init__(stream, protocol=5, buffer_callback=self.share)
+        self.blocks = blocks
+        self.buffers = []
+
+    def share(self, buf):
+        '''
+        share(self, buf)
+        '''
+        raw = buf.raw()
+        block = shared_memory.SharedMemory(create=True, size=max(raw.nbytes, 1))
+        block.buf[:raw.nbytes] = raw
+        self.blocks.append(block)
+        self.buffers.append((block.name, raw.nbytes))
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.memmap) and isinstance(obj.base, mmap.mmap) and obj.filename:
+            return ('memmap', obj.filename)
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, types.MappingProxyType):
+            return _mapping_proxy, (dict(obj),)
+        return NotImplemented
+
+class _SharedUnpickler(pickle.Unpickler):
+    '''
+    _SharedUnpickler(stream, buffers)
+    '''
+    def persistent_load(self, pid):
+        return np.load(pid[1], mmap_mode='r')
+
+def share_cache():
+    '''
+    share_cache()
+
+    Copies the arrays in the shared_caches() into shared memory,
+    including those inside the objects cached there, e.g. the slit
+    loss table, instrument configurations and atmosphere. Returns
+    the blocks, which the caller has to keep and unlink, and a
+    manifest the workers use to rebuild the caches without copies.
+    '''
+    blocks = []
+    entries = {}
+    for name, memo in shared_caches().items():
+        with memo.lock:
+            entries[name] = list(memo.entries.items())
+    stream = io.BytesIO()
+    pickler = _SharingPickler(stream, blocks)
+    pickler.dump(entries)
+    return blocks, (stream.getvalue(), pickler.buffers)
+
+def _attach(name, nbytes):
+    # the workers share the parent's resource tracker, the parent
+    # unlinks the block when the sweep is done
+    block = shared_memory.SharedMemory(name=name)
+    _SHARED.append(block)
+    return block.buf[:nbytes].toreadonly()
+
+def init_worker(manifest):
+    '''
+    init_worker(manifest)
+
+    Fills the worker's caches from shared memory, the arrays are
+    read-only views of the parent's blocks.
+    '''
+    data, buffers = manifest
+    unpickler = _SharedUnpickler(io.BytesIO(data),
+                                 buffers=[_attach(name, nbytes) for name, nbytes in buffers])
+    entries = unpickler.load()
+    caches = shared_caches()
+    for name, items in entries.items():
+        for key, value in items:
+            caches[name].put(key, value)
+
+def spec_hash(spec):
+    '''
+    spec_hash(spec)
+
+    Hash of everything in the spec that the shards depend on.
+    '''
+    text = json.dumps(spec, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def check_checkpoint(checkpoint_dir, spec):
+    '''
+    check_checkpoint(checkpoint_dir, spec)
+
+    Records the spec in checkpoint_dir. Shards left there by a
+    different spec are removed, so they are never merged into this
+    one. Returns True if the saved shards can be reused.
+    '''
+    fn = os.path.join(checkpoint_dir, SPEC_FILE)
+    digest = spec_hash(spec)
+    saved = None
+    if os.path.exists(fn):
+        with open(fn, encoding='utf-8') as stream:
+            saved = json.load(stream).get('hash')
+    if saved == digest:
+        return True
+    stale = [name for name in os.listdir(checkpoint_dir)
+             if name.startswith('shard_') and name.endswith('.npz')]
+    if stale:
+        print(f'Removing {len(stale)} shards of a different spec from {checkpoint_dir}')
+        for name in stale:
+            os.remove(os.path.join(checkpoint_dir, name))
+    tmp = fn + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as stream:
+        json.dump({'hash': digest, 'spec': spec}, stream, indent=1)
+    os.replace(tmp, fn)
+    return False
+
+def shard_file(checkpoint_dir, shard):
+    '''
+    shard_file(checkpoint_dir, shard)
+    '''
+    return os.path.join(checkpoint_dir, shard['name'] + '.npz')
+
+def save_shard(checkpoint_dir, shard, columns):
+    '''
+    save_shard(checkpoint_dir, shard, columns)
+
+    Written to a temporary file first so an interrupted run never
+    leaves a partial shard behind.
+    '''
+    fn = shard_file(checkpoint_dir, shard)
+    tmp = fn + '.tmp.npz'
+    np.savez(tmp, **columns)
+    os.replace(tmp, fn)
+
+def load_shard(checkpoint_dir, shard):
+    '''
+    load_shard(checkpoint_dir, shard)
+    '''
+    with np.load(shard_file(checkpoint_dir, shard)) as data:
+        return {key: data[key] for key in data.files}
+
+def run_sweep(spec, output=None, fmt=None, checkpoint_dir='sweep_checkpoint', workers=None,
+              resume=True):
+    '''
+    run_sweep(spec, output=None, fmt=None, checkpoint_dir='sweep_checkpoint', workers=None,
+              resume=True)
+
+    Computes every shard of the grid in a process pool, saving each
+    shard in checkpoint_dir as it finishes. With resume, shards that
+    are already saved for the same spec are not computed again, those
+    of another spec are removed. The shards are then
+    combined into one table and written to output.
+    Returns the combined columns.
+    '''
+    spec = make_spec(**spec)
+    shards = make_shards(spec)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    resume = check_checkpoint(checkpoint_dir, spec) and resume
+    todo = [shard for shard in shards
+            if not (resume and os.path.exists(shard_file(checkpoint_dir, shard)))]
+
+    if todo:
+        warm(spec)
+        blocks, manifest = share_cache()
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                        initializer=init_worker,
+                                                        initargs=(manifest,)) as pool:
+                futures = {pool.submit(compute_shard, spec, shard): shard for shard in todo}
+                for future in concurrent.futures.as_completed(futures):
+                    save_shard(checkpoint_dir, futures[future], future.result())
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    parts = [load_shard(checkpoint_dir, shard) for shard in shards]
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    if output is not None:
+        Output.write_columns(columns, output, fmt)
+    return columns
@@ -0,0 +1,224 @@
+"""Index of the spectral templates and tables of their AB magnitudes"""
+import os
+
+import numpy as np
+
+import Bundle
+import DataCache
+import Mag
+import Photometry
+
+TEMPLATE_DIR = os.path.join('data', 'templates')
+Z_STEP = 0.005
+Z_MAX = 6.0
+TABLE_ENTRIES = 64
+Z_CHUNK = 64 # redshifts evaluated together by compute_abmags
+
+_TABLES = DataCache.LRUCache(maxsize=TABLE_ENTRIES)
+
+def clear_cache():
+    '''
+    clear_cache()
+
+    Empties the cache of AB magnitude tables.
+    '''
+    _TABLES.clear()
+
+class TemplateInfo:
+    '''
+    TemplateInfo(name, path, wave_min, wave_max, npoints)
+
+    What the index knows about one template, wavelengths are rest
+    frame Angstroms.
+    '''
+    def __init__(self, name, path, wave_min, wave_max, npoints):
+        self.name = name
+        self.path = path
+        self.wave_min = wave_min
+        self.wave_max = wave_max
+        self.npoints = npoints
+
+    def __repr__(self):
+        return f'<TemplateInfo {self.name} {self.wave_min:0.0f}-{self.wave_max:0.0f}>'
+
+    def arrays(self):
+        '''
+        arrays(self)
+
+        The cached rest frame wavelengths and flux.
+        '''
+        return DataCache.read_template(self.path)
+
+    def covers(self, wave_min, wave_max, redshift=0.0):
+        '''
+        covers(self, wave_min, wave_max, redshift=0.0)
+
+        True if the redshifted template spans wave_min to wave_max.
+        '''
+        return (self.wave_min*(1 + redshift) <= wave_min and
+                self.wave_max*(1 + redshift) >= wave_max)
+
+def template_name(filename):
+    '''
+    template_name(filename)
+
+    Short name of a template file, e.g. starb1 for starb1_template.fits.
+    '''
+    name = os.path.basename(filename)
+    for suffix in ('.fits', '_template'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+def _build_index(template_dir):
+    index = {}
+    for filename in sorted(os.listdir(template_dir)):
+        if not filename.endswith('.fits'):
+            continue
+        path = os.path.join(template_dir, filename)
+        waves = np.ravel(DataCache.read_template(path)[0])
+        index[template_name(filename)] = TemplateInfo(template_name(filename), path,
+                                                      float(waves[0]), float(waves[-1]),
+                                                      len(waves))
+    return index
+
+def template_index(template_dir=TEMPLATE_DIR):
+    '''
+    template_index(template_dir=TEMPLATE_DIR)
+
+    Returns a dict of template name to TemplateInfo, rebuilt when the
+    directory changes.
+    '''
+    key = ('template_index',) + DataCache.file_key('dir', template_dir)[1:]
+    return DataCache.cache().get(key, lambda: _build_index(template_dir))
+
+def find_template(template_filename, template_dir=TEMPLATE_DIR):
+    '''
+    find_template(template_filename, template_dir=TEMPLATE_DIR)
+
+    Returns the path of the first template whose name contains
+    template_filename, or None.
+    '''
+    return DataCache.find_file(template_dir, template_filename)
+
+def get_template(template_filename, template_dir=TEMPLATE_DIR):
+    '''
+    get_template(template_filename, template_dir=TEMPLATE_DIR)
+
+    TemplateInfo of the template find_template picks.
+    '''
+    path = find_template(template_filename, template_dir)
+    if path is None:
+        raise ValueError(f"No template found for {template_filename}")
+    return template_index(template_dir)[template_name(path)]
+
+def redshift_grid(z_max=Z_MAX, z_step=Z_STEP):
+    '''
+    redshift_grid(z_max=Z_MAX, z_step=Z_STEP)
+    '''
+    return np.round(np.arange(0, z_max + z_step/2, z_step), 10)
+
+def compute_abmags(rest_waves, rest_flux, mag, redshifts):
+    '''
+    compute_abmags(rest_waves, rest_flux, mag, redshifts)
+
+    Mag.compute_ABmag of the template at each redshift, Z_CHUNK
+    redshifts at a time so the weight matrix stays small for long
+    redshift grids and finely sampled templates.
+    '''
+    rest_waves = np.ravel(np.asarray(rest_waves, dtype=float))
+    rest_flux = np.ravel(np.asarray(rest_flux, dtype=float))
+    redshifts = np.asarray(redshifts, dtype=float)
+    mean_flux = np.empty(redshifts.shape)
+    flat_z = redshifts.ravel()
+    flat_flux = mean_flux.reshape(-1)
+    for start in range(0, len(flat_z), Z_CHUNK):
+        zs = flat_z[start:start + Z_CHUNK]
+        weights = Photometry.filter_weights(rest_waves[np.newaxis, :] * (1 + zs[:, np.newaxis]),
+                                            mag)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # not finite where the redshifted template misses the filter
+            flat_flux[start:start + Z_CHUNK] = weights @ rest_flux / weights.sum(axis=1)
+    return Photometry.to_abmag(mean_flux, mag.lambda_eff)
+
+def filter_file(mfilter, filter_dir=Photometry.FILTER_DIR):
+    '''
+    filter_file(mfilter, filter_dir=Photometry.FILTER_DIR)
+
+    The file Mag.Mag reads for mfilter.
+    '''
+    fn = DataCache.find_file(filter_dir, mfilter)
+    if fn is None:
+        fn = os.path.join(filter_dir, mfilter)
+    return fn
+
+def table_name(path, filter_fn, z_max=Z_MAX, z_step=Z_STEP):
+    '''
+    table_name(path, filter_fn, z_max=Z_MAX, z_step=Z_STEP)
+
+    Name of the AB magnitude table of a template file in the Bundle.
+    '''
+    return f'abmag:{template_name(path)}:{os.path.basename(filter_fn)}:{z_max:g}:{z_step:g}'
+
+def bundle_tables(template_dir=TEMPLATE_DIR, filter_dir=Photometry.FILTER_DIR):
+    '''
+    bundle_tables(template_dir=TEMPLATE_DIR, filter_dir=Photometry.FILTER_DIR)
+
+    The AB magnitude tables of every template through every filter on
+    the default redshift grid, as Bundle.build tables.
+    '''
+    for filename in DataCache.list_dir(template_dir):
+        path = os.path.join(template_dir, filename)
+        for mfilter in DataCache.list_dir(filter_dir):
+            def builder(path=path, mfilter=mfilter):
+                rest_waves, rest_flux = DataCache.read_template(path)
+                return redshift_grid(), compute_abmags(rest_waves, rest_flux,
+                                                       Mag.Mag(mfilter), redshift_grid())
+            filter_fn = os.path.join(filter_dir, mfilter)
+            yield table_name(path, filter_fn), (path, filter_fn), builder
+
+def abmag_table(template, mfilter, z_max=Z_MAX, z_step=Z_STEP):
+    '''
+    abmag_table(template, mfilter, z_max=Z_MAX, z_step=Z_STEP)
+
+    Returns the redshift grid and the AB magnitude of the unscaled
+    template through the filter at each redshift. The tables of the
+    default grid are precomputed in the Bundle by build_bundle.py,
+    others, or those of files that changed since, are computed once
+    per process.
+    '''
+    path = find_template(template)
+    if path is None:
+        raise ValueError(f"No template found for {template}")
+    def build():
+        filter_fn = filter_file(mfilter)
+        if DataCache.USE_BUNDLE:
+            table = Bundle.lookup_table(table_name(path, filter_fn, z_max, z_step),
+                                        (path, filter_fn))
+            if table is not None:
+                return table
+        grid = redshift_grid(z_max, z_step)
+        rest_waves, rest_flux = DataCache.read_template(path)
+        table = compute_abmags(rest_waves, rest_flux, Mag.Mag(mfilter), grid)
+        return DataCache.readonly(grid), DataCache.readonly(table)
+    return _TABLES.get(('abmag', path, mfilter, z_max, z_step), build)
+
+def abmag(template, mfilter, redshifts, z_max=Z_MAX, z_step=Z_STEP):
+    '''
+    abmag(template, mfilter, redshifts, z_max=Z_MAX, z_step=Z_STEP)
+
+    AB magnitudes of the template at the redshifts, interpolated in
+    the table. Redshifts on the grid give the computed value, those
+    off the end of the grid are computed directly.
+    '''
+    grid, table = abmag_table(template, mfilter, z_max, z_step)
+    redshifts = np.asarray(redshifts, dtype=float)
+    mags = np.interp(redshifts, grid, table)
+    outside = (redshifts < grid[0]) | (redshifts > grid[-1])
+    if np.any(outside):
+        rest_waves, rest_flux = DataCache.read_template(find_template(template))
+        mags = np.array(mags, ndmin=1)
+        mags[np.atleast_1d(outside)] = compute_abmags(rest_waves, rest_flux, Mag.Mag(mfilter),
+                                                      np.atleast_1d(redshifts)[np.atleast_1d(outside)])
+        mags = mags.reshape(redshifts.shape)
+    return mags
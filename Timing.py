@@ -0,0 +1,215 @@
+"""Opt-in per stage timing of the calculations"""
+import collections
+import contextlib
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+class StageRecord:
+    '''
+    StageRecord(name)
+
+    Totals for one stage over all the calls that were recorded.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.min = np.inf
+        self.max = 0.0
+        self.alloc = 0 # summed peak allocation in bytes
+        self.nbytes = 0 # summed size of the arrays the stage made
+        self.nelements = 0
+
+    def __repr__(self):
+        return f'<StageRecord {self.name} {self.calls} calls {self.total*1e3:0.3f} ms>'
+
+    def add(self, elapsed, alloc=0, nbytes=0, nelements=0, calls=1):
+        '''
+        add(self, elapsed, alloc=0, nbytes=0, nelements=0, calls=1)
+        '''
+        self.calls += calls
+        self.total += elapsed
+        self.min = min(self.min, elapsed)
+        self.max = max(self.max, elapsed)
+        self.alloc += alloc
+        self.nbytes += nbytes
+        self.nelements += nelements
+
+    def as_dict(self):
+        '''
+        as_dict(self)
+        '''
+        mean = self.total / self.calls if self.calls else 0.0
+        return {'calls': self.calls, 'total': self.total, 'mean': mean,
+                'min': self.min if self.calls else 0.0, 'max': self.max,
+                'alloc': self.alloc, 'nbytes': self.nbytes, 'nelements': self.nelements}
+
+class _Stage:
+    '''
+    Handed out by StageStats.stage, note() records the arrays a
+    stage produced.
+    '''
+    def __init__(self):
+        self.nbytes = 0
+        self.nelements = 0
+
+    def note(self, *arrays):
+        '''
+        note(self, *arrays)
+        '''
+        for arr in arrays:
+            arr = np.asarray(arr)
+            self.nbytes += arr.nbytes
+            self.nelements += arr.size
+
+class _NullStage:
+    '''
+    Stand in when no statistics are being collected.
+    '''
+    def note(self, *arrays):
+        '''
+        note(self, *arrays)
+        '''
+
+NULL_STAGE = _NullStage()
+
+class StageStats:
+    '''
+    StageStats(memory=False, callbacks=None)
+
+    Collects wall time, and with memory the peak allocation, of
+    each stage of a calculation. One instance can be shared by many
+    calls and threads to aggregate a batch run. Each callback is
+    called as callback(name, elapsed, alloc, nbytes) after a stage.
+
+    The tracemalloc peak is global to the process, so memory is only
+    measured for stages run on the main thread, stages run by a
+    thread pool, e.g. calculate_many or the server, record no
+    allocation. close(), or leaving a with block, stops the tracing
+    this instance started.
+    '''
+    def __init__(self, memory=False, callbacks=None):
+        self.memory = memory
+        self.callbacks = list(callbacks) if callbacks else []
+        self.records = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.started_tracing = False
+
+    def __repr__(self):
+        return f'<StageStats {len(self.records)} stages>'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''
+        close(self)
+
+        Ends the memory tracking, tracemalloc is stopped if this
+        instance started it.
+        '''
+        self.memory = False
+        if self.started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        stage(self, name)
+
+        Context manager timing the code inside it as stage name.
+        '''
+        stage = _Stage()
+        memory = self.memory and threading.current_thread() is threading.main_thread()
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+            start_mem = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            elapsed = time.perf_counter() - start
+            alloc = 0
+            if memory:
+                alloc = max(tracemalloc.get_traced_memory()[1] - start_mem, 0)
+            self.record(name, elapsed, alloc, stage.nbytes, stage.nelements)
+
+    def record(self, name, elapsed, alloc=0, nbytes=0, nelements=0):
+        '''
+        record(self, name, elapsed, alloc=0, nbytes=0, nelements=0)
+        '''
+        with self.lock:
+            if name not in self.records:
+                self.records[name] = StageRecord(name)
+            self.records[name].add(elapsed, alloc, nbytes, nelements)
+        for callback in self.callbacks:
+            callback(name, elapsed, alloc, nbytes)
+
+    def merge(self, other):
+        '''
+        merge(self, other)
+
+        Adds the records of another StageStats, e.g. from a worker.
+        '''
+        for name, rec in other.records.items():
+            with self.lock:
+                if name not in self.records:
+                    self.records[name] = StageRecord(name)
+                mine = self.records[name]
+                mine.add(rec.total, rec.alloc, rec.nbytes, rec.nelements, calls=rec.calls)
+                mine.min = min(mine.min, rec.min)
+                mine.max = max(mine.max, rec.max)
+
+    def reset(self):
+        '''
+        reset(self)
+        '''
+        with self.lock:
+            self.records.clear()
+
+    def as_dict(self):
+        '''
+        as_dict(self)
+        '''
+        with self.lock:
+            return {name: rec.as_dict() for name, rec in self.records.items()}
+
+    def report(self):
+        '''
+        report(self)
+
+        Returns a table of the stages, slowest first.
+        '''
+        stats = self.as_dict()
+        total = sum(stat['total'] for stat in stats.values()) or 1.0
+        lines = [f"{'stage':16s} {'calls':>7s} {'total ms':>10s} {'mean ms':>9s} "
+                 f"{'%':>6s} {'alloc KiB':>10s} {'out KiB':>9s}"]
+        for name, stat in sorted(stats.items(), key=lambda item: -item[1]['total']):
+            lines.append(f"{name:16s} {stat['calls']:7d} {stat['total']*1e3:10.3f} "
+                         f"{stat['mean']*1e3:9.4f} {100*stat['total']/total:6.1f} "
+                         f"{stat['alloc']/1024:10.1f} {stat['nbytes']/1024:9.1f}")
+        return '\n'.join(lines)
+
+@contextlib.contextmanager
+def _null_stage():
+    yield NULL_STAGE
+
+def stage(stats, name):
+    '''
+    stage(stats, name)
+
+    stats.stage(name), or a context that does nothing if stats is None.
+    '''
+    if stats is None:
+        return _null_stage()
+    return stats.stage(name)
@@ -0,0 +1,28 @@
+'''Compile the reference data into a memory mapped bundle'''
+import argparse
+import time
+
+import Bundle
+import DataCache
+
+def parse_args():
+    '''
+    parse_args()
+    '''
+    parser = argparse.ArgumentParser(description='Build the binary data bundle')
+    parser.add_argument('--bundle_dir', '-d', type=str, default=Bundle.BUNDLE_DIR, \
+                        help=f'bundle directory ({Bundle.BUNDLE_DIR})')
+    return parser.parse_args()
+
+def main(args):
+    '''
+    Build the bundle.
+    '''
+    start = time.perf_counter()
+    index = DataCache.build_bundle(args.bundle_dir)
+    print(f"Bundled {len(index['entries'])} files and {len(index['tables'])} tables "
+          f"in {args.bundle_dir} in {time.perf_counter() - start:0.2f} s")
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,259 @@
+'''Serve the exposure time calculator over HTTP with JSON requests'''
+import argparse
+import concurrent.futures
+import http.server
+import json
+import threading
+
+import numpy as np
+
+import DataCache
+import ExpCalc
+import ExpTime
+import InstrumentRegistry
+import Sky
+import SlitLoss
+import Telescope
+
+DEFAULTS = {'telescope': 'keck1', 'filter': 'sdss_rprime.dat', 'template': 'starb1',
+            'slit_width': 0.7, 'slit_length': 8., 'mag': 22., 'seeing': 1.0,
+            'airmass': 1.2, 'redshift': 0., 'time': 1200.}
+
+def parse_args():
+    '''
+    parse_args()
+    '''
+    parser = argparse.ArgumentParser(description='Exposure time calculator server')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host (127.0.0.1)')
+    parser.add_argument('--port', '-p', type=int, default=8850, help='Port (8850)')
+    parser.add_argument('--workers', '-j', type=int, default=4,
+                        help='number of calculation threads (4)')
+    parser.add_argument('--no_warm', action='store_true',
+                        help='do not load the reference data at start up')
+    return parser.parse_args()
+
+def to_json(arr):
+    '''
+    to_json(arr)
+
+    Converts an array to nested lists, NaN becomes null.
+    '''
+    arr = np.asarray(arr, dtype=float)
+    return np.where(np.isfinite(arr), arr, None).tolist()
+
+class ETCService:
+    '''
+    ETCService(workers=4)
+
+    Holds the telescopes and instruments so they are only built
+    once, and runs the calculations in a thread pool.
+    '''
+    def __init__(self, workers=4):
+        self.telescopes = {}
+        self.instruments = {}
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def __repr__(self):
+        return f'<ETCService {len(self.instruments)} instruments>'
+
+    def telescope(self, name):
+        '''
+        telescope(self, name)
+        '''
+        with self.lock:
+            if name not in self.telescopes:
+                tel = Telescope.Telescope(name)
+                if tel.name == '':
+                    raise ValueError(f"Telescope {name} not supported")
+                self.telescopes[name] = tel
+            return self.telescopes[name]
+
+    def instrument(self, mode, grating=None, telescope='keck1'):
+        '''
+        instrument(self, mode, grating=None, telescope='keck1')
+
+        Returns the shared, frozen, instrument configuration.
+        '''
+        self.telescope(telescope)
+        inst = InstrumentRegistry.config(mode, grating, telescope)
+        inst.read_throughput()
+        with self.lock:
+            self.instruments[(mode, grating, telescope)] = inst
+        return inst
+
+    def warm(self):
+        '''
+        warm(self)
+
+        Loads the LRIS-2 configurations, the sky and the slit loss
+        table before the first request arrives.
+        '''
+        for mode in ('lris2_blue', 'lris2_red'):
+            self.instrument(mode)
+        DataCache.read_sky(Sky.SKY_FILE)
+        SlitLoss.load_table()
+        self.snr({'instrument': 'lris2_blue'})
+
+    def _setup(self, request):
+        params = dict(DEFAULTS)
+        params.update(request)
+        if 'instrument' not in request:
+            raise ValueError("No instrument given")
+        inst = self.instrument(params['instrument'], params.get('grating'),
+                               params['telescope'])
+        tel = self.telescope(params['telescope'])
+        return params, inst, tel
+
+    def snr(self, request):
+        '''
+        snr(self, request)
+
+        SNR spectra for one or more targets.
+        '''
+        params, inst, tel = self._setup(request)
+        waves, snr = ExpCalc.compute_snr_batch(params['mag'], params['seeing'],
+                                               params['airmass'], params['redshift'],
+                                               params['time'], params['filter'],
+                                               params['template'], params['slit_length'],
+                                               params['slit_width'], inst, tel)
+        return {'waves': to_json(waves), 'snr': to_json(snr)}
+
+    def spectrum(self, request):
+        '''
+        spectrum(self, request)
+
+        SNR, source and sky counts for one target, with the lsf,
+        optimal and detector options of ExpCalc.
+        '''
+        params, inst, tel = self._setup(request)
+        spec = ExpCalc.calculate(ExpCalc.Request(
+            float(params['mag']), params['filter'], float(params['seeing']),
+            float(params['airmass']), float(params['redshift']), params['template'], inst, tel,
+            float(params['time']), float(params['slit_length']), float(params['slit_width']),
+            lsf=bool(params.get('lsf', False)), optimal=bool(params.get('optimal', False)),
+            detector=bool(params.get('detector', False))))
+        return {'waves': to_json(spec.waves[spec.in_band]), 'snr': to_json(spec.snr),
+                'flux': to_json(spec.flux[spec.in_band]), 'sky': to_json(spec.sky_flux)}
+
+    def exptime(self, request):
+        '''
+        exptime(self, request)
+
+        Exposure times to reach the requested SNR, with the optimal
+        option, and for one target with the lsf and detector options.
+        '''
+        params, inst, tel = self._setup(request)
+        if 'snr' not in params:
+            raise ValueError("No snr given")
+        band = None if params.get('band') is None else tuple(params['band'])
+        options = {'wavelength': params.get('wavelength'), 'band': band,
+                   'per_resolution': params.get('per_resolution', False)}
+        if params.get('detector') or params.get('lsf'):
+            times = ExpTime.time_for_request(params['snr'], ExpCalc.Request(
+                float(params['mag']), params['filter'], float(params['seeing']),
+                float(params['airmass']), float(params['redshift']), params['template'], inst,
+                tel, None, float(params['slit_length']), float(params['slit_width']),
+                lsf=bool(params.get('lsf', False)), optimal=bool(params.get('optimal', False)),
+                detector=bool(params.get('detector', False))), **options)
+        else:
+            times = ExpTime.time_for_snr(params['snr'], params['mag'], params['seeing'],
+                                         params['airmass'], params['redshift'],
+                                         params['filter'], params['template'],
+                                         params['slit_length'], params['slit_width'], inst, tel,
+                                         optimal=bool(params.get('optimal', False)), **options)
+        return {'time': to_json(times)}
+
+    def submit(self, name, request):
+        '''
+        submit(self, name, request)
+
+        Runs one of the calculations in the pool and waits for it.
+        '''
+        return self.executor.submit(getattr(self, name), request).result()
+
+    def shutdown(self):
+        '''
+        shutdown(self)
+        '''
+        self.executor.shutdown(wait=True)
+
+def make_handler(service):
+    '''
+    make_handler(service)
+
+    Builds the request handler class bound to service.
+    '''
+    class ETCHandler(http.server.BaseHTTPRequestHandler):
+        '''
+        POST /snr, /spectrum and /exptime with a JSON object or a list of them,
+        GET /health and /instruments.
+        '''
+        routes = {'/snr': 'snr', '/spectrum': 'spectrum', '/exptime': 'exptime'}
+
+        def send_json(self, status, body):
+            '''
+            send_json(self, status, body)
+            '''
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok', 'cache': repr(DataCache.cache())})
+            elif self.path == '/instruments':
+                self.send_json(200, {'instruments': list(InstrumentRegistry.modes()),
+                                     'loaded': [list(key) for key in service.instruments]})
+            else:
+                self.send_json(404, {'error': f'Unknown path {self.path}'})
+
+        def do_POST(self):
+            if self.path not in self.routes:
+                self.send_json(404, {'error': f'Unknown path {self.path}'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                name = self.routes[self.path]
+                if isinstance(request, list):
+                    futures = [service.executor.submit(getattr(service, name), req)
+                               for req in request]
+                    result = [future.result() for future in futures]
+                else:
+                    result = service.submit(name, request)
+            except (ValueError, KeyError, TypeError, OSError) as err:
+                # bad parameters, including files that do not exist
+                self.send_json(400, {'error': str(err)})
+                return
+            except Exception as err: # pylint: disable=broad-except
+                # always answer, the handler thread would otherwise die
+                self.send_json(500, {'error': f'{type(err).__name__}: {err}'})
+                return
+            self.send_json(200, result)
+
+    return ETCHandler
+
+def main(args):
+    '''
+    Run the server until interrupted.
+    '''
+    service = ETCService(workers=args.workers)
+    if not args.no_warm:
+        service.warm()
+    server = http.server.ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f'Serving on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
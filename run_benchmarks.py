@@ -0,0 +1,58 @@
+'''Run the benchmarks and compare them with a stored baseline'''
+import argparse
+import os
+import sys
+
+import Benchmark
+
+# results of each machine they were measured on, --save adds or replaces
+# those of this one
+BASELINE_FILE = os.path.join('benchmarks', 'baseline.json')
+
+def parse_args():
+    '''
+    parse_args()
+    '''
+    parser = argparse.ArgumentParser(description='Benchmark the exposure time calculator')
+    parser.add_argument('select', nargs='*', help='only run benchmarks containing these names')
+    parser.add_argument('--baseline', '-b', type=str, default=BASELINE_FILE, \
+                        help=f'baseline results ({BASELINE_FILE}), none to skip the comparison')
+    parser.add_argument('--save', '-s', action='store_true', \
+                        help='store these results as the new baseline')
+    parser.add_argument('--output', '-o', type=str, default=None, \
+                        help='also write the results to this file')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='repeats (5)')
+    parser.add_argument('--threshold', type=float, default=Benchmark.THRESHOLD, \
+                        help=f'slowdown counted as a regression ({Benchmark.THRESHOLD})')
+    parser.add_argument('--no_memory', action='store_true', help='skip the memory measurement')
+    return parser.parse_args()
+
+def main(args):
+    '''
+    Run the benchmarks, returns 1 if any regressed.
+    '''
+    results = Benchmark.run_benchmarks(args.select, repeat=args.repeat,
+                                       memory=not args.no_memory)
+    baseline = None
+    if args.baseline != 'none' and not args.save:
+        baseline = Benchmark.load_baseline(args.baseline)
+        if baseline is None:
+            print(f'No baseline for {Benchmark.machine()} in {args.baseline}, '
+                  'the results are not compared, store one with --save')
+    lines, regressions = Benchmark.compare(results, baseline, threshold=args.threshold)
+    print('\n'.join(lines))
+
+    if args.output:
+        Benchmark.save_results(results, args.output)
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        Benchmark.save_baseline(results, args.baseline)
+        print(f'Baseline of {results["machine"]} saved to {args.baseline}')
+    if regressions:
+        print(f'{len(regressions)} regressions: {", ".join(regressions)}')
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(main(args))
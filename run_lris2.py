@@ -1,10 +1,10 @@
 '''Run the exposure time calculator'''
 import argparse
 
-import matplotlib.pyplot as plt
+import numpy as np
 
-import ExpCalc
-import Instrument
+import MultiArm
+import Output
 import Telescope
 
 def parse_args():
@@ -28,41 +28,84 @@ def parse_args():
     parser.add_argument('--template', '-T', type=str, default='starb1', \
                         help='Template file (starb1)')
     parser.add_argument('--flux_plots', action='store_true', help='make flux plots')
+    parser.add_argument('--output', '-o', type=str, default=None, \
+                        help='write the spectra to this file, - for stdout (no plot)')
+    parser.add_argument('--format', '-F', type=str, default=None, choices=Output.FORMATS, \
+                        help='output format (from the file name, or csv)')
+    parser.add_argument('--detector', action='store_true', \
+                        help='results on the detector pixels instead of the template wavelengths')
+    parser.add_argument('--lsf', action='store_true', \
+                        help='convolve the source and sky to the instrument resolution')
+    parser.add_argument('--stitch', action='store_true', \
+                        help='one spectrum combining the arms across the dichroic')
+    parser.add_argument('--no_plot', action='store_true', help='do not plot the SNR')
     return parser.parse_args()
 
-def main(args):
+def spectrum_columns(exp_calcs):
     '''
-    Run the exposure time calculator.
+    spectrum_columns(exp_calcs)
+
+    Collects the in band SNR, source and sky of each arm.
     '''
-    keck_1 = Telescope.Telescope()
-    keck_1.keckone()
-    lris2_blue = Instrument.Instrument()
-    lris2_blue.lris2_blue(keck_1, grating=args.blue_grism)
-    lris2_red = Instrument.Instrument()
-    lris2_red.lris2_red(keck_1, grating=args.red_grism)
+    columns = {'arm': [], 'wavelength': [], 'snr': [], 'flux': [], 'sky': []}
+    for arm, exp_calc in exp_calcs.items():
+        waves = exp_calc.waves[exp_calc.in_band]
+        columns['arm'].append(np.full(len(waves), arm))
+        columns['wavelength'].append(waves)
+        columns['snr'].append(exp_calc.snr)
+        columns['flux'].append(exp_calc.flux[exp_calc.in_band])
+        columns['sky'].append(exp_calc.sky_flux)
+    return {name: np.concatenate(cols) for name, cols in columns.items()}
 
-    blue_exp_calc = ExpCalc.ExpCalc(args.mag, args.filter, args.seeing, args.airmass, \
-                                    args.redshift, args.template, lris2_blue, keck_1)
-    red_exp_calc = ExpCalc.ExpCalc(args.mag, args.filter, args.seeing, args.airmass, \
-                                   args.redshift, args.template, lris2_red, keck_1)
+def stitched_columns(multi_arm):
+    '''
+    stitched_columns(multi_arm)
 
-    if args.flux_plots:
-        blue_exp_calc.flux_plots = True
-        red_exp_calc.flux_plots = True
+    The stitched SNR, source and sky of a MultiArm.
+    '''
+    return {'arm': multi_arm.arm, 'wavelength': multi_arm.waves, 'snr': multi_arm.snr,
+            'flux': multi_arm.flux, 'sky': multi_arm.sky_flux}
 
-    blue_exp_calc.compute_spectrum(args.time, args.slit_length,\
-                                                          args.slit_width)
-    red_exp_calc.compute_spectrum(args.time, args.slit_length, \
-                                                      args.slit_width)
+def plot_snr(blue_exp_calc, red_exp_calc, multi_arm=None):
+    '''
+    plot_snr(blue_exp_calc, red_exp_calc, multi_arm=None)
+    '''
+    import matplotlib.pyplot as plt
 
     _, _ = plt.subplots(figsize=(12, 6))
     plt.plot(blue_exp_calc.waves[blue_exp_calc.in_band], blue_exp_calc.snr, 'b-', label='Blue')
     plt.plot(red_exp_calc.waves[red_exp_calc.in_band], red_exp_calc.snr, 'r-', label='Red')
+    if multi_arm is not None:
+        plt.plot(multi_arm.waves, multi_arm.snr, 'k-', lw=0.5, label='Stitched')
     plt.xlabel('Wavelength (Angstroms)')
     plt.ylabel('SNR')
     plt.legend()
     plt.show()
 
+def main(args):
+    '''
+    Run the exposure time calculator.
+    '''
+    keck_1 = Telescope.Telescope()
+    keck_1.keckone()
+    arms = MultiArm.lris2(keck_1, blue_grating=args.blue_grism, red_grating=args.red_grism)
+    lris2 = MultiArm.MultiArm(args.mag, args.filter, args.seeing, args.airmass, args.redshift,
+                              args.template, arms, keck_1)
+    lris2.configure(flux_plots=args.flux_plots, detector=args.detector, lsf=args.lsf)
+
+    lris2.compute_spectrum(args.time, args.slit_length, args.slit_width)
+
+    blue_exp_calc = lris2.calcs['blue']
+    red_exp_calc = lris2.calcs['red']
+    if args.output is not None:
+        if args.stitch:
+            columns = stitched_columns(lris2)
+        else:
+            columns = spectrum_columns({'blue': blue_exp_calc, 'red': red_exp_calc})
+        Output.write_columns(columns, args.output, args.format)
+    elif not args.no_plot:
+        plot_snr(blue_exp_calc, red_exp_calc, lris2 if args.stitch else None)
+
 if __name__ == "__main__":
     args = parse_args()
     main(args)
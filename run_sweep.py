@@ -0,0 +1,37 @@
+'''Run a parameter grid sweep of the exposure time calculator'''
+import argparse
+
+import Output
+import Sweep
+
+def parse_args():
+    '''
+    parse_args()
+    '''
+    parser = argparse.ArgumentParser(description='Sweep the ETC over a parameter grid')
+    parser.add_argument('spec', type=str, help='JSON grid specification')
+    parser.add_argument('--output', '-o', type=str, default='sweep.fits', \
+                        help='output table (sweep.fits)')
+    parser.add_argument('--format', '-F', type=str, default=None, choices=Output.FORMATS, \
+                        help='output format (from the file name)')
+    parser.add_argument('--checkpoint_dir', '-c', type=str, default='sweep_checkpoint', \
+                        help='directory for finished shards (sweep_checkpoint)')
+    parser.add_argument('--workers', '-j', type=int, default=None, \
+                        help='number of processes (one per CPU)')
+    parser.add_argument('--restart', action='store_true', \
+                        help='recompute shards that are already in the checkpoint directory')
+    return parser.parse_args()
+
+def main(args):
+    '''
+    Run the sweep.
+    '''
+    spec = Sweep.read_spec(args.spec)
+    columns = Sweep.run_sweep(spec, output=args.output, fmt=args.format,
+                              checkpoint_dir=args.checkpoint_dir, workers=args.workers,
+                              resume=not args.restart)
+    print(f"{len(columns['mag'])} grid points written to {args.output}")
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,110 @@
+'''Building and reading a Bundle, and its staleness checks'''
+import json
+import os
+
+import numpy as np
+import pytest
+
+import Bundle
+
+def read_curve(fn):
+    '''
+    read_curve(fn)
+
+    A reader returning the nested layouts a Bundle stores.
+    '''
+    data = np.loadtxt(fn)
+    return data[:, 0], {'value': data[:, 1], 'scaled': 2*data[:, 1]}
+
+def touch(fn):
+    '''
+    touch(fn)
+
+    Moves the modification time of fn on by a second.
+    '''
+    stat = os.stat(fn)
+    os.utime(fn, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+@pytest.fixture(name='bundle')
+def fixture_bundle(tmp_path):
+    '''
+    fixture_bundle(tmp_path)
+
+    Two curves, one file the reader fails on and a derived table.
+    '''
+    source_dir = tmp_path / 'curves'
+    source_dir.mkdir()
+    fns = []
+    for i in range(2):
+        fn = str(source_dir / f'curve{i}.dat')
+        np.savetxt(fn, np.column_stack([np.arange(10.), np.arange(10.) * (i + 1)]))
+        fns.append(fn)
+    (source_dir / 'broken.dat').write_text('not a number\n')
+    bundle_dir = str(tmp_path / 'bundle')
+    def total():
+        return sum(read_curve(fn)[1]['value'] for fn in fns)
+    tables = [('sum', fns, total)]
+    Bundle.build({'curve': read_curve}, bundle_dir, sources=(('curve', str(source_dir), '.dat'),),
+                 tables=tables)
+    return bundle_dir, fns, str(source_dir / 'broken.dat')
+
+def test_lookup(bundle):
+    '''
+    test_lookup(bundle)
+
+    Entries come back as read-only memory maps in the layout the
+    reader returned, files the reader failed on are left out.
+    '''
+    bundle_dir, fns, broken = bundle
+    waves, values = Bundle.lookup('curve', fns[1], bundle_dir)
+    expect_waves, expect_values = read_curve(fns[1])
+    np.testing.assert_array_equal(waves, expect_waves)
+    np.testing.assert_array_equal(values['scaled'], expect_values['scaled'])
+    assert isinstance(waves, np.memmap) and not waves.flags.writeable
+    with pytest.raises(TypeError):
+        values['new'] = waves
+    assert Bundle.lookup('curve', broken, bundle_dir) is None
+    assert Bundle.lookup('template', fns[1], bundle_dir) is None
+
+def test_table(bundle):
+    '''
+    test_table(bundle)
+    '''
+    bundle_dir, fns, _ = bundle
+    np.testing.assert_array_equal(Bundle.lookup_table('sum', fns, bundle_dir),
+                                  np.arange(10.) * 3)
+    assert Bundle.lookup_table('sum', fns[:1], bundle_dir) is None
+    assert Bundle.lookup_table('product', fns, bundle_dir) is None
+
+def test_stale(bundle):
+    '''
+    test_stale(bundle)
+
+    A changed source file is read again, and so are the tables
+    derived from it, the other entries are still used.
+    '''
+    bundle_dir, fns, _ = bundle
+    touch(fns[0])
+    assert Bundle.lookup('curve', fns[0], bundle_dir) is None
+    assert Bundle.lookup_table('sum', fns, bundle_dir) is None
+    assert Bundle.lookup('curve', fns[1], bundle_dir) is not None
+    os.remove(fns[1])
+    assert Bundle.lookup_table('sum', fns, bundle_dir) is None
+
+def test_version(bundle):
+    '''
+    test_version(bundle)
+
+    A bundle built by another version is not used.
+    '''
+    bundle_dir, fns, _ = bundle
+    fn = os.path.join(bundle_dir, Bundle.INDEX_FILE)
+    with open(fn, encoding='utf-8') as stream:
+        index = json.load(stream)
+    index['version'] = Bundle.VERSION - 1
+    with open(fn, 'w', encoding='utf-8') as stream:
+        json.dump(index, stream)
+    touch(fn)
+    assert Bundle.load_index(bundle_dir) is None
+    assert Bundle.lookup('curve', fns[0], bundle_dir) is None
+    assert Bundle.load_index(str(os.path.dirname(fns[0]))) is None
@@ -0,0 +1,71 @@
+'''Flux conserving rebinning onto the detector pixels'''
+import numpy as np
+import pytest
+
+import ExpCalc
+import InstrumentRegistry
+import Pipeline
+import Resample
+import Sky
+import Telescope
+
+def test_rebin_conserves_flux():
+    '''
+    test_rebin_conserves_flux()
+
+    Densities keep their integral and counts their sum over the range
+    both grids cover, whatever the overlap of their bins.
+    '''
+    rng = np.random.default_rng(2)
+    edges_from = np.cumsum(rng.uniform(0.5, 1.5, 401))
+    edges_to = np.linspace(edges_from[3] + 0.3, edges_from[-5] - 0.2, 57)
+    values = rng.uniform(0., 10., 400)
+    density = Resample.rebin(edges_to, edges_from, values)
+    whole = Resample.rebin(edges_to[[0, -1]], edges_from, values)
+    assert np.sum(density * np.diff(edges_to)) == pytest.approx(whole[0] * np.ptp(edges_to),
+                                                                 rel=1e-12)
+    counts = Resample.rebin(edges_from[[0, -1]], edges_from, values, density=False)
+    assert counts[0] == pytest.approx(values.sum(), rel=1e-12)
+
+def test_detector_counts():
+    '''
+    test_detector_counts()
+
+    The source counts in the detector pixels in the band add up to
+    the source rate integrated over the same wavelengths, and the
+    sky of an unbinned pixel is scaled by the binning.
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = InstrumentRegistry.config('lris2_red')
+    waves, source, sky = Pipeline.detector_rates('starb1', 'sdss_rprime.dat', 22., 0.1, 1.0, 1.2,
+                                                 0.7, 8., inst, tel)
+    in_band = Pipeline.detector_in_band('starb1', 0.1, inst)
+    template_waves, _ = Pipeline.template_spectrum('starb1', 0.1)
+    rate = Pipeline.source_rate('starb1', 'sdss_rprime.dat', 22., 0.1, 1.0, 1.2, 0.7, 8., inst,
+                                tel, Pipeline.DEFAULT_OPTIONS)
+    edges = inst.pixel_edges()
+    band = edges[np.flatnonzero(in_band)[[0, -1]] + [0, 1]]
+    total = Resample.rebin(band, Resample.bin_edges(template_waves), rate) * np.ptp(band)
+    assert np.sum(source[in_band]) == pytest.approx(total[0], rel=1e-10)
+    np.testing.assert_allclose(np.diff(waves), inst.Ang_per_pix * inst.bind)
+
+    template_band = Pipeline.in_band('starb1', 0.1, inst)
+    template_sky = Pipeline.sky_rate('starb1', 0.1, 0.7, 8., inst, Sky.SKY_FILE,
+                                     Pipeline.DEFAULT_OPTIONS)
+    assert np.median(sky[in_band]) == pytest.approx(
+        inst.bind * np.median(template_sky[template_band]), rel=0.05)
+
+def test_detector_spectrum():
+    '''
+    test_detector_spectrum()
+
+    calculate() on the detector grid has one value per pixel in the band.
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = InstrumentRegistry.config('lris2_red')
+    request = ExpCalc.Request(22., 'sdss_rprime.dat', 1.0, 1.2, 0.1, 'starb1', inst, tel,
+                              1200., 8., 0.7, detector=True)
+    spectrum = ExpCalc.calculate(request)
+    assert len(spectrum.waves) == len(inst.pixel_edges()) - 1
+    assert len(spectrum.snr) == spectrum.in_band.sum() == len(spectrum.sky_flux)
+    assert np.all(spectrum.flux[spectrum.in_band] > 0)
@@ -0,0 +1,114 @@
+'''The exposure time solver against the forward SNR calculation'''
+import numpy as np
+import pytest
+
+import ExpCalc
+import ExpTime
+import InstrumentRegistry
+import Telescope
+
+MAGS = [22., 21., 24.]
+SEEINGS = [1.0, 0.8, 1.4]
+AIRMASSES = [1.2, 1.5, 1.1]
+REDSHIFTS = [0.1, 0.2, 0.]
+
+@pytest.fixture(name='setup', scope='module')
+def fixture_setup():
+    '''
+    fixture_setup()
+    '''
+    return InstrumentRegistry.config('lris2_red'), Telescope.Telescope('keck1')
+
+def batch_snr(times, inst, tel, optimal):
+    '''
+    batch_snr(times, inst, tel, optimal)
+
+    SNR spectra of the test targets, each with its own time.
+    '''
+    return ExpCalc.compute_snr_batch(MAGS, SEEINGS, AIRMASSES, REDSHIFTS, times,
+                                     'sdss_rprime.dat', 'starb1', 8., 0.7, inst, tel,
+                                     optimal=optimal)
+
+@pytest.mark.parametrize('optimal', [False, True])
+@pytest.mark.parametrize('wavelength', [6003.3, 7000., 9120.7])
+def test_wavelength_round_trip(setup, optimal, wavelength):
+    '''
+    test_wavelength_round_trip(setup, optimal, wavelength)
+
+    The SNR spectrum for the solved times, interpolated to the
+    wavelength, is the requested SNR.
+    '''
+    inst, tel = setup
+    times = ExpTime.time_for_snr(10., MAGS, SEEINGS, AIRMASSES, REDSHIFTS, 'sdss_rprime.dat',
+                                 'starb1', 8., 0.7, inst, tel, wavelength=wavelength,
+                                 optimal=optimal)
+    waves, snr = batch_snr(times, inst, tel, optimal)
+    for row_waves, row_snr in zip(waves, snr):
+        assert np.interp(wavelength, row_waves, row_snr) == pytest.approx(10., rel=1e-9)
+
+@pytest.mark.parametrize('optimal', [False, True])
+def test_spectrum_round_trip(setup, optimal):
+    '''
+    test_spectrum_round_trip(setup, optimal)
+
+    Solved at every wavelength, each time gives the SNR there.
+    '''
+    inst, tel = setup
+    rates = ExpCalc.compute_rate_spectra(MAGS, SEEINGS, AIRMASSES, REDSHIFTS, 'sdss_rprime.dat',
+                                         'starb1', 8., 0.7, inst, tel, optimal=optimal)
+    times = ExpTime.rates_time(25., rates, inst)
+    snr = rates.snr_at(times)
+    in_band = rates.in_band & np.isfinite(times)
+    assert in_band.sum() > 100
+    np.testing.assert_allclose(snr[in_band], 25., rtol=1e-9)
+    # four exposures each pay the read noise, so need more than a quarter
+    each = rates.time_for_snr(25., nexp=4)
+    np.testing.assert_allclose(rates.snr_at(each, nexp=4)[in_band], 25., rtol=1e-9)
+    assert np.all(each[in_band] > times[in_band] / 4)
+
+def test_band_per_resolution(setup):
+    '''
+    test_band_per_resolution(setup)
+
+    Per resolution element the band average reaches the SNR sooner
+    than per pixel, and its rates give back the SNR.
+    '''
+    inst, tel = setup
+    args = (MAGS, SEEINGS, AIRMASSES, REDSHIFTS, 'sdss_rprime.dat', 'starb1', 8., 0.7, inst, tel)
+    pixel = ExpTime.time_for_snr(5., *args, band=(7000., 8000.))
+    element = ExpTime.time_for_snr(5., *args, band=(7000., 8000.), per_resolution=True)
+    assert np.all(element < pixel)
+
+    rates = ExpCalc.compute_rate_spectra(*args).combine(ExpTime.resolution_npix(0.7, inst))
+    in_band = rates.in_band & (rates.waves >= 7000.) & (rates.waves <= 8000.)
+    source = np.sum(np.where(in_band, rates.source, 0.), axis=1) / in_band.sum(axis=1)
+    sky = np.sum(np.where(in_band, rates.sky, 0.), axis=1) / in_band.sum(axis=1)
+    np.testing.assert_allclose(rates.with_rates(None, source, sky).snr_at(element), 5.,
+                               rtol=1e-9)
+
+@pytest.mark.parametrize('detector', [False, True])
+@pytest.mark.parametrize('optimal', [False, True])
+def test_request_round_trip(setup, detector, optimal):
+    '''
+    test_request_round_trip(setup, detector, optimal)
+
+    calculate() with the time solved for a Request, on the detector
+    grid or with the optimal extraction, gives the requested SNR.
+    '''
+    inst, tel = setup
+    request = ExpCalc.Request(22., 'sdss_rprime.dat', 1.0, 1.2, 0.1, 'starb1', inst, tel,
+                              None, 8., 0.7, optimal=optimal, detector=detector)
+    time = ExpTime.time_for_request(10., request, wavelength=7000.)
+    spectrum = ExpCalc.calculate(request._replace(time=time))
+    snr = np.interp(7000., spectrum.waves[spectrum.in_band], spectrum.snr)
+    assert snr == pytest.approx(10., rel=1e-9)
+
+def test_solve_time():
+    '''
+    test_solve_time()
+    '''
+    time = ExpTime.solve_time(10., np.array([0., 2., 50.]), 30., 8, 0.001, 4.)
+    assert np.isinf(time[0])
+    snr = np.array([2., 50.]) * time[1:] / np.sqrt(
+        np.array([32., 80.]) * time[1:] + 8*0.001*time[1:] + 8*16.)
+    np.testing.assert_allclose(snr, 10., rtol=1e-12)
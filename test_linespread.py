@@ -0,0 +1,26 @@
+'''The line spread function is applied to the source as observed'''
+import numpy as np
+
+import LineSpread
+import Pipeline
+
+def test_telluric_convolved(tmp_path):
+    '''
+    test_telluric_convolved(tmp_path)
+
+    A narrow telluric line is convolved to the instrument resolution
+    together with the template.
+    '''
+    fn = tmp_path / 'telluric.dat'
+    waves = np.arange(5000., 10000., 0.5)
+    trans = np.where(np.abs(waves - 7600.) < 2., 0.05, 1.0)
+    np.savetxt(fn, np.column_stack([waves, trans]))
+
+    template_waves, _ = Pipeline.template_spectrum('starb1', 0.)
+    fwhm = 12.
+    raw = Pipeline.observed_photons('starb1', 0., 1.2, str(fn))
+    smooth = Pipeline.observed_photons('starb1', 0., 1.2, str(fn), fwhm)
+    np.testing.assert_allclose(smooth, LineSpread.convolve(template_waves, raw, fwhm))
+    line = np.argmin(np.abs(template_waves - 7600.))
+    # the line is no deeper than the kernel allows after the convolution
+    assert smooth[line] > 2*raw[line]
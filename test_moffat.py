@@ -0,0 +1,40 @@
+'''The vectorized Moffat slit fractions'''
+import numpy as np
+
+import Moffat
+
+def brute_force_frac(size, width, height, beta, pix_size):
+    '''
+    brute_force_frac(size, width, height, beta, pix_size)
+
+    moffat_frac of one profile summed over the full 2-D sample grid.
+    '''
+    xs, ys, sc_size = Moffat.prep_values(size, height, pix_size)
+    gamma = Moffat.moffat_gamma(sc_size, beta)
+    prof = Moffat.moffat_2d(xs, ys, gamma, beta, Moffat.moffat_amp(gamma, beta))
+    return np.sum(prof * Moffat.box_2d(xs, ys, width / pix_size, height / pix_size))
+
+def test_moffat_frac_batch():
+    '''
+    test_moffat_frac_batch()
+
+    One call over many seeings, widths and betas gives the sum over
+    the 2-D grid of each.
+    '''
+    rng = np.random.default_rng(1)
+    sizes = rng.uniform(0.4, 2.5, 40)
+    widths = rng.uniform(0.5, 1.5, 40)
+    betas = rng.choice([2.5, 3., 4.], 40)
+    for height, pix_size in [(8., 0.151), (5., 0.135)]:
+        frac = Moffat.moffat_frac(sizes, widths, height, beta=betas, pix_size=pix_size)
+        expect = [brute_force_frac(size, width, height, beta, pix_size)
+                  for size, width, beta in zip(sizes, widths, betas)]
+        np.testing.assert_allclose(frac, expect, rtol=1e-12)
+
+def test_moffat_frac_scalar():
+    '''
+    test_moffat_frac_scalar()
+    '''
+    frac = Moffat.moffat_frac(1.0, 0.7, 8., pix_size=0.15)
+    assert isinstance(frac, float)
+    assert abs(frac - brute_force_frac(1.0, 0.7, 8., 3, 0.15)) < 1e-12
@@ -0,0 +1,82 @@
+'''Stitching the LRIS-2 arms'''
+import numpy as np
+import pytest
+
+import ExpCalc
+import MultiArm
+import Telescope
+
+@pytest.fixture(name='telescope', scope='module')
+def fixture_telescope():
+    '''
+    fixture_telescope()
+    '''
+    return Telescope.Telescope('keck1')
+
+def make_multiarm(telescope):
+    '''
+    make_multiarm(telescope)
+    '''
+    return MultiArm.MultiArm(22., 'sdss_rprime.dat', 1.0, 1.2, 0.1, 'starb1',
+                             MultiArm.lris2(telescope), telescope)
+
+def test_overlap_in_quadrature(telescope):
+    '''
+    test_overlap_in_quadrature(telescope)
+
+    Where both arms see a wavelength the SNR is the quadrature sum
+    and the counts the sum of those of each arm run on its own,
+    elsewhere it is that of the one arm.
+    '''
+    multi = make_multiarm(telescope)
+    multi.compute_spectrum(1200., 8., 0.7)
+    single = {}
+    for name, inst in multi.arms.items():
+        calc = ExpCalc.ExpCalc(22., 'sdss_rprime.dat', 1.0, 1.2, 0.1, 'starb1', inst, telescope)
+        calc.compute_spectrum(1200., 8., 0.7)
+        single[name] = (calc.waves[calc.in_band], calc.snr, calc.flux[calc.in_band])
+
+    blue_waves, blue_snr, blue_flux = single['blue']
+    red_waves, red_snr, red_flux = single['red']
+    overlap = np.intersect1d(blue_waves, red_waves)
+    assert len(overlap) > 10
+    assert multi.arms['red'].BLUE_CUTOFF < multi.crossovers[0] < multi.arms['blue'].RED_CUTOFF
+
+    both = np.isin(multi.waves, overlap)
+    in_blue = np.isin(blue_waves, overlap)
+    in_red = np.isin(red_waves, overlap)
+    np.testing.assert_allclose(multi.snr[both],
+                               np.hypot(blue_snr[in_blue], red_snr[in_red]), rtol=1e-12)
+    np.testing.assert_allclose(multi.flux[both], blue_flux[in_blue] + red_flux[in_red],
+                               rtol=1e-12)
+    assert np.all(multi.snr[both] >= np.maximum(blue_snr[in_blue], red_snr[in_red]))
+    better = np.where(blue_snr[in_blue] >= red_snr[in_red], 'blue', 'red')
+    np.testing.assert_array_equal(multi.arm[both], better)
+
+    only_blue = np.isin(multi.waves, blue_waves[~in_blue])
+    np.testing.assert_array_equal(multi.snr[only_blue], blue_snr[~in_blue])
+    assert np.all(multi.arm[only_blue] == 'blue')
+    assert len(multi.waves) == len(blue_waves) + len(red_waves) - len(overlap)
+
+def test_detector_cut(telescope):
+    '''
+    test_detector_cut(telescope)
+
+    On the detector pixels each arm is used on its side of the
+    crossover, with no wavelength given twice.
+    '''
+    multi = make_multiarm(telescope)
+    multi.configure(detector=True)
+    multi.compute_spectrum(1200., 8., 0.7)
+    assert np.all(np.diff(multi.waves) > 0)
+    assert np.all(multi.waves[multi.arm == 'blue'] < multi.crossovers[0])
+    assert np.all(multi.waves[multi.arm == 'red'] >= multi.crossovers[0])
+    assert len(multi.snr) == len(multi.waves) == len(multi.flux)
+
+def test_configure(telescope):
+    '''
+    test_configure(telescope)
+    '''
+    multi = make_multiarm(telescope)
+    with pytest.raises(ValueError):
+        multi.configure(no_such_option=True)
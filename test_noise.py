@@ -0,0 +1,45 @@
+'''The optimal extraction against a sum over the same pixels'''
+import numpy as np
+import pytest
+
+import ExpCalc
+import InstrumentRegistry
+import Pipeline
+import Telescope
+
+@pytest.mark.parametrize('app_mag', [18., 24.])
+@pytest.mark.parametrize('time', [60., 1200.])
+@pytest.mark.parametrize('seeing', [0.6, 1.5])
+def test_optimal_not_worse(app_mag, time, seeing):
+    '''
+    test_optimal_not_worse(app_mag, time, seeing)
+
+    Horne extraction is never worse than the boxcar sum over the
+    spatial pixels of its profile, from the sky dominated to the
+    read noise dominated regime.
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = InstrumentRegistry.config('lris2_red')
+    request = ExpCalc.Request(app_mag, 'sdss_rprime.dat', seeing, 1.2, 0., 'starb1', inst, tel,
+                              time, 8., 0.7, optimal=True)
+    profile = ExpCalc.spatial_profile(request)
+    assert len(profile) == pytest.approx(8. / inst.scale_perp, abs=1)
+    spectrum = ExpCalc.calculate(request)
+    source = spectrum.flux[spectrum.in_band] / time
+    sky = spectrum.sky_flux / time
+    boxcar = Pipeline.boxcar_variance(source, sky, time, len(profile), inst.dark,
+                                      inst.readnoise**2)
+    assert np.all(spectrum.snr >= source*time / np.sqrt(boxcar) * (1 - 1e-12))
+
+def test_optimal_equals_boxcar_for_flat_profile():
+    '''
+    test_optimal_equals_boxcar_for_flat_profile()
+
+    With a flat profile and no source the weights are all equal, so
+    the two variances agree.
+    '''
+    sky = np.array([1., 10., 100.])
+    profile = np.full(20, 1 / 20)
+    optimal = Pipeline.optimal_variance(np.zeros(3), sky, 300., profile, 0.001, 16.)
+    boxcar = Pipeline.boxcar_variance(np.zeros(3), sky, 300., 20, 0.001, 16.)
+    np.testing.assert_allclose(optimal, boxcar, rtol=1e-12)
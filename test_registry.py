@@ -0,0 +1,82 @@
+'''The frozen instrument configurations of the registry'''
+import pickle
+
+import numpy as np
+import pytest
+
+import Instrument
+import InstrumentRegistry
+import Telescope
+
+# the settings compared with those of an Instrument
+SETTINGS = ('dark', 'readnoise', 'bind', 'scale_para', 'scale_perp', 'R', 'pixel_size',
+            'Ang_per_pix', 'BLUE_CUTOFF', 'RED_CUTOFF')
+
+@pytest.mark.parametrize('mode', ['lris2_blue', 'lris2_red'])
+def test_same_as_instrument(mode):
+    '''
+    test_same_as_instrument(mode)
+
+    A configuration has the settings, throughput and cache keys of
+    the Instrument it replaces.
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = Instrument.Instrument()
+    getattr(inst, mode)(tel)
+    inst.read_throughput()
+    conf = InstrumentRegistry.config(mode, telescope=tel)
+    assert conf is InstrumentRegistry.config(mode)
+    for slot in SETTINGS:
+        assert getattr(conf, slot) == pytest.approx(getattr(inst, slot)), slot
+    assert conf.config_key() == inst.config_key()
+    np.testing.assert_array_equal(conf.pixel_edges(), inst.pixel_edges())
+    for column in ('wavelength', 'throughput'):
+        np.testing.assert_array_equal(conf.throughput[column], inst.throughput[column])
+
+def test_frozen():
+    '''
+    test_frozen()
+    '''
+    conf = InstrumentRegistry.config('lris2_red')
+    with pytest.raises(AttributeError):
+        conf.bind = 2
+    with pytest.raises(AttributeError):
+        del conf.dark
+    with pytest.raises(TypeError):
+        conf.throughput['throughput'] = None
+    assert not conf.throughput['throughput'].flags.writeable
+    assert not conf.pixel_throughput.flags.writeable
+
+def test_replace_and_pickle():
+    '''
+    test_replace_and_pickle()
+
+    replace() derives the pixels again, a pickled configuration
+    comes back with the same settings and keys.
+    '''
+    conf = InstrumentRegistry.config('lris2_red')
+    binned = conf.replace(bind=2)
+    assert conf.bind == 1 and binned.bind == 2
+    np.testing.assert_allclose(np.diff(binned.pixel_edges()), 2 * conf.Ang_per_pix)
+    assert len(binned.pixel_throughput) == len(binned.pixel_edges()) - 1
+    assert binned.config_key() != conf.config_key()
+
+    copy = pickle.loads(pickle.dumps(conf))
+    assert copy.config_key() == conf.config_key()
+    np.testing.assert_array_equal(copy.throughput['throughput'], conf.throughput['throughput'])
+    with pytest.raises(AttributeError):
+        copy.bind = 2
+
+def test_errors():
+    '''
+    test_errors()
+    '''
+    with pytest.raises(ValueError):
+        InstrumentRegistry.config('nirspec')
+    with pytest.raises(ValueError):
+        InstrumentRegistry.config('lris2_red', 'R9999')
+    with pytest.raises(ValueError):
+        InstrumentRegistry.InstrumentConfig(colour='red')
+    conf = InstrumentRegistry.config('lris2_red')
+    with pytest.raises(ValueError):
+        conf.replace(throughput_dir='/nonexistent').read_throughput()
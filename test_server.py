@@ -0,0 +1,115 @@
+'''The JSON API of etc_server'''
+import http.server
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import etc_server
+
+@pytest.fixture(name='server', scope='module')
+def fixture_server():
+    '''
+    fixture_server()
+
+    A server on a free port, yields its service and base URL.
+    '''
+    service = etc_server.ETCService(workers=2)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), etc_server.make_handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield service, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+def call(url, body=None):
+    '''
+    call(url, body=None)
+
+    Returns the status and the decoded JSON, body is sent as is when
+    it is bytes and as JSON otherwise.
+    '''
+    data = None
+    if body is not None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as err:
+        return err.code, json.loads(err.read())
+
+def test_get(server):
+    '''
+    test_get(server)
+    '''
+    _, url = server
+    status, body = call(url + '/health')
+    assert status == 200 and body['status'] == 'ok'
+    status, body = call(url + '/instruments')
+    assert status == 200 and 'lris2_red' in body['instruments']
+    assert call(url + '/nothing')[0] == 404
+
+def test_snr(server):
+    '''
+    test_snr(server)
+
+    One request or a list of them, NaN out of band becomes null.
+    '''
+    _, url = server
+    status, body = call(url + '/snr', {'instrument': 'lris2_red', 'mag': [21., 23.]})
+    assert status == 200
+    assert len(body['snr']) == 2 and len(body['snr'][0]) == len(body['waves'][0])
+    assert body['snr'][0][0] is None
+    status, body = call(url + '/snr', [{'instrument': 'lris2_red'}, {'instrument': 'lris2_blue'}])
+    assert status == 200 and len(body) == 2
+
+def test_exptime(server):
+    '''
+    test_exptime(server)
+    '''
+    _, url = server
+    status, body = call(url + '/exptime', {'instrument': 'lris2_red', 'snr': 10.,
+                                           'wavelength': 7000., 'optimal': True})
+    assert status == 200 and body['time'][0] > 0
+    status, body = call(url + '/exptime', {'instrument': 'lris2_red', 'snr': 10.,
+                                           'wavelength': 7000., 'detector': True})
+    assert status == 200 and body['time'] > 0
+
+@pytest.mark.parametrize('path, body', [
+    ('/snr', {'mag': 22.}), # no instrument
+    ('/snr', b'{"instrument": '), # not JSON
+    ('/snr', {'instrument': 'nirspec'}),
+    ('/snr', {'instrument': 'lris2_red', 'template': 'no_such_template'}),
+    ('/exptime', {'instrument': 'lris2_red'}), # no snr
+    ('/exptime', {'instrument': 'lris2_red', 'snr': 10., 'wavelength': 7000.,
+                  'band': [6000., 8000.]}),
+])
+def test_bad_request(server, path, body):
+    '''
+    test_bad_request(server, path, body)
+
+    Bad parameters are answered with 400 and the reason.
+    '''
+    _, url = server
+    status, answer = call(url + path, body)
+    assert status == 400
+    assert answer['error']
+
+def test_internal_error(server, monkeypatch):
+    '''
+    test_internal_error(server, monkeypatch)
+
+    Any other failure is a 500 and the server keeps answering.
+    '''
+    service, url = server
+    def fail(_):
+        raise RuntimeError('broken')
+    monkeypatch.setattr(service, 'snr', fail)
+    status, answer = call(url + '/snr', {'instrument': 'lris2_red'})
+    assert status == 500
+    assert answer['error'] == 'RuntimeError: broken'
+    monkeypatch.undo()
+    assert call(url + '/snr', {'instrument': 'lris2_red'})[0] == 200
@@ -0,0 +1,81 @@
+'''The sky model for moon, twilight and airmass'''
+import numpy as np
+import pytest
+
+import DataCache
+import ExpCalc
+import InstrumentRegistry
+import Mag
+import Photometry
+import Sky
+import SkyModel
+import Telescope
+
+@pytest.fixture(name='model', scope='module')
+def fixture_model():
+    '''
+    fixture_model()
+    '''
+    return SkyModel.model()
+
+def test_dark_zenith(model):
+    '''
+    test_dark_zenith(model)
+
+    At the zenith without moon or twilight the model is the dark sky
+    spectrum, and every basis spectrum has its V band brightness.
+    '''
+    _, _, dark = DataCache.read_sky(Sky.SKY_FILE)
+    np.testing.assert_allclose(model.spectra(1.0)[0], dark, rtol=1e-12)
+    weights = Photometry.filter_weights(model.wave, Mag.Mag(SkyModel.V_FILTER))
+    np.testing.assert_allclose(weights @ model.basis.T, weights @ dark, rtol=1e-12)
+
+def test_moon(model):
+    '''
+    test_moon(model)
+
+    The moonlit sky is brighter for a fuller moon and closer to it,
+    bluer than the dark sky, and dark again once the moon sets.
+    '''
+    illumination = np.array([0.25, 0.5, 1.0])
+    coeffs = model.coefficients(1.2, illumination, 40., 50.)
+    assert np.all(np.diff(coeffs[:, 1:], axis=0) > 0)
+    assert np.all(coeffs[:, 0] == coeffs[0, 0])
+    near, far = model.coefficients(1.2, 1.0, [20., 100.], 50.)
+    assert np.all(near[1:] > far[1:])
+    set_moon = model.coefficients(1.2, 1.0, 40., [-1., -30.])
+    np.testing.assert_array_equal(set_moon, model.coefficients(1.2)[[0, 0]])
+
+    dark, moonlit = model.spectra(1.2, [0., 1.], 40., 50.)
+    blue = model.wave < 4500
+    red = model.wave > 8000
+    assert (np.mean(moonlit[blue]) / np.mean(dark[blue]) >
+            np.mean(moonlit[red]) / np.mean(dark[red]) > 1)
+
+def test_twilight_and_airmass(model):
+    '''
+    test_twilight_and_airmass(model)
+    '''
+    coeffs = model.coefficients(1.0, sun_altitude=[SkyModel.TWILIGHT_ALT, -15., -20.])
+    assert coeffs[0, 1] == pytest.approx(10**(-0.4*(SkyModel.TWILIGHT_V_MAG -
+                                                    SkyModel.DARK_V_MAG)))
+    assert coeffs[0, 1] > coeffs[1, 1] > coeffs[2, 1] == 0
+    dark = model.coefficients([1.0, 1.5, 2.0])[:, 0]
+    assert np.all(np.diff(dark) > 0)
+    assert model.coefficients(np.ones(4), 0.5, 60., 30.).shape == (4, 3)
+
+def test_batch_sky(model):
+    '''
+    test_batch_sky(model)
+
+    The model spectra replace the sky of the batch calculation, the
+    dark zenith sky gives the same SNR as the sky file.
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = InstrumentRegistry.config('lris2_blue')
+    args = ([22., 22.], 1.0, 1.2, 0., 1200., 'sdss_rprime.dat', 'starb1', 8., 0.7, inst, tel)
+    _, snr = ExpCalc.compute_snr_batch(*args)
+    _, dark = ExpCalc.compute_snr_batch(*args, sky_spectra=model.spectra(1.0))
+    np.testing.assert_allclose(dark, snr, rtol=1e-12)
+    _, moon = ExpCalc.compute_snr_batch(*args, sky_spectra=model.spectra(1.2, [0., 1.], 30., 60.))
+    assert np.nanmedian(moon[1]) < np.nanmedian(moon[0])
@@ -0,0 +1,69 @@
+'''The slit loss table against the exact Moffat calculation'''
+import numpy as np
+import pytest
+
+import SlitLoss
+
+SEEING = np.array([0.6, 0.8, 1.0, 1.2])
+WIDTH = np.array([0.5, 0.7, 0.9, 1.1])
+LENGTH = np.array([6., 8.])
+BETA = np.array([3., 4.])
+PIX_SIZE = np.array([0.134453, 0.151])
+
+@pytest.fixture(name='table', scope='module')
+def fixture_table(tmp_path_factory):
+    '''
+    fixture_table(tmp_path_factory)
+
+    A small table built for the tests.
+    '''
+    fn = str(tmp_path_factory.mktemp('slitloss') / 'table.npz')
+    SlitLoss.build_table(fn, seeing=SEEING, width=WIDTH, length=LENGTH, beta=BETA,
+                         pix_size=PIX_SIZE)
+    return fn
+
+def test_nodes_exact(table):
+    '''
+    test_nodes_exact(table)
+
+    On the grid the table is the exact calculation.
+    '''
+    mesh = np.meshgrid(SEEING, WIDTH, LENGTH, BETA, PIX_SIZE, indexing='ij')
+    frac = SlitLoss.slit_frac(mesh[0], mesh[1], mesh[2], beta=mesh[3], pix_size=mesh[4],
+                              fn=table)
+    exact = SlitLoss.exact_frac(mesh[0], mesh[1], mesh[2], beta=mesh[3], pix_size=mesh[4])
+    np.testing.assert_allclose(frac, exact, rtol=1e-12)
+
+@pytest.mark.parametrize('pix_size', PIX_SIZE)
+def test_between_nodes(table, pix_size):
+    '''
+    test_between_nodes(table, pix_size)
+
+    The exact fraction steps as the slit edges cross pixels, the
+    table interpolates linearly across a cell. Along the width, where
+    the exact fraction grows, the two differ by no more than the
+    exact fraction changes across the cell.
+    '''
+    widths = np.linspace(WIDTH[0], WIDTH[-1], 61)
+    frac = SlitLoss.slit_frac(1.0, widths, 8., pix_size=pix_size, fn=table)
+    exact = SlitLoss.exact_frac(1.0, widths, 8., pix_size=pix_size)
+    nodes = SlitLoss.exact_frac(1.0, WIDTH, 8., pix_size=pix_size)
+    cell = np.clip(np.searchsorted(WIDTH, widths, side='right') - 1, 0, len(WIDTH) - 2)
+    step = nodes[cell + 1] - nodes[cell]
+    assert np.all(np.diff(nodes) >= 0)
+    assert np.all(np.abs(frac - exact) <= step + 1e-12)
+
+def test_exact_fallback(table):
+    '''
+    test_exact_fallback(table)
+
+    Pixel scales the table was not built for, and values outside of
+    it, use the exact calculation.
+    '''
+    frac = SlitLoss.slit_frac(1.0, 0.7, 8., pix_size=0.14, fn=table)
+    assert frac == SlitLoss.exact_frac(1.0, 0.7, 8., pix_size=0.14)
+    frac = SlitLoss.slit_frac(np.array([1.0, 2.0]), 0.7, 8., pix_size=0.151, fn=table)
+    assert frac[1] == SlitLoss.exact_frac(2.0, 0.7, 8., pix_size=0.151)
+    assert frac[0] == pytest.approx(SlitLoss.exact_frac(1.0, 0.7, 8., pix_size=0.151),
+                                    rel=1e-12)
+    assert np.isnan(SlitLoss.load_table(table)(1.0, 0.7, 8., pix_size=0.14))
@@ -0,0 +1,137 @@
+'''Checkpointing and resuming of the grid sweep'''
+import concurrent.futures
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+import DataCache
+import SlitLoss
+import Sweep
+
+SPEC = {'arms': ['lris2_red'], 'mag': [20., 22., 24.], 'redshift': [0., 0.5],
+        'snr_waves': [7000.], 'shard_size': 4}
+
+def mark_shard(checkpoint_dir, shard):
+    '''
+    mark_shard(checkpoint_dir, shard)
+
+    Overwrites the saved snr_median of shard, so a resumed run that
+    reuses it can be told apart from one that computes it again.
+    '''
+    columns = Sweep.load_shard(checkpoint_dir, shard)
+    columns['snr_median'] = np.full(len(columns['snr_median']), -1.)
+    Sweep.save_shard(checkpoint_dir, shard, columns)
+
+@pytest.fixture(name='swept')
+def fixture_swept(tmp_path):
+    '''
+    fixture_swept(tmp_path)
+
+    A checkpoint directory with every shard of SPEC saved.
+    '''
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    columns = Sweep.run_sweep(SPEC, checkpoint_dir=checkpoint_dir, workers=1)
+    return checkpoint_dir, columns
+
+def test_columns(swept):
+    '''
+    test_columns(swept)
+
+    One row per grid point, the SNR at a wavelength is between the
+    extremes of the spectrum.
+    '''
+    _, columns = swept
+    assert len(columns['mag']) == 6
+    assert set(columns['arm']) == {'lris2_red'}
+    assert np.all(columns['snr_7000'] <= columns['snr_max'])
+    assert np.all(np.diff(columns['snr_median'][columns['redshift'] == 0.]) < 0)
+
+def test_resume_reuses_shards(swept, monkeypatch):
+    '''
+    test_resume_reuses_shards(swept, monkeypatch)
+
+    With every shard saved nothing is computed, a missing shard is
+    computed again and the others are read back.
+    '''
+    checkpoint_dir, columns = swept
+    shards = Sweep.make_shards(Sweep.make_spec(**SPEC))
+    assert len(shards) == 2
+    for shard in shards:
+        mark_shard(checkpoint_dir, shard)
+    with monkeypatch.context() as patch:
+        patch.setattr(Sweep, 'warm', lambda spec: pytest.fail('computed a saved shard'))
+        resumed = Sweep.run_sweep(SPEC, checkpoint_dir=checkpoint_dir, workers=1)
+    assert np.all(resumed['snr_median'] == -1.)
+
+    os.remove(Sweep.shard_file(checkpoint_dir, shards[0]))
+    resumed = Sweep.run_sweep(SPEC, checkpoint_dir=checkpoint_dir, workers=1)
+    first = len(shards[0]['params'])
+    np.testing.assert_array_equal(resumed['snr_median'][:first], columns['snr_median'][:first])
+    assert np.all(resumed['snr_median'][first:] == -1.)
+
+def test_no_resume(swept):
+    '''
+    test_no_resume(swept)
+    '''
+    checkpoint_dir, columns = swept
+    for shard in Sweep.make_shards(Sweep.make_spec(**SPEC)):
+        mark_shard(checkpoint_dir, shard)
+    again = Sweep.run_sweep(SPEC, checkpoint_dir=checkpoint_dir, workers=1, resume=False)
+    np.testing.assert_array_equal(again['snr_median'], columns['snr_median'])
+
+def test_changed_spec(swept):
+    '''
+    test_changed_spec(swept)
+
+    The shards of a different spec are removed rather than merged,
+    even where their names are the same.
+    '''
+    checkpoint_dir, _ = swept
+    spec = dict(SPEC, time=600.)
+    assert not Sweep.check_checkpoint(checkpoint_dir, Sweep.make_spec(**spec))
+    assert not [name for name in os.listdir(checkpoint_dir) if name.startswith('shard_')]
+    columns = Sweep.run_sweep(spec, checkpoint_dir=checkpoint_dir, workers=1)
+    assert np.all(columns['time'] == 600.)
+    assert Sweep.check_checkpoint(checkpoint_dir, Sweep.make_spec(**spec))
+
+def shard_misses(spec):
+    '''
+    shard_misses(spec)
+
+    Computes the first shard of spec in a worker, returns the cache
+    misses it took and whether the slit loss table is writeable.
+    '''
+    Sweep.compute_shard(spec, Sweep.make_shards(spec)[0])
+    return DataCache.cache().misses, SlitLoss.load_table().frac.flags.writeable
+
+def test_shared_cache():
+    '''
+    test_shared_cache()
+
+    A freshly started worker finds everything in the shared cache,
+    the arrays it gets are read-only views of the shared memory.
+    '''
+    spec = Sweep.make_spec(**SPEC)
+    Sweep.warm(spec)
+    blocks, manifest = Sweep.share_cache()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                initializer=Sweep.init_worker, initargs=(manifest,)) as pool:
+            misses, writeable = pool.submit(shard_misses, spec).result()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    assert blocks
+    assert misses == 0
+    assert not writeable
+
+def test_unknown_parameter():
+    '''
+    test_unknown_parameter()
+    '''
+    with pytest.raises(ValueError):
+        Sweep.make_spec(magnitude=[20.])
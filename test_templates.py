@@ -0,0 +1,59 @@
+'''Every template runs through the calculation'''
+import numpy as np
+import pytest
+
+import DataCache
+import ExpCalc
+import InstrumentRegistry
+import Telescope
+import Templates
+
+TEMPLATES = [Templates.template_name(fn) for fn in DataCache.list_dir(Templates.TEMPLATE_DIR)]
+
+@pytest.mark.parametrize('template', TEMPLATES)
+def test_calculate(template):
+    '''
+    test_calculate(template)
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = InstrumentRegistry.config('lris2_red')
+    spectrum = ExpCalc.calculate(ExpCalc.Request(22., 'sdss_rprime.dat', 1.0, 1.2, 0.,
+                                                 template, inst, tel, 1200., 8., 0.7))
+    assert spectrum.waves.ndim == 1
+    assert spectrum.snr.shape == (spectrum.in_band.sum(),)
+    assert np.all(np.isfinite(spectrum.snr))
+
+@pytest.mark.parametrize('template', TEMPLATES)
+def test_snr_batch(template):
+    '''
+    test_snr_batch(template)
+
+    The batch path gives the SNR of calculate() for each target.
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = InstrumentRegistry.config('lris2_red')
+    mags = np.array([20., 22.])
+    waves, snr = ExpCalc.compute_snr_batch(mags, 1.0, 1.2, 0., 1200., 'sdss_rprime.dat',
+                                           template, 8., 0.7, inst, tel)
+    assert waves.shape == snr.shape == (len(mags), waves.shape[1])
+    for row, mag in enumerate(mags):
+        spectrum = ExpCalc.calculate(ExpCalc.Request(mag, 'sdss_rprime.dat', 1.0, 1.2, 0.,
+                                                     template, inst, tel, 1200., 8., 0.7))
+        np.testing.assert_allclose(snr[row][spectrum.in_band], spectrum.snr, rtol=1e-10)
+
+@pytest.mark.parametrize('template', TEMPLATES)
+def test_detector(template):
+    '''
+    test_detector(template)
+
+    The detector pixels at the ends of the band are covered by the
+    template, so they have sky counts and a finite SNR.
+    '''
+    tel = Telescope.Telescope('keck1')
+    inst = InstrumentRegistry.config('lris2_red')
+    spectrum = ExpCalc.calculate(ExpCalc.Request(22., 'sdss_rprime.dat', 1.0, 1.2, 0.,
+                                                 template, inst, tel, 1200., 8., 0.7,
+                                                 detector=True))
+    assert spectrum.snr.shape == spectrum.sky_flux.shape == spectrum.throughput.shape
+    assert spectrum.sky_flux[0] > 0 and spectrum.sky_flux[-1] > 0
+    assert np.all(np.isfinite(spectrum.snr))